@@ -0,0 +1,188 @@
+# agenda.py
+#
+# Audiencias, plazos y gestiones de las causas (modelo Gestion): consultas por
+# rango de fechas, recordatorios del dashboard y el calendario ICS que
+# consultan los teléfonos. El ICS se guarda en el cache compartido y solo se
+# vuelve a generar cuando cambian las gestiones (grupo "gestiones").
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import joinedload
+
+from database import db
+from models import Causa, Gestion
+
+TIPOS = {"audiencia": "Audiencia", "plazo": "Plazo", "gestion": "Gestión", "reunion": "Reunión"}
+
+# Ventana del calendario: lo reciente y el próximo año
+ICS_DIAS_ATRAS = 30
+ICS_DIAS_ADELANTE = 365
+
+def en_rango(desde, hasta, responsable=None, cliente_id=None, causa_id=None, pendientes=False, tipo=None):
+    """Gestiones con fecha en [desde, hasta), en orden. Cada filtro usa su propio índice (campo, fecha)."""
+    query = Gestion.query.filter(Gestion.fecha >= desde, Gestion.fecha < hasta)
+    if responsable:
+        query = query.filter(Gestion.responsable == responsable)
+    if cliente_id:
+        query = query.filter(Gestion.cliente_id == cliente_id)
+    if causa_id:
+        query = query.filter(Gestion.causa_id == causa_id)
+    if pendientes:
+        query = query.filter(Gestion.realizada.is_(False))
+    if tipo:
+        query = query.filter(Gestion.tipo == tipo)
+    return query.order_by(Gestion.fecha, Gestion.hora, Gestion.id)
+
+def proximas(hoy, dias=30, **filtros):
+    """Gestiones pendientes de los próximos ``dias`` días, con su causa."""
+    return en_rango(hoy, hoy + timedelta(days=dias), pendientes=True, **filtros).options(
+        joinedload(Gestion.causa)
+    )
+
+def etiqueta_plazo(fecha, hoy):
+    dias = (fecha - hoy).days
+    if dias == 0:
+        return "Hoy"
+    if dias == 1:
+        return "Mañana"
+    if dias < 7:
+        return f"{dias} días"
+    return f"{dias // 7} sem"
+
+def recordatorios(hoy, limite=5):
+    """Próximas gestiones pendientes en el formato del dashboard: {"texto", "tag"}."""
+    return [
+        {"texto": f"{TIPOS.get(g.tipo, g.tipo)}: {g.titulo}", "tag": etiqueta_plazo(g.fecha, hoy)}
+        for g in en_rango(hoy, hoy + timedelta(days=ICS_DIAS_ADELANTE), pendientes=True).limit(limite)
+    ]
+
+def actualizar_causa(gestion):
+    """Mantiene ultima_gestion de la causa con la gestión realizada más reciente."""
+    causa = gestion.causa or db.session.get(Causa, gestion.causa_id)
+    if gestion.realizada and (causa.fecha_ultima_gestion is None or gestion.fecha >= causa.fecha_ultima_gestion):
+        causa.ultima_gestion = gestion.titulo[:250]
+        causa.fecha_ultima_gestion = gestion.fecha
+
+def eliminar(gestion):
+    """Borra la gestión; si era la ultima_gestion de su causa, la recalcula con las realizadas que quedan."""
+    causa = gestion.causa or db.session.get(Causa, gestion.causa_id)
+    era_ultima = (
+        causa.fecha_ultima_gestion is not None
+        and causa.fecha_ultima_gestion == gestion.fecha
+        and (causa.ultima_gestion or "") == gestion.titulo[:250]
+    )
+    db.session.delete(gestion)
+    db.session.flush()
+    if not era_ultima:
+        return
+    anterior = Gestion.query.filter(
+        Gestion.causa_id == causa.id, Gestion.realizada.is_(True)
+    ).order_by(Gestion.fecha.desc(), Gestion.id.desc()).first()
+    causa.ultima_gestion = anterior.titulo[:250] if anterior else None
+    causa.fecha_ultima_gestion = anterior.fecha if anterior else None
+
+_DESDE_CAUSAS = """
+    INSERT INTO gestiones (causa_id, cliente_id, tipo, titulo, fecha, realizada, modificada)
+    SELECT id, cliente_id,
+           CASE WHEN fecha_ultima_gestion >= :hoy THEN 'audiencia' ELSE 'gestion' END,
+           COALESCE(ultima_gestion, 'Última gestión'), fecha_ultima_gestion,
+           fecha_ultima_gestion < :hoy, :ahora
+    FROM causas c
+    WHERE fecha_ultima_gestion IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM gestiones g WHERE g.causa_id = c.id AND g.fecha = c.fecha_ultima_gestion
+      )
+"""
+
+def desde_causas(causa_ids=None, conexion=None, hoy=None):
+    """Agenda la ultima_gestion de las causas (todas o ``causa_ids``) que aún no está en su historial.
+
+    Las fechas futuras quedan como audiencias pendientes y las pasadas como
+    gestiones realizadas. Es lo que hace la migración 11 con las causas
+    existentes; el formulario de causas y la importación lo llaman con las
+    causas que acaban de crear.
+    """
+    parametros = {"hoy": hoy or date.today(), "ahora": datetime.utcnow()}
+    consulta = text(_DESDE_CAUSAS)
+    if causa_ids is not None:
+        if not causa_ids:
+            return 0
+        consulta = text(_DESDE_CAUSAS + " AND c.id IN :ids").bindparams(bindparam("ids", expanding=True))
+        parametros["ids"] = list(causa_ids)
+    return (conexion or db.session).execute(consulta, parametros).rowcount
+
+# ===================== ICS =====================
+
+def _escapar(texto):
+    return (
+        (texto or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+def _plegar(linea):
+    # RFC 5545: líneas de hasta 75 octetos, las siguientes empiezan con espacio
+    datos = linea.encode("utf-8")
+    if len(datos) <= 75:
+        return linea
+    partes, actual = [], b""
+    for caracter in linea:
+        codificado = caracter.encode("utf-8")
+        if len(actual) + len(codificado) > (75 if not partes else 74):
+            partes.append(actual.decode("utf-8"))
+            actual = b""
+        actual += codificado
+    partes.append(actual.decode("utf-8"))
+    return "\r\n ".join(partes)
+
+def generar_ics(gestiones, nombre="Judexia"):
+    """Texto iCalendar con un VEVENT por gestión; sin hora, el evento dura el día completo."""
+    ahora = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    lineas = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Judexia//Agenda//ES",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escapar(nombre)}",
+    ]
+    for g in gestiones:
+        if g.hora:
+            inicio = datetime.combine(g.fecha, g.hora)
+            fechas = [
+                f"DTSTART:{inicio.strftime('%Y%m%dT%H%M%S')}",
+                f"DTEND:{(inicio + timedelta(hours=1)).strftime('%Y%m%dT%H%M%S')}",
+            ]
+        else:
+            fechas = [
+                f"DTSTART;VALUE=DATE:{g.fecha.strftime('%Y%m%d')}",
+                f"DTEND;VALUE=DATE:{(g.fecha + timedelta(days=1)).strftime('%Y%m%d')}",
+            ]
+        causa = g.causa
+        rol = (causa.rol_numero or "s/rol") + (f"-{causa.rol_anio}" if causa.rol_anio else "")
+        descripcion = "\n".join(filter(None, [
+            f"Causa {causa.tipo_causa} {rol}",
+            causa.tribunal,
+            f"Responsable: {g.responsable}" if g.responsable else None,
+            g.observaciones,
+        ]))
+        lineas += [
+            "BEGIN:VEVENT",
+            f"UID:gestion-{g.id}@judexia",
+            f"DTSTAMP:{(g.modificada.strftime('%Y%m%dT%H%M%SZ') if g.modificada else ahora)}",
+            *fechas,
+            f"SUMMARY:{_escapar(TIPOS.get(g.tipo, g.tipo) + ': ' + g.titulo)}",
+            f"DESCRIPTION:{_escapar(descripcion)}",
+            *([f"LOCATION:{_escapar(g.lugar)}"] if g.lugar else []),
+            "END:VEVENT",
+        ]
+    lineas.append("END:VCALENDAR")
+    return "".join(_plegar(l) + "\r\n" for l in lineas)
+
+def calendario(hoy, responsable=None, cliente_id=None):
+    """ICS de la ventana alrededor de ``hoy`` con los filtros dados."""
+    gestiones = en_rango(
+        hoy - timedelta(days=ICS_DIAS_ATRAS), hoy + timedelta(days=ICS_DIAS_ADELANTE),
+        responsable=responsable, cliente_id=cliente_id
+    ).options(joinedload(Gestion.causa))
+    nombre = "Judexia" + (f" · {responsable}" if responsable else "")
+    return generar_ics(gestiones, nombre)
@@ -0,0 +1,179 @@
+# almacen.py
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from database import db
+from models import Archivo
+
+class Almacen:
+    """Almacén de archivos direccionado por contenido.
+
+    Cada archivo se guarda una sola vez en ``<directorio>/ab/abcdef...``
+    según el SHA-256 de su contenido, calculado mientras se copia la subida
+    por bloques. La tabla ``archivos`` lleva la cuenta de referencias
+    (documentos, formatos, archivos IA): ``registrar`` y ``liberar`` la
+    modifican dentro de la transacción del llamador, y ``limpiar`` borra del
+    disco lo que quedó sin referencias. El hash sirve también de clave para
+    artefactos derivados (texto extraído, etc.) en ``derivados/``.
+    """
+
+    def __init__(self, directorio=None):
+        self.directorio = directorio
+
+    def init_app(self, app):
+        self.directorio = app.config["ALMACEN_DIR"]
+        os.makedirs(os.path.join(self.directorio, "tmp"), exist_ok=True)
+
+    def ruta(self, sha):
+        return os.path.join(self.directorio, sha[:2], sha)
+
+    # ---------- contenido ----------
+
+    def guardar(self, flujo, bloque=1 << 20):
+        """Copia ``flujo`` al almacén y devuelve (sha256, tamaño).
+
+        Se escribe a un temporal mientras se calcula el hash; si ese contenido
+        ya estaba, el temporal se descarta.
+        """
+        h = hashlib.sha256()
+        tamano = 0
+        fd, temporal = tempfile.mkstemp(dir=os.path.join(self.directorio, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as destino:
+                for parte in iter(lambda: flujo.read(bloque), b""):
+                    h.update(parte)
+                    destino.write(parte)
+                    tamano += len(parte)
+            sha = h.hexdigest()
+            final = self.ruta(sha)
+            if os.path.exists(final):
+                os.remove(temporal)
+                # Marca de uso reciente: limpiar() no lo borra aunque esté liberado
+                os.utime(final)
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(temporal, final)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        return sha, tamano
+
+    def sha_de(self, ruta, bloque=1 << 20):
+        """SHA-256 de un archivo ya en disco (fuera del almacén)."""
+        h = hashlib.sha256()
+        with open(ruta, "rb") as f:
+            for parte in iter(lambda: f.read(bloque), b""):
+                h.update(parte)
+        return h.hexdigest()
+
+    def enlazar(self, sha, destino):
+        """Deja en ``destino`` el contenido ``sha`` sin copiarlo (enlace duro) si el sistema lo permite."""
+        if os.path.exists(destino):
+            os.remove(destino)
+        try:
+            os.link(self.ruta(sha), destino)
+        except OSError:
+            shutil.copyfile(self.ruta(sha), destino)
+
+    # ---------- referencias ----------
+
+    def registrar(self, sha, tamano):
+        """Suma una referencia a ``sha`` en la sesión actual (se confirma con su ``commit``)."""
+        db.session.execute(
+            text(
+                "INSERT INTO archivos (sha256, tamano, referencias, creado) VALUES (:sha, :tamano, 1, :ahora) "
+                "ON CONFLICT (sha256) DO UPDATE SET referencias = archivos.referencias + 1, liberado = NULL"
+            ),
+            {"sha": sha, "tamano": tamano, "ahora": datetime.utcnow()}
+        )
+
+    def liberar(self, sha):
+        """Resta una referencia a ``sha``; el archivo se borra más tarde con ``limpiar``."""
+        db.session.execute(
+            text(
+                "UPDATE archivos SET referencias = referencias - 1, "
+                "liberado = CASE WHEN referencias <= 1 THEN :ahora ELSE NULL END "
+                "WHERE sha256 = :sha"
+            ),
+            {"sha": sha, "ahora": datetime.utcnow()}
+        )
+
+    def limpiar(self, gracia=3600):
+        """Borra del disco el contenido sin referencias desde hace más de ``gracia`` segundos.
+
+        La espera evita borrar un archivo que otra subida acaba de volver a
+        guardar y todavía no registra. También elimina archivos huérfanos
+        (subidas cuya transacción falló) con la misma antigüedad.
+        """
+        limite = datetime.utcnow() - timedelta(seconds=gracia)
+        liberados = [
+            sha for (sha,) in db.session.query(Archivo.sha256).filter(
+                Archivo.referencias <= 0, Archivo.liberado < limite
+            )
+        ]
+        liberados = [s for s in liberados if not self._reciente(s, gracia)]
+        for sha in liberados:
+            self._borrar(sha)
+        if liberados:
+            Archivo.query.filter(Archivo.sha256.in_(liberados)).delete(synchronize_session=False)
+            db.session.commit()
+
+        huerfanos = [sha for sha, _ in self._en_disco() if not self._reciente(sha, gracia)]
+        for i in range(0, len(huerfanos), 500):
+            lote = huerfanos[i:i + 500]
+            conocidos = {s for (s,) in db.session.query(Archivo.sha256).filter(Archivo.sha256.in_(lote))}
+            for sha in set(lote) - conocidos:
+                self._borrar(sha)
+        return len(liberados)
+
+    def _reciente(self, sha, gracia):
+        try:
+            return os.path.getmtime(self.ruta(sha)) > time.time() - gracia
+        except FileNotFoundError:
+            return False
+
+    def _en_disco(self):
+        for prefijo in os.listdir(self.directorio):
+            carpeta = os.path.join(self.directorio, prefijo)
+            if len(prefijo) != 2 or not os.path.isdir(carpeta):
+                continue
+            for sha in os.listdir(carpeta):
+                yield sha, os.path.join(carpeta, sha)
+
+    def _borrar(self, sha):
+        for ruta in (self.ruta(sha), os.path.join(self.directorio, "derivados", sha)):
+            if os.path.isdir(ruta):
+                shutil.rmtree(ruta, ignore_errors=True)
+            elif os.path.exists(ruta):
+                os.remove(ruta)
+
+    # ---------- derivados ----------
+
+    def derivado(self, sha, nombre, calcular):
+        """Texto derivado del contenido ``sha`` (p. ej. el texto extraído de un PDF).
+
+        Se calcula una vez con ``calcular()`` y se reutiliza para cualquier
+        archivo con el mismo contenido.
+        """
+        ruta = os.path.join(self.directorio, "derivados", sha, nombre)
+        if os.path.exists(ruta):
+            with open(ruta, "r", encoding="utf-8") as f:
+                return f.read()
+        valor = calcular()
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(valor)
+        os.replace(temporal, ruta)
+        return valor
+
+
+almacen = Almacen()
@@ -0,0 +1,527 @@
+# benchmarks.py
+#
+# Mide las rutas (con el test client de Flask) y las piezas de IA sobre datos
+# sintéticos, y deja el resultado en JSON para comparar corridas.
+# Uso:
+#   python benchmarks.py --causas 20000 --salida base.json
+#   python benchmarks.py --causas 20000 --comparar base.json   (código 1 si hay regresiones)
+#   python benchmarks.py --db sqlite:///bench.sqlite            (base ya llenada con datos_sinteticos.py)
+#   python benchmarks.py --solo arranque                        (importación y memoria por worker)
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import event
+
+from database import db
+from models import Documento, FormatoLegal, Honorario, Cliente
+import cliente_openai
+
+# Rutas que no se miden: cierran sesión, crean tablas, borran archivos o
+# exponen diagnósticos
+EXCLUIDAS = {"static", "logout", "init_db", "debug_error", "eliminar_ia", "ver_columnas_causas", "metrics", "metrics_lentas"}
+
+# Variantes con filtros y búsquedas, además de la página sin parámetros
+ESCENARIOS = [
+    ("causas filtradas", "/causas?tipo_causa=Civil"),
+    ("causas por cliente", "/causas?cliente_id={cliente_id}"),
+    ("clientes por nombre", "/clientes?q=gonz"),
+    ("clientes por rut", "/clientes?q=12345"),
+    ("api clientes", "/api/clientes?q=perez"),
+    ("buscar texto", "/buscar?q=arrendamiento"),
+    ("buscar frase", "/buscar?q=%22clausula+penal%22"),
+    ("formatos por nombre", "/formatos?nombre=escrito"),
+    ("facturacion vencidas", "/facturacion?estado=vencida"),
+    ("facturacion por cliente", "/facturacion?cliente_id={cliente_id}"),
+    ("exportar facturacion", "/exportar_facturacion?desde=2024-01-01"),
+    ("agenda por cliente", "/agenda?cliente_id={cliente_id}"),
+    ("agenda por responsable", "/agenda?responsable=Ana&dias=90"),
+    ("agenda ics por responsable", "/agenda.ics?responsable=Ana"),
+]
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+def resumen(tiempos):
+    return {
+        "p50_ms": round(percentil(tiempos, 50) * 1000, 2),
+        "p95_ms": round(percentil(tiempos, 95) * 1000, 2),
+        "p99_ms": round(percentil(tiempos, 99) * 1000, 2),
+        "media_ms": round(statistics.fmean(tiempos) * 1000, 2),
+        "muestras": len(tiempos),
+    }
+
+# ===================== APP =====================
+
+def crear_app_benchmark(url_db=None, causas=10000):
+    """App con OpenAI reemplazado por los proveedores locales y, sin ``url_db``, una base SQLite temporal."""
+    from main import create_app
+    from migraciones import actualizar_esquema
+    import datos_sinteticos
+
+    temporal = tempfile.mkdtemp(prefix="judexia-bench-")
+    # Sin TESTING: una ruta que falla se mide como 500 en vez de cortar la corrida
+    config = {
+        "IA_EMBEDDINGS": "local",
+        "IA_LLM": "local",
+        "IA_LLM_INTERVALO": "0",
+        "IA_TAREAS_EN_PROCESO": False,
+        "IA_INDICE_DIR": os.path.join(temporal, "ia_indice"),
+        "IA_TAREAS_DB": os.path.join(temporal, "ia_indice", "tareas.sqlite"),
+        "IA_CACHE_DB": os.path.join(temporal, "ia_indice", "cache.sqlite"),
+        "CACHE_DB": os.path.join(temporal, "cache.sqlite"),
+        "METRICAS_DB": os.path.join(temporal, "metricas.sqlite"),
+    }
+    if url_db:
+        config["SQLALCHEMY_DATABASE_URI"] = url_db
+    else:
+        config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(temporal, "bench.sqlite")
+        config["ALMACEN_DIR"] = os.path.join(temporal, "almacen")
+
+    app = create_app(config)
+    with app.app_context():
+        actualizar_esquema(db)
+        if not url_db:
+            print(f"⏳ Generando {causas} causas sintéticas...", file=sys.stderr)
+            datos_sinteticos.generar(causas, informar=lambda _: None)
+    return app
+
+def urls_rutas(app):
+    """(nombre, url) de cada ruta GET de la app, con ids reales donde la ruta los pide."""
+    with app.app_context():
+        ejemplos = {
+            "descargar_documento": {"id": db.session.query(Documento.id).order_by(Documento.id).limit(1).scalar()},
+            "descargar_formato": {"id": db.session.query(FormatoLegal.id).order_by(FormatoLegal.id).limit(1).scalar()},
+            "registrar_pago": {"honorario_id": db.session.query(Honorario.id).order_by(Honorario.id).limit(1).scalar()},
+        }
+        cliente_id = db.session.query(Cliente.id).order_by(Cliente.id).limit(1).scalar()
+
+    urls = []
+    with app.test_request_context():
+        from flask import url_for
+        for regla in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+            if regla.endpoint in EXCLUIDAS or "GET" not in regla.methods:
+                continue
+            argumentos = ejemplos.get(regla.endpoint, {})
+            if set(regla.arguments) - set(argumentos) or None in argumentos.values():
+                continue
+            urls.append((regla.endpoint, url_for(regla.endpoint, **argumentos)))
+    urls.extend((nombre, url.format(cliente_id=cliente_id)) for nombre, url in ESCENARIOS)
+    return urls
+
+# ===================== RUTAS =====================
+
+def medir_ruta(app, cliente, url, repeticiones):
+    consultas = []
+
+    def contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        consultas.append(sentencia)
+
+    def pedir():
+        respuesta = cliente.get(url)
+        # Las respuestas en streaming (exportación, descargas) se leen enteras
+        cuerpo = respuesta.get_data()
+        respuesta.close()
+        return respuesta.status_code, len(cuerpo)
+
+    pedir()  # calentamiento: caches, plantillas compiladas, páginas de SQLite
+
+    with app.app_context():
+        motor = db.engine
+    event.listen(motor, "before_cursor_execute", contar)
+    try:
+        tiempos = []
+        for _ in range(repeticiones):
+            del consultas[:]
+            inicio = time.perf_counter()
+            estado, tamano = pedir()
+            tiempos.append(time.perf_counter() - inicio)
+        por_peticion = len(consultas)
+    finally:
+        event.remove(motor, "before_cursor_execute", contar)
+
+    # La memoria se mide en una petición aparte: tracemalloc hace más lento todo
+    tracemalloc.start()
+    try:
+        pedir()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        **resumen(tiempos),
+        "consultas": por_peticion,
+        "pico_memoria_kb": round(pico / 1024, 1),
+        "estado": estado,
+        "bytes": tamano,
+    }
+
+def medir_rutas(app, repeticiones, informar):
+    resultados = {}
+    cliente = app.test_client()
+    for nombre, url in urls_rutas(app):
+        resultado = medir_ruta(app, cliente, url, repeticiones)
+        resultado["url"] = url
+        resultados[nombre] = resultado
+        informar(f"  {nombre:28} p50 {resultado['p50_ms']:8.2f} ms  p95 {resultado['p95_ms']:8.2f} ms  "
+                 f"{resultado['consultas']:3d} consultas  {resultado['pico_memoria_kb']:9.1f} KB  [{resultado['estado']}]")
+    return resultados
+
+# ===================== MICRO =====================
+
+def cronometrar(funcion, repeticiones):
+    funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resumen(tiempos)
+
+def _texto_paginas(paginas, frases_por_pagina=60):
+    from datos_sinteticos import FRASES
+    return [
+        ". ".join(FRASES[(p * 7 + i) % len(FRASES)] for i in range(frases_por_pagina)) + "."
+        for p in range(paginas)
+    ]
+
+def _pdf(paginas, ruta):
+    """PDF mínimo con una línea de texto por página (sin dependencias para escribirlo)."""
+    objetos = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    hijos = []
+    for texto in paginas:
+        contenido = f"BT /F1 9 Tf 20 800 Td ({texto[:3000]}) Tj ET".encode("latin-1", "replace").decode("latin-1")
+        objetos.append(f"<< /Length {len(contenido)} >>\nstream\n{contenido}\nendstream")
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objetos)} 0 R >>"
+        )
+        hijos.append(f"{len(objetos)} 0 R")
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(hijos)}] /Count {len(hijos)} >>"
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for i, objeto in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += f"{i} 0 obj\n{objeto}\nendobj\n".encode("latin-1")
+    xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    salida += "".join(f"{p:010d} 00000 n \n" for p in posiciones).encode()
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(ruta, "wb") as f:
+        f.write(salida)
+
+def medir_micro(repeticiones, vectores, informar):
+    import docx
+    from ia import dividir_en_chunks, extraer_texto, normalizar, _top_k, IndiceIVF, IndiceIA
+    from embeddings import ProveedorLocal
+
+    resultados = {}
+
+    def medir(nombre, prueba):
+        # Una pieza que falla (p. ej. tiktoken sin su vocabulario descargado)
+        # queda registrada con su error y no corta las demás
+        try:
+            resultados[nombre] = prueba()
+        except Exception as e:
+            resultados[nombre] = {"error": f"{type(e).__name__}: {e}"[:300]}
+        r = resultados[nombre]
+        if "error" in r:
+            informar(f"  {nombre:32} ❌ {r['error']}")
+        else:
+            informar(f"  {nombre:32} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms")
+
+    paginas = _texto_paginas(200)
+
+    def chunks():
+        conteo = {}
+        def dividir():
+            conteo["chunks"] = sum(1 for _ in dividir_en_chunks(paginas, max_tokens=500, solapamiento=50))
+        return {**cronometrar(dividir, repeticiones), "chunks": conteo["chunks"]}
+    medir("dividir_en_chunks_200_paginas", chunks)
+
+    temporal = tempfile.mkdtemp(prefix="judexia-micro-")
+    rutas = {
+        "txt": os.path.join(temporal, "escrito.txt"),
+        "docx": os.path.join(temporal, "escrito.docx"),
+        "pdf": os.path.join(temporal, "escrito.pdf"),
+    }
+    with open(rutas["txt"], "w", encoding="utf-8") as f:
+        f.write("\n".join(paginas))
+    documento = docx.Document()
+    for pagina in paginas:
+        documento.add_paragraph(pagina)
+    documento.save(rutas["docx"])
+    _pdf(paginas[:50], rutas["pdf"])
+    for tipo, ruta in rutas.items():
+        medir(f"extraer_texto_{tipo}", lambda: {
+            **cronometrar(lambda: extraer_texto(ruta), repeticiones),
+            "bytes": os.path.getsize(ruta),
+        })
+
+    # Similitud sobre una matriz aleatoria del tamaño de un corpus grande
+    rng = np.random.default_rng(0)
+    matriz = normalizar(rng.standard_normal((vectores, 512), dtype=np.float32))
+    consultas = normalizar(rng.standard_normal((repeticiones + 1, 512), dtype=np.float32))
+    posicion = iter(range(10 ** 9))
+
+    def consulta():
+        return consultas[next(posicion) % len(consultas)]
+
+    medir(f"similitud_exacta_{vectores}", lambda: cronometrar(lambda: _top_k(matriz @ consulta(), 5), repeticiones))
+
+    def ivf():
+        inicio = time.perf_counter()
+        indice = IndiceIVF(matriz)
+        construccion = time.perf_counter() - inicio
+        return {
+            **cronometrar(lambda: indice.buscar(consulta(), 5), repeticiones),
+            "construccion_ms": round(construccion * 1000, 1),
+        }
+    medir(f"similitud_ivf_{vectores}", ivf)
+
+    # Índice IA completo: chunks, embeddings locales en vez de OpenAI y búsqueda
+    def indice_ia():
+        indice = IndiceIA(os.path.join(temporal, "ia_indice"), ProveedorLocal())
+        inicio = time.perf_counter()
+        indice.indexar("escrito.txt", rutas["txt"])
+        indexacion = time.perf_counter() - inicio
+        return {
+            **cronometrar(lambda: indice.buscar(indice.embeber_consulta("cláusula penal del arriendo"), 5), repeticiones),
+            "indexacion_ms": round(indexacion * 1000, 1),
+        }
+    medir("indice_ia_buscar", indice_ia)
+    return resultados
+
+# ===================== ARRANQUE =====================
+
+# Importa la app en un intérprete nuevo y mide tiempo y memoria, antes y
+# después de la primera ruta de IA
+_IMPORTAR_APP = """
+import json, time
+def rss():
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) for l in f if l.startswith("VmRSS")) / 1024
+inicio = time.perf_counter()
+import wsgi
+importacion = time.perf_counter() - inicio
+memoria = rss()
+cliente = wsgi.app.test_client()
+inicio = time.perf_counter()
+cliente.get("/ia/estado")
+primera_ia = time.perf_counter() - inicio
+print(json.dumps({"importacion_ms": round(importacion * 1000, 1), "rss_mb": round(memoria, 1),
+                  "primera_ia_ms": round(primera_ia * 1000, 1), "rss_tras_ia_mb": round(rss(), 1)}))
+"""
+
+# (nombre, variables de entorno): "ia_al_importar" reproduce el arranque de
+# antes, con el stack de IA cargado en cada worker al importar la app
+MODOS_ARRANQUE = [
+    ("ia_al_importar", {"IA_PRECARGAR": "1"}),
+    ("perezoso", {}),
+    ("preload", {"GUNICORN_PRELOAD": "1"}),
+    ("preload_con_ia", {"GUNICORN_PRELOAD": "1", "IA_PRECARGAR": "1"}),
+]
+
+def _entorno_arranque(temporal, extra):
+    entorno = dict(os.environ)
+    entorno.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(temporal, "arranque.sqlite"),
+        "CACHE_DB": os.path.join(temporal, "cache.sqlite"),
+        "METRICAS_DB": os.path.join(temporal, "metricas.sqlite"),
+        "ALMACEN_DIR": os.path.join(temporal, "almacen"),
+        "IA_INDICE_DIR": os.path.join(temporal, "ia_indice"),
+        "IA_EMBEDDINGS": "local",
+        "IA_LLM": "local",
+        "IA_TAREAS_EN_PROCESO": "0",
+    })
+    entorno.update(extra)
+    return entorno
+
+def _memoria_proceso(pid):
+    """RSS y PSS (MB) de un proceso; PSS reparte las páginas compartidas entre quienes las usan."""
+    valores = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if partes[0] in ("Rss:", "Pss:"):
+                valores[partes[0][:-1].lower() + "_mb"] = round(int(partes[1]) / 1024, 1)
+    return valores
+
+def _medir_gunicorn(entorno, workers, plazo=60):
+    import socket
+    import urllib.request
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+         "-b", f"127.0.0.1:{puerto}", "wsgi:app"],
+        cwd=directorio, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        hijos = []
+        while time.perf_counter() - inicio < plazo:
+            try:
+                with open(f"/proc/{proceso.pid}/task/{proceso.pid}/children") as f:
+                    hijos = [int(h) for h in f.read().split()]
+                urllib.request.urlopen(f"http://127.0.0.1:{puerto}/login", timeout=1).read()
+                if len(hijos) >= workers:
+                    break
+            except OSError:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError("gunicorn no respondió a tiempo")
+        listo = time.perf_counter() - inicio
+        # Cada worker termina de importar lo suyo antes de responder: se deja asentar
+        time.sleep(1)
+        memoria = [_memoria_proceso(h) for h in hijos]
+        return {
+            "listo_ms": round(listo * 1000, 1),
+            "master": _memoria_proceso(proceso.pid),
+            "workers": memoria,
+            "pss_total_mb": round(sum(m["pss_mb"] for m in memoria) + _memoria_proceso(proceso.pid)["pss_mb"], 1),
+        }
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+def medir_arranque(informar, repeticiones=3, workers=2):
+    """Tiempo de importación y memoria por worker con el stack de IA cargado al importar o al primer uso."""
+    resultados = {}
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    for nombre, extra in MODOS_ARRANQUE:
+        temporal = tempfile.mkdtemp(prefix="judexia-arranque-")
+        entorno = _entorno_arranque(temporal, extra)
+        resultado = {}
+        if "GUNICORN_PRELOAD" not in extra:
+            corridas = [
+                json.loads(subprocess.run(
+                    [sys.executable, "-c", _IMPORTAR_APP], cwd=directorio, env=entorno,
+                    capture_output=True, text=True, check=True
+                ).stdout.strip().splitlines()[-1])
+                for _ in range(repeticiones)
+            ]
+            # El mínimo es la medida menos afectada por el resto de la máquina
+            resultado = {clave: min(c[clave] for c in corridas) for clave in corridas[0]}
+        try:
+            resultado["gunicorn"] = _medir_gunicorn(entorno, workers)
+        except (OSError, RuntimeError) as e:
+            resultado["gunicorn"] = {"error": str(e)}
+        resultados[nombre] = resultado
+
+        linea = f"  {nombre:16}"
+        if "importacion_ms" in resultado:
+            linea += f" import {resultado['importacion_ms']:7.1f} ms  RSS {resultado['rss_mb']:6.1f} MB" \
+                     f"  (tras /ia {resultado['rss_tras_ia_mb']:6.1f} MB)"
+        g = resultado["gunicorn"]
+        if "error" in g:
+            linea += f"  gunicorn ❌ {g['error']}"
+        else:
+            linea += f"  gunicorn listo {g['listo_ms']:7.1f} ms  PSS total {g['pss_total_mb']:6.1f} MB"
+        informar(linea)
+    return resultados
+
+# ===================== COMPARACIÓN =====================
+
+def comparar(actual, anterior, tolerancia=0.2):
+    """Regresiones respecto de ``anterior``: p95 más de ``tolerancia`` peor, o más consultas."""
+    regresiones = []
+    for seccion in ("rutas", "micro"):
+        for nombre, ahora in actual.get(seccion, {}).items():
+            antes = anterior.get(seccion, {}).get(nombre)
+            if not antes or "error" in antes:
+                continue
+            if "error" in ahora:
+                regresiones.append(f"{seccion}/{nombre}: {ahora['error']}")
+                continue
+            # Por debajo de 1 ms el ruido domina
+            if ahora["p95_ms"] > max(antes["p95_ms"] * (1 + tolerancia), antes["p95_ms"] + 1):
+                regresiones.append(f"{seccion}/{nombre}: p95 {antes['p95_ms']} -> {ahora['p95_ms']} ms")
+            if "consultas" in ahora and ahora["consultas"] > antes.get("consultas", ahora["consultas"]):
+                regresiones.append(f"{seccion}/{nombre}: consultas {antes['consultas']} -> {ahora['consultas']}")
+    return regresiones
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de rutas y de IA.")
+    parser.add_argument("--db", help="Base ya poblada (si no, se genera una SQLite temporal).")
+    parser.add_argument("--causas", type=int, default=10000, help="Causas sintéticas de la base temporal.")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--vectores", type=int, default=100000, help="Tamaño de la matriz de similitud.")
+    parser.add_argument("--solo", choices=["rutas", "micro", "arranque"], help="Correr solo una parte.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto, la salida estándar).")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento de p95 aceptado (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    def informar(linea):
+        print(linea, file=sys.stderr)
+
+    # Cualquier llamada real a OpenAI es un error del benchmark
+    llamadas_openai = []
+    cliente_openai.observadores.append(lambda ruta, segundos, ok: llamadas_openai.append(ruta))
+
+    resultado = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "db": args.db or f"sqlite temporal ({args.causas} causas)",
+            "repeticiones": args.repeticiones,
+        }
+    }
+    if args.solo in (None, "rutas"):
+        app = crear_app_benchmark(args.db, args.causas)
+        informar("⏱️ Rutas")
+        resultado["rutas"] = medir_rutas(app, args.repeticiones, informar)
+    if args.solo in (None, "micro"):
+        informar("⏱️ Micro-benchmarks")
+        resultado["micro"] = medir_micro(args.repeticiones, args.vectores, informar)
+    if args.solo in (None, "arranque"):
+        informar("⏱️ Arranque")
+        resultado["arranque"] = medir_arranque(informar)
+    resultado["meta"]["llamadas_openai"] = len(llamadas_openai)
+
+    salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(salida + "\n")
+        informar(f"✅ Resultados en {args.salida}")
+    else:
+        print(salida)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            regresiones = comparar(resultado, json.load(f), args.tolerancia)
+        for r in regresiones:
+            informar(f"❌ {r}")
+        if regresiones:
+            sys.exit(1)
+        informar("✅ Sin regresiones.")
@@ -0,0 +1,168 @@
+# busqueda.py
+
+import logging
+import os
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+
+from almacen import almacen
+from database import db
+from models import FormatoLegal, Documento
+
+# Texto extraído de formatos y documentos de causas, en una tabla propia
+# (busqueda_documentos) creada por migraciones.py. En SQLite la indexa una
+# tabla FTS5 sincronizada por triggers; en Postgres una columna tsvector con
+# índice GIN.
+
+log = logging.getLogger(__name__)
+
+FORMATO = "formato"
+DOCUMENTO = "documento"
+
+# Marcas de inicio/fin del término en los fragmentos: caracteres de control
+# que no aparecen en el texto, para escapar el fragmento antes de resaltarlo
+INICIO, FIN = "\x02", "\x03"
+
+def _es_postgres():
+    return db.engine.dialect.name == "postgresql"
+
+# ===================== INDEXACIÓN =====================
+
+def extraer_contenido(path, extension=None):
+    # ia carga tokenizer y NumPy; solo se necesita el extractor de texto
+    from ia import extraer_texto
+    try:
+        return extraer_texto(path, extension)
+    except Exception as e:
+        # Un PDF dañado o escaneado igual queda buscable por su nombre
+        log.warning("No se pudo extraer el texto de %s: %s", path, e, exc_info=True)
+        return ""
+
+def indexar(tipo, ref_id, titulo, path, causa_id=None, sha=None):
+    """Agrega o reemplaza el texto de un archivo en el índice.
+
+    Usa la sesión actual: queda confirmado junto con el formato o documento
+    en el mismo ``commit``. Con ``sha`` (archivo del almacén) el texto
+    extraído se guarda junto al contenido y no se vuelve a extraer.
+    """
+    # Los archivos del almacén no tienen extensión: se toma del nombre original
+    extension = os.path.splitext(titulo)[1].lower()
+    if sha:
+        contenido = almacen.derivado(sha, "texto.txt", lambda: extraer_contenido(path, extension))
+    else:
+        contenido = extraer_contenido(path, extension)
+    eliminar(tipo, ref_id)
+    db.session.execute(
+        text(
+            "INSERT INTO busqueda_documentos (tipo, ref_id, causa_id, titulo, contenido) "
+            "VALUES (:tipo, :ref_id, :causa_id, :titulo, :contenido)"
+        ),
+        {
+            "tipo": tipo,
+            "ref_id": ref_id,
+            "causa_id": causa_id,
+            "titulo": titulo,
+            "contenido": contenido.replace("\x00", ""),
+        }
+    )
+
+def eliminar(tipo, ref_id):
+    db.session.execute(
+        text("DELETE FROM busqueda_documentos WHERE tipo = :tipo AND ref_id = :ref_id"),
+        {"tipo": tipo, "ref_id": ref_id}
+    )
+
+def reindexar():
+    """Reconstruye el índice completo desde los formatos y documentos actuales."""
+    db.session.execute(text("DELETE FROM busqueda_documentos"))
+    total = 0
+    for f in FormatoLegal.query.yield_per(200):
+        path = almacen.ruta(f.sha256) if f.sha256 else os.path.join("static", "formatos", f.filename)
+        indexar(FORMATO, f.id, f.nombre_original, path, f.causa_id, sha=f.sha256)
+        total += 1
+    for d in Documento.query.yield_per(200):
+        indexar(DOCUMENTO, d.id, d.nombre_archivo, d.ruta, d.causa_id, sha=d.sha256)
+        total += 1
+    db.session.commit()
+    return total
+
+# ===================== CONSULTA =====================
+
+def _consulta_fts5(consulta):
+    # Cada palabra entre comillas (sin operadores del usuario) y la última
+    # como prefijo, para que "arrien" encuentre "arriendo"
+    palabras = re.findall(r"\w+", consulta)
+    if not palabras:
+        return None
+    terminos = [f'"{p}"' for p in palabras]
+    terminos[-1] += "*"
+    return " ".join(terminos)
+
+def _resaltar(fragmento):
+    return Markup(
+        str(escape(fragmento or "")).replace(INICIO, "<mark>").replace(FIN, "</mark>")
+    )
+
+def buscar(consulta, causa_id=None, tipo=None, limite=20):
+    """Resultados ordenados por relevancia, con un fragmento resaltado.
+
+    Cada resultado es un dict con ``tipo``, ``ref_id``, ``causa_id``,
+    ``titulo``, ``fragmento`` (HTML seguro) y ``puntaje`` (mayor es mejor).
+    """
+    filtros = ""
+    parametros = {"limite": limite}
+    if causa_id:
+        filtros += " AND d.causa_id = :causa_id"
+        parametros["causa_id"] = causa_id
+    if tipo:
+        filtros += " AND d.tipo = :tipo"
+        parametros["tipo"] = tipo
+
+    if _es_postgres():
+        if not consulta.strip():
+            return []
+        parametros.update(consulta=consulta, opciones=f"StartSel={INICIO}, StopSel={FIN}, MaxWords=30, MinWords=12")
+        # El fragmento (ts_headline) es lo caro: solo se arma para los primeros
+        sql = f"""
+            SELECT d.tipo, d.ref_id, d.causa_id, d.titulo,
+                   ts_headline('spanish', d.contenido, q, :opciones) AS fragmento, r.puntaje
+            FROM (
+                SELECT d.id, ts_rank_cd(d.vector, q) AS puntaje
+                FROM busqueda_documentos d, websearch_to_tsquery('spanish', :consulta) q
+                WHERE d.vector @@ q {filtros}
+                ORDER BY puntaje DESC
+                LIMIT :limite
+            ) r
+            JOIN busqueda_documentos d ON d.id = r.id,
+                 websearch_to_tsquery('spanish', :consulta) q
+            ORDER BY r.puntaje DESC
+        """
+    else:
+        parametros["consulta"] = _consulta_fts5(consulta)
+        if parametros["consulta"] is None:
+            return []
+        # bm25 es menor cuanto más relevante; el título pesa más que el contenido
+        sql = f"""
+            SELECT d.tipo, d.ref_id, d.causa_id, d.titulo,
+                   snippet(busqueda_fts, 1, '{INICIO}', '{FIN}', '…', 24) AS fragmento,
+                   -bm25(busqueda_fts, 5.0, 1.0) AS puntaje
+            FROM busqueda_fts
+            JOIN busqueda_documentos d ON d.id = busqueda_fts.rowid
+            WHERE busqueda_fts MATCH :consulta {filtros}
+            ORDER BY bm25(busqueda_fts, 5.0, 1.0)
+            LIMIT :limite
+        """
+
+    return [
+        {
+            "tipo": fila.tipo,
+            "ref_id": fila.ref_id,
+            "causa_id": fila.causa_id,
+            "titulo": fila.titulo,
+            "fragmento": _resaltar(fila.fragmento),
+            "puntaje": float(fila.puntaje),
+        }
+        for fila in db.session.execute(text(sql), parametros)
+    ]
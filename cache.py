@@ -0,0 +1,126 @@
+# cache.py
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+class CacheCompartido:
+    """Cache clave/valor en SQLite, compartido por todos los workers.
+
+    Cada valor se guarda junto a los sellos de versión de los grupos de datos
+    de los que depende (``"causas"``, ``"clientes"``...). Las rutas que
+    escriben llaman a ``invalidar(grupo)``, lo que incrementa el sello; la
+    próxima lectura no coincide y el valor se recalcula. Los valores deben ser
+    serializables a JSON.
+
+    Muchas claves llevan la fecha o filtros libres (``dashboard:{fecha}``...),
+    así que al escribir se borran las que no se leen hace ``retencion``
+    segundos y, superado ``maximo``, las menos usadas recientemente.
+    """
+
+    # Una lectura actualiza ``usado`` solo si el valor anterior es más viejo
+    # que esto, para no escribir en cada acierto
+    TOQUE = 300
+
+    def __init__(self, ruta_db=None, retencion=2 * 24 * 3600, maximo=5000):
+        self.ruta_db = ruta_db
+        self.retencion = retencion
+        self.maximo = maximo
+
+    def init_app(self, app):
+        self.ruta_db = app.config["CACHE_DB"]
+        self.retencion = app.config.get("CACHE_RETENCION", self.retencion)
+        self.maximo = app.config.get("CACHE_MAXIMO", self.maximo)
+        directorio = os.path.dirname(self.ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conectar() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS versiones (grupo TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(valores)")}
+            if columnas and "usado" not in columnas:
+                # Tabla de antes de la limpieza: son solo valores recalculables
+                con.execute("DROP TABLE valores")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS valores (
+                    clave TEXT PRIMARY KEY,
+                    sello TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    usado REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS ix_valores_usado ON valores (usado)")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            yield con
+        finally:
+            con.close()
+
+    def _sello(self, con, grupos):
+        if not grupos:
+            return ""
+        marcas = ",".join("?" * len(grupos))
+        versiones = dict(con.execute(
+            f"SELECT grupo, version FROM versiones WHERE grupo IN ({marcas})", tuple(grupos)
+        ).fetchall())
+        return ".".join(f"{g}{versiones.get(g, 0)}" for g in grupos)
+
+    def sello(self, *grupos):
+        """Versiones actuales de ``grupos``; cambia cada vez que se invalida alguno."""
+        with self._conectar() as con:
+            return self._sello(con, grupos)
+
+    def version(self, grupo):
+        with self._conectar() as con:
+            fila = con.execute("SELECT version FROM versiones WHERE grupo = ?", (grupo,)).fetchone()
+        return fila[0] if fila else 0
+
+    def invalidar(self, *grupos):
+        with self._conectar() as con:
+            for grupo in grupos:
+                con.execute(
+                    "INSERT INTO versiones (grupo, version) VALUES (?, 1) "
+                    "ON CONFLICT(grupo) DO UPDATE SET version = version + 1",
+                    (grupo,)
+                )
+
+    def obtener(self, clave, grupos, calcular, ttl=None, sello=None):
+        """Devuelve el valor vigente de ``clave`` o lo calcula con ``calcular()``.
+
+        ``sello`` evita volver a leer las versiones si quien llama ya las tiene.
+        """
+        with self._conectar() as con:
+            sello = sello if sello is not None else self._sello(con, grupos)
+            fila = con.execute("SELECT sello, valor, creado, usado FROM valores WHERE clave = ?", (clave,)).fetchone()
+            ahora = time.time()
+            if fila and fila[0] == sello and (ttl is None or ahora - fila[2] < ttl):
+                if ahora - fila[3] > self.TOQUE:
+                    con.execute("UPDATE valores SET usado = ? WHERE clave = ?", (ahora, clave))
+                return json.loads(fila[1])
+
+        valor = calcular()
+        with self._conectar() as con:
+            ahora = time.time()
+            con.execute(
+                "INSERT OR REPLACE INTO valores (clave, sello, valor, creado, usado) VALUES (?, ?, ?, ?, ?)",
+                (clave, sello, json.dumps(valor, default=str), ahora, ahora)
+            )
+            self._podar(con, ahora)
+        return valor
+
+    def _podar(self, con, ahora):
+        con.execute("DELETE FROM valores WHERE usado < ?", (ahora - self.retencion,))
+        con.execute(
+            "DELETE FROM valores WHERE clave IN ("
+            "SELECT clave FROM valores ORDER BY usado DESC LIMIT -1 OFFSET ?)",
+            (self.maximo,)
+        )
+
+
+cache = CacheCompartido()
@@ -0,0 +1,222 @@
+# cliente_openai.py
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+# ===================== ERRORES =====================
+
+class ErrorOpenAI(Exception):
+    """La API respondió con un error o no respondió dentro del plazo."""
+
+    def __init__(self, mensaje, status=None):
+        super().__init__(mensaje)
+        self.status = status
+
+
+class CircuitoAbierto(ErrorOpenAI):
+    """Demasiados fallos seguidos: se rechaza la llamada sin tocar la red."""
+
+# ===================== CLIENTE =====================
+
+REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+
+# Funciones llamadas tras cada llamada a la API con (ruta, segundos, ok);
+# metricas.py registra la suya para medir el tiempo en servicios externos
+observadores = []
+
+def _notificar(ruta, segundos, ok):
+    for observador in observadores:
+        try:
+            observador(ruta, segundos, ok)
+        except Exception:
+            pass
+
+class ClienteOpenAI:
+    """Cliente HTTP compartido para la API de OpenAI.
+
+    - Una ``requests.Session`` con pool de conexiones keep-alive.
+    - Cada llamada tiene un plazo total (``plazo`` segundos) que incluye los
+      reintentos; nunca deja un worker colgado más que eso.
+    - Como mucho ``concurrencia`` llamadas simultáneas por proceso.
+    - Reintentos con backoff exponencial y jitter completo ante 429/5xx y
+      errores de red.
+    - Circuit breaker: tras ``umbral_fallos`` fallos seguidos se rechazan las
+      llamadas durante ``enfriamiento`` segundos; luego se deja pasar una de
+      prueba (medio abierto).
+    """
+
+    def __init__(self, api_key, base_url="https://api.openai.com/v1", plazo=30.0, timeout_conexion=3.05,
+                 reintentos=3, concurrencia=8, umbral_fallos=5, enfriamiento=30.0, backoff=0.5):
+        self.base_url = base_url.rstrip("/")
+        self.plazo = plazo
+        self.timeout_conexion = timeout_conexion
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+
+        # requests (con urllib3 y ssl) se importa al crear el primer cliente:
+        # este módulo lo importa metricas.py en todos los workers
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=concurrencia, pool_maxsize=concurrencia, max_retries=0)
+        self.sesion.mount("http://", adaptador)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.headers.update({
+            "Authorization": f"Bearer {api_key or ''}",
+            "Content-Type": "application/json",
+        })
+
+        self._semaforo = threading.BoundedSemaphore(concurrencia)
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._probando = False
+
+    # ---------- circuit breaker ----------
+
+    def _permitir(self):
+        with self._lock:
+            if self._fallos < self.umbral_fallos:
+                return
+            if time.monotonic() < self._abierto_hasta or self._probando:
+                raise CircuitoAbierto("La API de OpenAI no está disponible; se reintentará en unos segundos.")
+            self._probando = True
+
+    def _registrar(self, ok):
+        """Resultado de una llamada: True, False o None (no llegó a la API, solo libera la prueba)."""
+        with self._lock:
+            self._probando = False
+            if ok is None:
+                return
+            if ok:
+                self._fallos = 0
+                return
+            self._fallos += 1
+            if self._fallos >= self.umbral_fallos:
+                self._abierto_hasta = time.monotonic() + self.enfriamiento
+
+    # ---------- transporte ----------
+
+    def _post(self, ruta, cuerpo, stream=False):
+        inicio = time.perf_counter()
+        ok = False
+        try:
+            r = self._enviar(ruta, cuerpo, stream)
+            ok = True
+            return r
+        finally:
+            _notificar(ruta, time.perf_counter() - inicio, ok)
+
+    def _enviar(self, ruta, cuerpo, stream):
+        import requests
+        self._permitir()
+        # Toda salida pasa por _registrar: si no, en medio abierto _probando
+        # quedaría en True y el circuito rechazaría todo hasta reiniciar
+        ok = None
+        try:
+            limite = time.monotonic() + self.plazo
+            if not self._semaforo.acquire(timeout=self.plazo):
+                # Saturación de este proceso, no de la API: no cuenta como fallo
+                raise ErrorOpenAI("Demasiadas llamadas simultáneas a OpenAI.")
+            try:
+                ok = False
+                ultimo_error = None
+                for intento in range(self.reintentos + 1):
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    try:
+                        r = self.sesion.post(
+                            f"{self.base_url}{ruta}",
+                            data=json.dumps(cuerpo),
+                            timeout=(min(self.timeout_conexion, restante), restante),
+                            stream=stream
+                        )
+                    except (requests.ConnectionError, requests.Timeout) as e:
+                        ultimo_error = ErrorOpenAI(f"Error de red con OpenAI: {e}")
+                    else:
+                        if r.status_code < 400:
+                            ok = True
+                            return r
+                        ultimo_error = ErrorOpenAI(f"OpenAI respondió {r.status_code}: {r.text[:200]}", r.status_code)
+                        r.close()
+                        if r.status_code not in REINTENTABLES:
+                            # Un 4xx es un error nuestro, no una caída de la API
+                            ok = True
+                            raise ultimo_error
+
+                    espera = random.uniform(0, self.backoff * (2 ** intento))
+                    if time.monotonic() + espera >= limite:
+                        break
+                    time.sleep(espera)
+
+                raise ultimo_error or ErrorOpenAI("OpenAI no respondió dentro del plazo.")
+            finally:
+                self._semaforo.release()
+        finally:
+            self._registrar(ok)
+
+    # ---------- API ----------
+
+    def embeddings(self, textos, modelo):
+        datos = self._post("/embeddings", {"input": list(textos), "model": modelo}).json()["data"]
+        # La API no garantiza el orden de la respuesta; se reordena por índice
+        return [d["embedding"] for d in sorted(datos, key=lambda d: d["index"])]
+
+    async def embeddings_async(self, lotes, modelo):
+        """Embebe varios lotes a la vez; la concurrencia la limita el semáforo del cliente."""
+        return await asyncio.gather(*(asyncio.to_thread(self.embeddings, lote, modelo) for lote in lotes))
+
+    def chat(self, mensajes, modelo):
+        r = self._post("/chat/completions", {"model": modelo, "messages": mensajes})
+        return r.json()["choices"][0]["message"]["content"]
+
+    def chat_stream(self, mensajes, modelo):
+        # El timeout de lectura es por fragmento: una respuesta que manda un
+        # token de vez en cuando lo renueva siempre. El plazo total se revisa
+        # entre fragmentos y al vencer se cierra la conexión.
+        limite = time.monotonic() + self.plazo
+        r = self._post("/chat/completions", {"model": modelo, "messages": mensajes, "stream": True}, stream=True)
+        with r:
+            for linea in r.iter_lines():
+                if time.monotonic() > limite:
+                    raise ErrorOpenAI("OpenAI no terminó la respuesta dentro del plazo.")
+                if not linea.startswith(b"data: "):
+                    continue
+                datos = linea[6:].decode("utf-8")
+                if datos == "[DONE]":
+                    return
+                token = json.loads(datos)["choices"][0].get("delta", {}).get("content")
+                if token:
+                    yield token
+
+
+_clientes = {}
+_clientes_lock = threading.Lock()
+
+def _opcion(config, clave, tipo, defecto):
+    valor = config.get(clave)
+    return defecto if valor in (None, "") else tipo(valor)
+
+def obtener_cliente(config):
+    """Cliente único por proceso (y por configuración), para reutilizar conexiones."""
+    opciones = {
+        "api_key": config.get("OPENAI_API_KEY"),
+        "base_url": _opcion(config, "OPENAI_BASE_URL", str, "https://api.openai.com/v1"),
+        "plazo": _opcion(config, "OPENAI_PLAZO", float, 30.0),
+        "reintentos": _opcion(config, "OPENAI_REINTENTOS", int, 3),
+        "concurrencia": _opcion(config, "OPENAI_CONCURRENCIA", int, 8),
+        "umbral_fallos": _opcion(config, "OPENAI_CIRCUITO_FALLOS", int, 5),
+        "enfriamiento": _opcion(config, "OPENAI_CIRCUITO_SEGUNDOS", float, 30.0),
+    }
+    clave = tuple(sorted(opciones.items()))
+    with _clientes_lock:
+        if clave not in _clientes:
+            _clientes[clave] = ClienteOpenAI(**opciones)
+        return _clientes[clave]
@@ -0,0 +1,48 @@
+# clientes.py
+
+from database import db
+from models import Cliente, normalizar_nombre
+from rut import normalizar_rut
+
+def siguiente_prefijo(prefijo):
+    # Menor texto mayor que todos los que empiezan con ``prefijo``: el rango
+    # [prefijo, siguiente) usa el índice, a diferencia de LIKE en Postgres
+    return prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+def filtrar_clientes(query, texto):
+    """Filtra por RUT si ``texto`` parece uno; si no, por prefijo del nombre.
+
+    "12.345.678-5" busca ese RUT exacto y "12345" los RUT que empiezan así;
+    "perez" o "Pérez" encuentran a "Pérez Soto, Ana".
+    """
+    numero, dv = normalizar_rut(texto)
+    if numero and dv:
+        return query.filter(Cliente.rut_num == numero)
+    if numero:
+        return query.filter(Cliente.rut_num >= numero, Cliente.rut_num < siguiente_prefijo(numero))
+    prefijo = normalizar_nombre(texto)
+    if not prefijo:
+        return query
+    return query.filter(Cliente.nombre_busqueda >= prefijo, Cliente.nombre_busqueda < siguiente_prefijo(prefijo))
+
+def buscar_clientes(texto, limite=10):
+    """Proyección liviana (id, nombre, rut) para el buscador de los formularios."""
+    query = db.session.query(Cliente.id, Cliente.nombre, Cliente.rut_num, Cliente.rut_dv)
+    if texto:
+        query = filtrar_clientes(query, texto)
+    filas = query.order_by(Cliente.nombre_busqueda, Cliente.id).limit(limite).all()
+    return [{"id": f.id, "nombre": f.nombre, "rut": _rut(f)} for f in filas]
+
+def etiqueta_cliente(cliente_id):
+    """Texto a mostrar en el buscador para un cliente ya elegido ("" si no existe)."""
+    if not str(cliente_id or "").isdigit():
+        return ""
+    fila = db.session.query(Cliente.nombre, Cliente.rut_num, Cliente.rut_dv).filter(
+        Cliente.id == int(cliente_id)
+    ).first()
+    if not fila:
+        return ""
+    return f"{fila.nombre} ({_rut(fila)})" if fila.rut_num else fila.nombre
+
+def _rut(fila):
+    return f"{fila.rut_num}-{fila.rut_dv}" if fila.rut_num else None
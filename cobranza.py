@@ -0,0 +1,175 @@
+# cobranza.py
+#
+# Calendario de cuotas de los honorarios, vencimiento de cuotas y antigüedad
+# de saldos por cliente. Las cuotas se crean todas al registrar el honorario;
+# marcar_vencidas() corre una vez al día, programada fuera de la app (el
+# Procfile no programa tareas):
+#   cron:              5 0 * * *  cd /ruta/a/judexia && flask --app main cobranza-vencimientos
+#   Heroku Scheduler:  "Daily" con el comando  flask --app main cobranza-vencimientos
+# Sin ella las cuotas no pasan a vencidas y la antigüedad de saldos de
+# /facturacion queda con la fecha de su último cálculo.
+
+from datetime import date, timedelta
+
+from sqlalchemy import and_, case, delete, exists, func, insert, literal, select, update
+
+from database import db
+from models import AntiguedadSaldo, Honorario, PagoCuota
+import resumen
+
+# Cada cuota vence cada 30 días desde la emisión
+DIAS_ENTRE_CUOTAS = 30
+
+def filas_cuotas(honorario_id, cliente_id, monto_total, numero_cuotas, fecha_emision):
+    """Filas de pagos_cuotas del calendario de un honorario, todas pendientes.
+
+    El monto se reparte en partes iguales redondeadas al peso; la diferencia
+    del redondeo queda en la última cuota, así la suma es exactamente el total.
+    """
+    numero_cuotas = max(1, numero_cuotas or 1)
+    monto_total = monto_total or 0
+    parte = round(monto_total / numero_cuotas)
+    return [
+        {
+            "honorario_id": honorario_id,
+            "cliente_id": cliente_id,
+            "monto": parte if n < numero_cuotas else monto_total - parte * (numero_cuotas - 1),
+            "monto_pagado": 0.0,
+            "cuota_numero": n,
+            "total_cuotas": numero_cuotas,
+            "vencimiento": fecha_emision + timedelta(days=DIAS_ENTRE_CUOTAS * n),
+            "estado": "pendiente",
+        }
+        for n in range(1, numero_cuotas + 1)
+    ]
+
+def crear_cuotas(honorario):
+    """Inserta en bloque el calendario de un honorario recién agregado a la sesión."""
+    db.session.flush()
+    filas = filas_cuotas(
+        honorario.id, honorario.cliente_id, honorario.monto_total,
+        honorario.numero_cuotas if honorario.en_cuotas else 1,
+        honorario.fecha_emision
+    )
+    db.session.execute(insert(PagoCuota), filas)
+    return len(filas)
+
+def registrar_pago(honorario, numero, monto, fecha_pago, vencimiento=None):
+    """Abona a la cuota ``numero`` del calendario y recalcula el estado del honorario.
+
+    Los honorarios anteriores al calendario no tienen la cuota: el pago se
+    agrega como antes, como una cuota ya pagada.
+    """
+    cuota = PagoCuota.query.filter_by(honorario_id=honorario.id, cuota_numero=numero).first()
+    if cuota is None:
+        cuota = PagoCuota(
+            honorario_id=honorario.id,
+            cliente_id=honorario.cliente_id,
+            cuota_numero=numero,
+            total_cuotas=honorario.numero_cuotas if honorario.en_cuotas else 1,
+            monto=monto,
+            monto_pagado=0.0,
+            vencimiento=vencimiento or fecha_pago,
+        )
+        db.session.add(cuota)
+    cuota.monto_pagado = (cuota.monto_pagado or 0) + monto
+    cuota.fecha_pago = fecha_pago
+    if cuota.monto is None or cuota.monto_pagado >= cuota.monto:
+        cuota.estado = "pagado"
+    db.session.flush()
+    resumen.sumar(fecha_pago, honorario.cliente_id, cobrado=monto)
+    actualizar_estados(Honorario.id == honorario.id)
+    recalcular_antiguedad(cliente_id=honorario.cliente_id)
+    return cuota
+
+def actualizar_estados(filtro=None):
+    """Recalcula en un UPDATE el estado de los honorarios con cuotas.
+
+    vencido si alguna cuota venció sin pagarse, pendiente si queda alguna por
+    pagar o faltan cuotas, pagado en otro caso.
+    """
+    def cuota(*condiciones):
+        return exists().where(PagoCuota.honorario_id == Honorario.id, *condiciones)
+
+    def por_cuota(columna, *condiciones):
+        return (
+            select(columna)
+            .where(PagoCuota.honorario_id == Honorario.id, *condiciones)
+            .scalar_subquery()
+        )
+
+    pagadas = por_cuota(func.count(PagoCuota.id), PagoCuota.estado == "pagado")
+    # Cuotas del calendario del honorario, no numero_cuotas: sin en_cuotas el
+    # calendario tiene una sola
+    programadas = por_cuota(func.coalesce(func.max(PagoCuota.total_cuotas), 1))
+    estado = case(
+        (cuota(PagoCuota.estado == "vencida"), "vencido"),
+        (cuota(PagoCuota.estado == "pendiente"), "pendiente"),
+        (pagadas >= programadas, "pagado"),
+        else_="pendiente"
+    )
+    consulta = update(Honorario).where(cuota()).values(estado=estado)
+    if filtro is not None:
+        consulta = consulta.where(filtro)
+    return db.session.execute(consulta.execution_options(synchronize_session=False)).rowcount
+
+def recalcular_antiguedad(hoy=None, cliente_id=None):
+    """Reescribe antiguedad_saldos (de un cliente o de todos) con un INSERT ... SELECT."""
+    hoy = hoy or date.today()
+    saldo = func.coalesce(PagoCuota.monto, 0) - func.coalesce(PagoCuota.monto_pagado, 0)
+
+    def tramo(desde, hasta=None):
+        condicion = PagoCuota.vencimiento <= hoy - timedelta(days=desde)
+        if hasta is not None:
+            condicion = and_(condicion, PagoCuota.vencimiento > hoy - timedelta(days=hasta))
+        return func.coalesce(func.sum(case((condicion, saldo), else_=0)), 0)
+
+    columnas = {
+        "por_vencer": func.coalesce(func.sum(case((PagoCuota.vencimiento >= hoy, saldo), else_=0)), 0),
+        "dias_0_30": tramo(1, 31),
+        "dias_31_60": tramo(31, 61),
+        "dias_61_90": tramo(61, 91),
+        "dias_mas_90": tramo(91),
+    }
+    origen = select(
+        PagoCuota.cliente_id, *columnas.values(), literal(hoy, db.Date)
+    ).where(
+        PagoCuota.estado != "pagado", PagoCuota.vencimiento.is_not(None)
+    ).group_by(PagoCuota.cliente_id)
+
+    borrar = delete(AntiguedadSaldo)
+    if cliente_id is not None:
+        origen = origen.where(PagoCuota.cliente_id == cliente_id)
+        borrar = borrar.where(AntiguedadSaldo.cliente_id == cliente_id)
+    db.session.execute(borrar.execution_options(synchronize_session=False))
+    db.session.execute(insert(AntiguedadSaldo).from_select(
+        ["cliente_id", *columnas, "calculado"], origen
+    ))
+
+def marcar_vencidas(hoy=None):
+    """Tarea diaria: vence las cuotas atrasadas, recalcula estados y antigüedad.
+
+    Todo en una transacción, con sentencias que recorren las tablas una vez
+    en vez de cuota por cuota. Devuelve cuántas cuotas vencieron.
+    """
+    hoy = hoy or date.today()
+    vencidas = db.session.execute(
+        update(PagoCuota)
+        .where(PagoCuota.estado == "pendiente", PagoCuota.vencimiento < hoy)
+        .values(estado="vencida")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    actualizar_estados()
+    recalcular_antiguedad(hoy)
+    db.session.commit()
+    return vencidas
+
+def resumen_antiguedad(cliente_id=None):
+    """Totales por tramo leídos de antiguedad_saldos (una fila por cliente)."""
+    columnas = ["por_vencer", "dias_0_30", "dias_31_60", "dias_61_90", "dias_mas_90"]
+    consulta = db.session.query(*[
+        func.coalesce(func.sum(getattr(AntiguedadSaldo, c)), 0) for c in columnas
+    ])
+    if cliente_id:
+        consulta = consulta.filter(AntiguedadSaldo.cliente_id == cliente_id)
+    return dict(zip(columnas, consulta.one()))
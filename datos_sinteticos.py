@@ -0,0 +1,353 @@
+# datos_sinteticos.py
+#
+# Genera una base con volúmenes realistas para medir rendimiento: clientes,
+# contrapartes, causas con sus documentos, formatos, honorarios con cuotas y
+# gastos. Los archivos son unos pocos textos guardados en el almacén y
+# compartidos por muchos documentos, como pasa con los escritos tipo.
+# Uso: python datos_sinteticos.py --causas 100000 [--db sqlite:///bench.sqlite]
+
+import argparse
+import io
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, text
+
+from database import db
+from cache import cache
+from almacen import almacen
+from models import (
+    Cliente, Contraparte, Causa, Documento, FormatoLegal, Gestion, Honorario, PagoCuota, Gasto,
+    normalizar_nombre
+)
+from rut import digito_verificador
+import busqueda
+import cobranza
+import resumen
+
+NOMBRES = [
+    "Ana", "Benjamín", "Camila", "Diego", "Fernanda", "Gonzalo", "Isidora", "Joaquín", "Josefa", "Martín",
+    "Valentina", "Matías", "Catalina", "Tomás", "Antonia", "Vicente", "Constanza", "Felipe", "Javiera", "Ignacio",
+]
+APELLIDOS = [
+    "González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez", "Sepúlveda",
+    "Morales", "Rodríguez", "López", "Fuentes", "Hernández", "Torres", "Araya", "Flores", "Espinoza", "Núñez",
+]
+EMPRESAS = ["Inversiones", "Constructora", "Comercial", "Inmobiliaria", "Transportes", "Servicios", "Agrícola"]
+TIPOS_CAUSA = ["Civil", "Laboral", "Familia", "Penal", "Cobranza", "Otro"]
+PROCEDIMIENTOS = ["Ordinario", "Sumario", "Ejecutivo", "Monitorio", "Aplicación general", "Voluntario"]
+TRIBUNALES = [f"{n}° Juzgado Civil de Santiago" for n in range(1, 31)] + [
+    "Juzgado de Letras del Trabajo de Santiago", "1° Juzgado de Familia de Santiago",
+    "Juzgado de Cobranza Laboral y Previsional", "Juzgado de Garantía de Valparaíso",
+    "Juzgado de Letras de Concepción", "Juzgado de Letras de Temuco",
+]
+GESTIONES = ["Presenta demanda", "Notificación", "Contestación", "Audiencia preparatoria", "Prueba", "Sentencia"]
+CATEGORIAS_GASTO = ["Receptor", "Notaría", "Conservador", "Copias", "Traslados", None]
+PROFESIONES = ["Ingeniero", "Profesora", "Comerciante", "Médica", "Contador", "Estudiante", None]
+
+FRASES = [
+    "Que vengo en interponer demanda en juicio ordinario de mayor cuantía",
+    "por los antecedentes de hecho y fundamentos de derecho que paso a exponer",
+    "el contrato de arrendamiento celebrado entre las partes establece una cláusula penal",
+    "se solicita tener por acompañados los documentos con citación",
+    "la indemnización por años de servicio corresponde conforme al artículo 163 del Código del Trabajo",
+    "la parte demandada no ha dado cumplimiento a la obligación de pago",
+    "solicito al tribunal se sirva fijar audiencia de conciliación",
+    "el pagaré suscrito por el deudor se encuentra vencido e impago",
+    "se deduce recurso de apelación en contra de la sentencia definitiva",
+    "la pensión de alimentos debe fijarse considerando las facultades económicas del alimentante",
+]
+
+def _rut(azar):
+    numero = azar.randint(5_000_000, 25_000_000)
+    return str(numero), digito_verificador(numero)
+
+def _persona(azar):
+    return f"{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)} {azar.choice(APELLIDOS)}"
+
+def _fecha(azar, desde, dias):
+    return desde + timedelta(days=azar.randrange(dias))
+
+def _insertar(modelo, filas, lote):
+    for i in range(0, len(filas), lote):
+        db.session.execute(insert(modelo), filas[i:i + lote])
+    db.session.commit()
+
+def _ajustar_secuencias(modelos):
+    # En Postgres los ids explícitos no avanzan la secuencia del SERIAL: se
+    # lleva al máximo para que los INSERT normales de la app no choquen
+    if db.engine.dialect.name != "postgresql":
+        return
+    for modelo in modelos:
+        tabla = modelo.__tablename__
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), (SELECT MAX(id) FROM {tabla}))"
+        ))
+    db.session.commit()
+
+def _archivos(azar, cantidad):
+    """Textos distintos guardados en el almacén: (sha, tamaño, nombre, contenido)."""
+    archivos = []
+    for i in range(cantidad):
+        contenido = ". ".join(azar.choice(FRASES) for _ in range(azar.randint(20, 80))) + "."
+        sha, tamano = almacen.guardar(io.BytesIO(contenido.encode("utf-8")))
+        archivos.append((sha, tamano, f"escrito_{i:03d}.txt", contenido))
+    return archivos
+
+def generar(causas=100000, semilla=0, lote=5000, archivos=40, indexar_busqueda=True, informar=print):
+    """Agrega datos sintéticos a la base de la app actual y devuelve cuántas filas creó por tabla.
+
+    Las proporciones siguen a las de un estudio mediano: un cliente cada
+    cuatro causas, unos dos documentos por causa, un honorario en la mayoría
+    de las causas con hasta seis cuotas, y gastos y formatos más escasos.
+    """
+    azar = random.Random(semilla)
+    hoy = date.today()
+    inicio = hoy - timedelta(days=8 * 365)
+    conteos = {}
+
+    def medir(nombre, filas):
+        conteos[nombre] = len(filas)
+        informar(f"  {nombre}: {len(filas)}")
+
+    # Los ids se asignan a partir del máximo actual para poder referenciarlos
+    # sin volver a leerlos
+    def siguiente_id(modelo):
+        return (db.session.query(db.func.max(modelo.id)).scalar() or 0) + 1
+
+    # ---------- clientes y contrapartes ----------
+    base = siguiente_id(Cliente)
+    filas = []
+    for i in range(max(1, causas // 4)):
+        nombre = _persona(azar) if azar.random() < 0.85 else f"{azar.choice(EMPRESAS)} {azar.choice(APELLIDOS)} SpA"
+        numero, dv = _rut(azar)
+        filas.append({
+            "id": base + i, "nombre": nombre, "nombre_busqueda": normalizar_nombre(nombre),
+            "rut_num": numero, "rut_dv": dv,
+            "email": f"cliente{base + i}@correo.cl", "telefono": f"+569{azar.randint(10000000, 99999999)}",
+            "direccion": f"Calle {azar.choice(APELLIDOS)} {azar.randint(1, 9999)}, Santiago",
+            "profesion": azar.choice(PROFESIONES),
+            "fecha_nacimiento": _fecha(azar, date(1950, 1, 1), 50 * 365),
+            "fecha_registro": _fecha(azar, inicio, 8 * 365),
+        })
+    _insertar(Cliente, filas, lote)
+    clientes = (base, base + len(filas))
+    medir("clientes", filas)
+
+    base = siguiente_id(Contraparte)
+    filas = []
+    ruts = set()
+    for i in range(max(1, causas // 5)):
+        numero, dv = _rut(azar)
+        while numero in ruts:
+            numero, dv = _rut(azar)
+        ruts.add(numero)
+        filas.append({
+            "id": base + i, "nombre": _persona(azar) if azar.random() < 0.5 else f"{azar.choice(EMPRESAS)} {azar.choice(APELLIDOS)} Ltda.",
+            "rut": f"{numero}-{dv}", "email": None, "telefono": None, "direccion": None,
+        })
+    # Puede chocar con contrapartes que ya estaban: se omiten
+    existentes = {r for (r,) in db.session.query(Contraparte.rut).filter(Contraparte.rut.isnot(None))}
+    filas = [f for f in filas if f["rut"] not in existentes]
+    _insertar(Contraparte, filas, lote)
+    contrapartes = [f["id"] for f in filas]
+    medir("contrapartes", filas)
+
+    # ---------- causas ----------
+    base = siguiente_id(Causa)
+    filas = []
+    for i in range(causas):
+        ingreso = _fecha(azar, inicio, 8 * 365)
+        judicial = azar.random() < 0.8
+        filas.append({
+            "id": base + i,
+            "tipo_causa": azar.choice(TIPOS_CAUSA),
+            "procedimiento": azar.choice(PROCEDIMIENTOS),
+            "judicial": judicial,
+            "corte_apelaciones": "Santiago" if judicial else None,
+            "tribunal": azar.choice(TRIBUNALES) if judicial else None,
+            "letra": azar.choice("CTFO") if judicial else None,
+            "rol_numero": str(azar.randint(1, 30000)) if judicial else None,
+            "rol_anio": ingreso.year if judicial else None,
+            "fecha_ingreso": ingreso,
+            "ultima_gestion": azar.choice(GESTIONES),
+            "fecha_ultima_gestion": min(hoy, ingreso + timedelta(days=azar.randrange(400))),
+            "ingreso_juridico": None,
+            "cliente_id": azar.randrange(*clientes),
+            "contraparte_id": azar.choice(contrapartes) if contrapartes and azar.random() < 0.7 else None,
+        })
+    _insertar(Causa, filas, lote)
+    causas_ids = (base, base + len(filas))
+    cliente_de = {f["id"]: f["cliente_id"] for f in filas}
+    medir("causas", filas)
+
+    # ---------- agenda: historial de gestiones y audiencias por venir ----------
+    gestiones = []
+    for causa in filas:
+        responsable = azar.choice(NOMBRES[:8])
+        ingreso, ultima = causa["fecha_ingreso"], causa["fecha_ultima_gestion"]
+        for _ in range(azar.randint(0, 3)):
+            gestiones.append({
+                "causa_id": causa["id"], "cliente_id": causa["cliente_id"], "tipo": "gestion",
+                "titulo": azar.choice(GESTIONES), "fecha": ingreso + (ultima - ingreso) * azar.random(),
+                "hora": None, "lugar": None, "responsable": responsable, "realizada": True,
+            })
+        gestiones.append({
+            "causa_id": causa["id"], "cliente_id": causa["cliente_id"], "tipo": "gestion",
+            "titulo": causa["ultima_gestion"], "fecha": ultima, "hora": None, "lugar": None,
+            "responsable": responsable, "realizada": True,
+        })
+        if azar.random() < 0.3:
+            audiencia = azar.random() < 0.6
+            gestiones.append({
+                "causa_id": causa["id"], "cliente_id": causa["cliente_id"],
+                "tipo": "audiencia" if audiencia else "plazo",
+                "titulo": "Audiencia preparatoria" if audiencia else "Vence plazo para contestar",
+                "fecha": hoy + timedelta(days=azar.randrange(120)),
+                "hora": datetime(2000, 1, 1, azar.choice((9, 10, 11, 12)), azar.choice((0, 30))).time() if audiencia else None,
+                "lugar": causa["tribunal"] if audiencia else None,
+                "responsable": responsable, "realizada": False,
+            })
+    _insertar(Gestion, gestiones, lote)
+    medir("gestiones", gestiones)
+
+    # ---------- archivos, documentos y formatos ----------
+    textos = _archivos(azar, archivos)
+    referencias = {sha: 0 for sha, *_ in textos}
+
+    base = siguiente_id(Documento)
+    documentos = []
+    for causa_id in range(*causas_ids):
+        for _ in range(azar.choice((0, 1, 2, 2, 3, 4))):
+            sha, _, nombre, _ = azar.choice(textos)
+            referencias[sha] += 1
+            documentos.append({
+                "id": base + len(documentos), "causa_id": causa_id, "nombre_archivo": nombre,
+                "tipo": "prueba habilitante", "ruta": almacen.ruta(sha), "sha256": sha,
+            })
+
+    base = siguiente_id(FormatoLegal)
+    formatos = []
+    for i in range(max(1, causas // 20)):
+        sha, _, nombre, _ = azar.choice(textos)
+        referencias[sha] += 1
+        formatos.append({
+            "id": base + i, "nombre_original": nombre, "filename": f"sintetico_{base + i:08d}_{nombre}",
+            "fecha_subida": datetime.combine(_fecha(azar, inicio, 8 * 365), datetime.min.time()),
+            "usuario": azar.choice(NOMBRES), "causa_id": azar.randrange(*causas_ids) if azar.random() < 0.6 else None,
+            "version": 1, "observaciones": None, "sha256": sha,
+        })
+
+    for sha, tamano, _, _ in textos:
+        if referencias[sha]:
+            db.session.execute(
+                text(
+                    "INSERT INTO archivos (sha256, tamano, referencias, creado) VALUES (:sha, :tamano, :n, :ahora) "
+                    "ON CONFLICT (sha256) DO UPDATE SET referencias = archivos.referencias + :n, liberado = NULL"
+                ),
+                {"sha": sha, "tamano": tamano, "n": referencias[sha], "ahora": datetime.utcnow()}
+            )
+    _insertar(Documento, documentos, lote)
+    medir("documentos", documentos)
+    _insertar(FormatoLegal, formatos, lote)
+    medir("formatos_legales", formatos)
+
+    if indexar_busqueda:
+        contenido = {sha: texto for sha, _, _, texto in textos}
+        filas = [
+            {"tipo": busqueda.DOCUMENTO, "ref_id": d["id"], "causa_id": d["causa_id"],
+             "titulo": d["nombre_archivo"], "contenido": contenido[d["sha256"]]}
+            for d in documentos
+        ] + [
+            {"tipo": busqueda.FORMATO, "ref_id": f["id"], "causa_id": f["causa_id"],
+             "titulo": f["nombre_original"], "contenido": contenido[f["sha256"]]}
+            for f in formatos
+        ]
+        for i in range(0, len(filas), lote):
+            db.session.execute(
+                text(
+                    "INSERT INTO busqueda_documentos (tipo, ref_id, causa_id, titulo, contenido) "
+                    "VALUES (:tipo, :ref_id, :causa_id, :titulo, :contenido)"
+                ),
+                filas[i:i + lote]
+            )
+        db.session.commit()
+        medir("busqueda_documentos", filas)
+
+    # ---------- honorarios, cuotas y gastos ----------
+    base = siguiente_id(Honorario)
+    honorarios, cuotas = [], []
+    for causa_id in range(*causas_ids):
+        if azar.random() > 0.8:
+            continue
+        id_ = base + len(honorarios)
+        emision = _fecha(azar, inicio, 8 * 365)
+        numero_cuotas = azar.choice((1, 1, 2, 3, 4, 6))
+        monto = float(azar.randrange(300_000, 6_000_000, 10_000))
+        pagadas = azar.randint(0, numero_cuotas)
+        honorarios.append({
+            "id": id_, "cliente_id": cliente_de[causa_id], "causa_id": causa_id,
+            "descripcion": f"Honorarios {azar.choice(PROCEDIMIENTOS).lower()}", "monto_total": monto,
+            "fecha_emision": emision, "en_cuotas": numero_cuotas > 1, "numero_cuotas": numero_cuotas,
+            "estado": "pagado" if pagadas == numero_cuotas else "pendiente",
+        })
+        for n in range(1, numero_cuotas + 1):
+            vencimiento = emision + timedelta(days=30 * n)
+            pagada = n <= pagadas
+            cuotas.append({
+                "honorario_id": id_, "cliente_id": cliente_de[causa_id], "monto": round(monto / numero_cuotas),
+                "monto_pagado": round(monto / numero_cuotas) if pagada else 0.0,
+                "fecha_pago": min(hoy, vencimiento - timedelta(days=azar.randrange(10))) if pagada else None,
+                "cuota_numero": n, "total_cuotas": numero_cuotas, "vencimiento": vencimiento,
+                "estado": "pagado" if pagada else ("vencida" if vencimiento < hoy else "pendiente"),
+            })
+    _insertar(Honorario, honorarios, lote)
+    medir("honorarios", honorarios)
+    _insertar(PagoCuota, cuotas, lote)
+    medir("pagos_cuotas", cuotas)
+    cobranza.actualizar_estados()
+    cobranza.recalcular_antiguedad(hoy)
+    db.session.commit()
+
+    filas = [
+        {
+            "descripcion": f"{categoria or 'Gasto'} causa {azar.randrange(*causas_ids)}",
+            "monto": float(azar.randrange(5_000, 400_000, 500)), "fecha": _fecha(azar, inicio, 8 * 365),
+            "categoria": categoria,
+        }
+        for categoria in (azar.choice(CATEGORIAS_GASTO) for _ in range(max(1, causas // 10)))
+    ]
+    _insertar(Gasto, filas, lote)
+    medir("gastos", filas)
+
+    conteos["resumen_mensual"] = resumen.reconstruir()
+    db.session.commit()
+    informar(f"  resumen_mensual: {conteos['resumen_mensual']}")
+
+    _ajustar_secuencias([Cliente, Contraparte, Causa, Documento, FormatoLegal, Honorario])
+    for grupo in ("clientes", "contrapartes", "causas", "honorarios", "pagos", "gastos", "gestiones", "resumen"):
+        cache.invalidar(grupo)
+    return conteos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Llena la base con datos sintéticos.")
+    parser.add_argument("--causas", type=int, default=100000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--lote", type=int, default=5000, help="Filas por INSERT.")
+    parser.add_argument("--archivos", type=int, default=40, help="Textos distintos en el almacén.")
+    parser.add_argument("--db", help="URL de la base (por defecto DATABASE_URL o la de la app).")
+    parser.add_argument("--sin-busqueda", action="store_true", help="No llenar el índice de texto completo.")
+    args = parser.parse_args()
+
+    from main import create_app
+    from migraciones import actualizar_esquema
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": args.db} if args.db else None)
+    with app.app_context():
+        actualizar_esquema(db)
+        inicio = time.perf_counter()
+        print(f"⏳ Generando {args.causas} causas...")
+        generar(args.causas, args.semilla, args.lote, args.archivos, not args.sin_busqueda)
+    print(f"✅ Datos generados en {time.perf_counter() - inicio:.1f} s.")
@@ -0,0 +1,79 @@
+# descargas.py
+
+import hashlib
+import mimetypes
+import os
+
+from flask import current_app, request, send_file
+
+# Entrega de archivos: documentos y formatos con validadores de cache y
+# rangos, y archivos estáticos con huella para cachearlos sin revalidar.
+
+UN_ANIO = 365 * 24 * 3600
+
+def enviar_archivo(ruta, nombre, sha=None):
+    """Respuesta de descarga de ``ruta`` con el nombre original ``nombre``.
+
+    Con ``sha`` (archivo del almacén) el ETag es el hash del contenido, así
+    que ``If-None-Match`` responde 304 sin leer el archivo. ``send_file``
+    atiende ``Range`` (206) para que los PDF grandes se abran por partes y,
+    con ``USE_X_SENDFILE``, deja la copia al servidor web. Con
+    ``X_ACCEL_ALMACEN`` (ubicación interna de nginx que apunta a
+    ``ALMACEN_DIR``) el worker solo responde los encabezados.
+    """
+    prefijo = current_app.config.get("X_ACCEL_ALMACEN")
+    if sha and prefijo:
+        relativa = os.path.relpath(ruta, current_app.config["ALMACEN_DIR"]).replace(os.sep, "/")
+        rv = current_app.response_class(mimetype=_tipo(nombre))
+        rv.headers["X-Accel-Redirect"] = prefijo.rstrip("/") + "/" + relativa
+        rv.headers.set("Content-Disposition", "inline", filename=nombre)
+        rv.set_etag(sha)
+        rv.cache_control.no_cache = True
+        return rv.make_conditional(request)
+
+    rv = send_file(ruta, download_name=nombre, etag=sha or True, conditional=True, max_age=0)
+    rv.cache_control.no_cache = True
+    return rv
+
+def _tipo(nombre):
+    return mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+
+# ===================== ESTÁTICOS CON HUELLA =====================
+
+_huellas = {}
+
+def huella(filename):
+    """Primeros caracteres del SHA-256 de ``static/<filename>``, recalculados si cambia el archivo."""
+    ruta = os.path.join(current_app.static_folder, filename)
+    try:
+        marca = os.stat(ruta).st_mtime_ns
+    except OSError:
+        return None
+    guardada = _huellas.get(filename)
+    if guardada and guardada[0] == marca:
+        return guardada[1]
+    with open(ruta, "rb") as f:
+        valor = hashlib.sha256(f.read()).hexdigest()[:12]
+    _huellas[filename] = (marca, valor)
+    return valor
+
+def init_app(app):
+    @app.url_defaults
+    def _agregar_huella(endpoint, values):
+        # url_for('static', filename='css/styles.css') -> /static/css/styles.css?v=<huella>
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            valor = huella(values["filename"])
+            if valor:
+                values["v"] = valor
+
+    @app.after_request
+    def _cache_estaticos(rv):
+        # La URL cambia con el contenido: el navegador puede guardarla un año
+        # sin volver a preguntar
+        if (request.endpoint == "static" and rv.status_code == 200
+                and request.args.get("v") == huella(request.view_args["filename"])):
+            rv.cache_control.public = True
+            rv.cache_control.max_age = UN_ANIO
+            rv.cache_control.immutable = True
+            rv.cache_control.no_cache = None
+        return rv
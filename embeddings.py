@@ -0,0 +1,141 @@
+# embeddings.py
+
+import asyncio
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cliente_openai import obtener_cliente
+
+# ===================== PROVEEDORES =====================
+
+class ProveedorEmbeddings:
+    """Convierte listas de textos en una matriz float32 contigua (n, dim).
+
+    Las subclases implementan ``_embeber_lote``; esta clase reparte los textos
+    en lotes de ``tamano_lote`` y procesa hasta ``concurrencia`` lotes a la vez.
+    """
+
+    nombre = "base"
+
+    def __init__(self, tamano_lote=64, concurrencia=1):
+        self.tamano_lote = max(1, int(tamano_lote))
+        self.concurrencia = max(1, int(concurrencia))
+
+    @property
+    def id(self):
+        # Identifica el espacio vectorial: vectores de proveedores distintos no se mezclan
+        return self.nombre
+
+    def _embeber_lote(self, textos):
+        raise NotImplementedError
+
+    def embeber(self, textos):
+        textos = list(textos)
+        if not textos:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        lotes = [textos[i:i + self.tamano_lote] for i in range(0, len(textos), self.tamano_lote)]
+        if self.concurrencia > 1 and len(lotes) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.concurrencia, len(lotes))) as pool:
+                resultados = list(pool.map(self._embeber_lote, lotes))
+        else:
+            resultados = [self._embeber_lote(lote) for lote in lotes]
+
+        return np.ascontiguousarray(np.vstack(resultados), dtype=np.float32)
+
+
+class ProveedorOpenAI(ProveedorEmbeddings):
+    """Embeddings de la API de OpenAI a través del cliente compartido.
+
+    Los lotes se envían concurrentemente con asyncio; el cliente limita la
+    concurrencia real, los plazos y los reintentos.
+    """
+
+    nombre = "openai"
+
+    def __init__(self, cliente, modelo="text-embedding-ada-002", tamano_lote=64, concurrencia=4):
+        super().__init__(tamano_lote, concurrencia)
+        self.cliente = cliente
+        self.modelo = modelo
+
+    @property
+    def id(self):
+        return f"openai-{self.modelo}"
+
+    def _embeber_lote(self, textos):
+        return np.array(self.cliente.embeddings(textos, self.modelo), dtype=np.float32)
+
+    async def embeber_async(self, textos):
+        textos = list(textos)
+        if not textos:
+            return np.zeros((0, 0), dtype=np.float32)
+        lotes = [textos[i:i + self.tamano_lote] for i in range(0, len(textos), self.tamano_lote)]
+        resultados = await self.cliente.embeddings_async(lotes, self.modelo)
+        return np.ascontiguousarray(np.vstack([np.array(r, dtype=np.float32) for r in resultados]))
+
+    def embeber(self, textos):
+        textos = list(textos)
+        if self.concurrencia > 1 and len(textos) > self.tamano_lote:
+            return asyncio.run(self.embeber_async(textos))
+        return super().embeber(textos)
+
+
+class ProveedorLocal(ProveedorEmbeddings):
+    """Bolsa de palabras con hashing: determinista y sin red.
+
+    Sirve para desarrollo, pruebas y para medir el rendimiento de la ingesta
+    sin depender de la API. Cada palabra cae en una de ``dimension`` columnas
+    según un hash estable, con signo para reducir colisiones constructivas.
+    """
+
+    nombre = "local"
+    _palabra = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dimension=512, tamano_lote=256, concurrencia=1):
+        super().__init__(tamano_lote, concurrencia)
+        self.dimension = int(dimension)
+
+    @property
+    def id(self):
+        return f"local-{self.dimension}"
+
+    def _columna(self, palabra):
+        h = int.from_bytes(hashlib.blake2b(palabra.encode("utf-8"), digest_size=8).digest(), "little")
+        return h % self.dimension, 1.0 if (h >> 63) & 1 else -1.0
+
+    def _embeber_lote(self, textos):
+        matriz = np.zeros((len(textos), self.dimension), dtype=np.float32)
+        cache = {}
+        for fila, texto in enumerate(textos):
+            columnas, signos = [], []
+            for palabra in self._palabra.findall(texto.lower()):
+                if palabra not in cache:
+                    cache[palabra] = self._columna(palabra)
+                columna, signo = cache[palabra]
+                columnas.append(columna)
+                signos.append(signo)
+            if columnas:
+                np.add.at(matriz[fila], columnas, signos)
+        # Frecuencia sublineal: una palabra repetida no domina el vector
+        return np.sign(matriz) * np.log1p(np.abs(matriz))
+
+
+def crear_proveedor(config):
+    """Construye el proveedor indicado en IA_EMBEDDINGS (``openai`` o ``local``)."""
+    tipo = config.get("IA_EMBEDDINGS", "openai")
+    tamano_lote = config.get("IA_EMBEDDINGS_LOTE")
+    concurrencia = config.get("IA_EMBEDDINGS_CONCURRENCIA")
+    opciones = {}
+    if tamano_lote:
+        opciones["tamano_lote"] = int(tamano_lote)
+    if concurrencia:
+        opciones["concurrencia"] = int(concurrencia)
+
+    if tipo == "local":
+        return ProveedorLocal(**opciones)
+    if tipo == "openai":
+        return ProveedorOpenAI(obtener_cliente(config), **opciones)
+    raise ValueError(f"Proveedor de embeddings desconocido: {tipo}")
@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+#
+# gunicorn lo lee solo desde el directorio de trabajo. Los workers y el puerto
+# siguen saliendo de WEB_CONCURRENCY y PORT, como antes.
+
+import os
+
+# Con GUNICORN_PRELOAD=1 la app se importa una vez en el master y los workers
+# nacen con fork: comparten esas páginas (copy-on-write) y arrancan al
+# instante. Con IA_PRECARGAR=1 además se carga el stack de IA en el master,
+# para no pagarlo en cada worker al primer /ia.
+preload_app = os.getenv("GUNICORN_PRELOAD") == "1"
+
+def post_fork(server, worker):
+    # Las conexiones abiertas en el master no se pueden usar desde dos
+    # procesos: cada worker abre las suyas
+    if preload_app:
+        from wsgi import app
+        from database import db
+        with app.app_context():
+            db.engine.dispose(close=False)
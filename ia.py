@@ -0,0 +1,393 @@
+# ia.py
+
+import fcntl
+import hashlib
+import json
+import os
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+import docx
+import numpy as np
+import PyPDF2
+import tiktoken
+
+from embeddings import crear_proveedor
+
+# ===================== TEXTO =====================
+
+def extraer_paginas(path, bloque=1 << 16, extension=None):
+    """Genera el texto del documento de a una página (o bloque) por vez.
+
+    El formato sale de la extensión de ``path`` salvo que se indique
+    ``extension`` (los archivos del almacén no la tienen).
+    """
+    extension = (extension or os.path.splitext(path)[1]).lower()
+    if extension == ".pdf":
+        with open(path, "rb") as f:
+            lector = PyPDF2.PdfReader(f)
+            for p in lector.pages:
+                yield p.extract_text() or ""
+    elif extension == ".docx":
+        doc = docx.Document(path)
+        for p in doc.paragraphs:
+            yield p.text
+    elif extension == ".txt":
+        with open(path, "r", encoding="utf-8") as f:
+            actual = []
+            largo = 0
+            for linea in f:
+                actual.append(linea)
+                largo += len(linea)
+                if largo >= bloque:
+                    yield "".join(actual)
+                    actual, largo = [], 0
+            if actual:
+                yield "".join(actual)
+
+def extraer_texto(path, extension=None):
+    extension = (extension or os.path.splitext(path)[1]).lower()
+    separador = "\n" if extension == ".docx" else " "
+    return separador.join(extraer_paginas(path, extension=extension))
+
+@lru_cache(maxsize=None)
+def _tokenizer(nombre="cl100k_base"):
+    # tiktoken tarda en construir el encoder: uno por proceso basta
+    return tiktoken.get_encoding(nombre)
+
+def _frases(paginas):
+    # Una frase puede quedar cortada entre dos páginas; el resto se arrastra
+    resto = ""
+    for pagina in paginas:
+        partes = (resto + " " + pagina if resto else pagina).split(".")
+        resto = partes.pop()
+        for p in partes:
+            yield p + "."
+    if resto.strip():
+        yield resto + "."
+
+def dividir_en_chunks(paginas, max_tokens=500, solapamiento=0):
+    """Agrupa frases en chunks de a lo más ``max_tokens`` tokens.
+
+    Recorre el texto una sola vez: cada frase se codifica una vez y se lleva
+    la cuenta acumulada de tokens. Las frases más largas que ``max_tokens``
+    se cortan en ventanas de tokens. ``solapamiento`` repite al inicio de cada
+    chunk las últimas frases del anterior, hasta esa cantidad de tokens.
+    """
+    if isinstance(paginas, str):
+        paginas = [paginas]
+    tokenizer = _tokenizer()
+    solapamiento = max(0, min(solapamiento, max_tokens // 2))
+
+    actual = deque()
+    tokens_actual = 0
+    for frase in _frases(paginas):
+        tokens = tokenizer.encode(frase)
+        n = len(tokens)
+
+        if n > max_tokens:
+            if actual:
+                yield "".join(f for f, _ in actual).strip()
+                actual.clear()
+                tokens_actual = 0
+            paso = max_tokens - solapamiento
+            for i in range(0, n, paso):
+                yield tokenizer.decode(tokens[i:i + max_tokens]).strip()
+                if i + max_tokens >= n:
+                    break
+            continue
+
+        if actual and tokens_actual + n > max_tokens:
+            yield "".join(f for f, _ in actual).strip()
+            while actual and (tokens_actual > solapamiento or tokens_actual + n > max_tokens):
+                tokens_actual -= actual.popleft()[1]
+
+        actual.append((frase, n))
+        tokens_actual += n
+
+    if actual:
+        yield "".join(f for f, _ in actual).strip()
+
+def normalizar(matriz):
+    """Escala cada fila a norma 1 para que la similitud coseno sea un producto punto."""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+def hash_archivo(path, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+def _top_k(puntajes, k):
+    # argpartition es O(n); solo se ordenan los k elegidos
+    k = min(k, len(puntajes))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    elegidos = np.argpartition(-puntajes, k - 1)[:k]
+    return elegidos[np.argsort(-puntajes[elegidos], kind="stable")]
+
+# ===================== ÍNDICE =====================
+
+class MatrizSegmentada:
+    """Las matrices de varios documentos vistas como una sola, sin copiarlas.
+
+    Cada segmento es el ``.npy`` de un documento abierto con ``mmap_mode``:
+    las filas se leen de las páginas del archivo, que el sistema operativo
+    comparte entre los workers, y solo se copian las que se piden.
+    """
+
+    def __init__(self, segmentos):
+        self.segmentos = segmentos
+        self.inicios = np.cumsum([0] + [len(s) for s in segmentos])
+        self.dimension = segmentos[0].shape[1] if segmentos else 0
+
+    def __len__(self):
+        return int(self.inicios[-1])
+
+    def __getitem__(self, indices):
+        if isinstance(indices, slice):
+            indices = np.arange(*indices.indices(len(self)))
+        indices = np.asarray(indices)
+        filas = np.empty((len(indices), self.dimension), dtype=np.float32)
+        segmento = np.searchsorted(self.inicios, indices, side="right") - 1
+        for s in np.unique(segmento):
+            elegidos = segmento == s
+            filas[elegidos] = self.segmentos[s][indices[elegidos] - self.inicios[s]]
+        return filas
+
+    def buscar(self, vector, k):
+        """Top ``k`` exacto: cada segmento se puntúa en su lugar y solo se juntan sus mejores k."""
+        indices, puntajes = [], []
+        for inicio, segmento in zip(self.inicios, self.segmentos):
+            todos = segmento @ vector
+            mejores = _top_k(todos, k)
+            indices.append(mejores + inicio)
+            puntajes.append(todos[mejores])
+        indices, puntajes = np.concatenate(indices), np.concatenate(puntajes)
+        mejores = _top_k(puntajes, k)
+        return indices[mejores], puntajes[mejores]
+
+
+class IndiceIVF:
+    """Índice aproximado por listas invertidas sobre vectores normalizados.
+
+    Agrupa los vectores con k-means esférico en ``n_listas`` centroides y, al
+    buscar, solo puntúa los vectores de las ``n_sondeo`` listas más cercanas a
+    la consulta. Se usa cuando el corpus supera el umbral configurado.
+    """
+
+    def __init__(self, matriz, n_listas=None, n_sondeo=8, iteraciones=10, semilla=0, bloque=65536):
+        n = len(matriz)
+        self.matriz = matriz
+        self.n_listas = n_listas or max(1, int(np.sqrt(n)))
+        self.n_sondeo = n_sondeo
+
+        rng = np.random.default_rng(semilla)
+        muestra = np.asarray(matriz[np.sort(rng.choice(n, min(n, self.n_listas * 40), replace=False))])
+        centroides = muestra[rng.choice(len(muestra), self.n_listas, replace=False)].copy()
+        for _ in range(iteraciones):
+            asignacion = np.argmax(muestra @ centroides.T, axis=1)
+            sumas = np.zeros_like(centroides)
+            np.add.at(sumas, asignacion, muestra)
+            usados = np.bincount(asignacion, minlength=self.n_listas) > 0
+            centroides[usados] = normalizar(sumas[usados])
+        self.centroides = centroides
+
+        # Asignación final por bloques para no materializar una matriz n x n_listas
+        asignacion = np.concatenate([
+            np.argmax(matriz[i:i + bloque] @ centroides.T, axis=1)
+            for i in range(0, n, bloque)
+        ])
+        self.orden = np.argsort(asignacion, kind="stable")
+        self.limites = np.searchsorted(asignacion[self.orden], np.arange(self.n_listas + 1))
+
+    def buscar(self, vector, k):
+        listas = _top_k(self.centroides @ vector, self.n_sondeo)
+        candidatos = np.concatenate([self.orden[self.limites[l]:self.limites[l + 1]] for l in listas])
+        puntajes = self.matriz[candidatos] @ vector
+        mejores = _top_k(puntajes, k)
+        return candidatos[mejores], puntajes[mejores]
+
+
+class IndiceIA:
+    """Vectores de los documentos de static/ia guardados en disco.
+
+    Cada documento se indexa una sola vez al subirlo: sus chunks quedan en
+    ``<sha256>-<proveedor>.json`` y sus embeddings normalizados en
+    ``<sha256>-<proveedor>.npy`` (float32). ``manifiesto.json`` asocia cada
+    nombre de archivo a su hash, de modo que dos archivos con el mismo
+    contenido comparten vectores.
+    """
+
+    def __init__(self, directorio, proveedor, max_tokens=500, solapamiento=0, umbral_aproximado=50000):
+        self.directorio = directorio
+        self.proveedor = proveedor
+        self.max_tokens = max_tokens
+        self.solapamiento = solapamiento
+        self.umbral_aproximado = umbral_aproximado
+        self._corpus_cache = None
+        os.makedirs(directorio, exist_ok=True)
+
+    def _clave(self, sha):
+        return f"{sha}-{self.proveedor.id}"
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def _leer_manifiesto(self):
+        try:
+            with open(self._ruta("manifiesto.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "documentos": {}}
+
+    def _escribir_json(self, nombre, datos):
+        # Escritura atómica: otro worker nunca ve un archivo a medio escribir
+        tmp = self._ruta(f".{nombre}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(tmp, self._ruta(nombre))
+
+    @contextmanager
+    def _bloqueo(self):
+        # Serializa las modificaciones del manifiesto entre workers de gunicorn
+        with open(self._ruta(".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _guardar_manifiesto(self, manifiesto):
+        manifiesto["version"] = manifiesto.get("version", 0) + 1
+        self._escribir_json("manifiesto.json", manifiesto)
+
+    def documentos(self):
+        return self._leer_manifiesto()["documentos"]
+
+    def version(self):
+        return self._leer_manifiesto().get("version", 0)
+
+    def pendientes(self, nombres):
+        """Nombres que aún no tienen vectores con el proveedor actual."""
+        documentos = self.documentos()
+        return [
+            n for n in nombres
+            if n not in documentos or not os.path.exists(self._ruta(f"{self._clave(documentos[n])}.npy"))
+        ]
+
+    def indexar(self, nombre, path, al_cambiar_etapa=None):
+        """Indexa ``path`` bajo ``nombre``; ``al_cambiar_etapa`` recibe cada etapa."""
+        sha = hash_archivo(path)
+        clave = self._clave(sha)
+        if not os.path.exists(self._ruta(f"{clave}.npy")):
+            if al_cambiar_etapa:
+                al_cambiar_etapa("extrayendo")
+            chunks = [c for c in dividir_en_chunks(extraer_paginas(path), self.max_tokens, self.solapamiento) if c]
+            if al_cambiar_etapa:
+                al_cambiar_etapa("embebiendo")
+            matriz = normalizar(self.proveedor.embeber(chunks))
+            self._escribir_json(f"{clave}.json", chunks)
+            tmp = self._ruta(f".{clave}.{os.getpid()}.tmp.npy")
+            np.save(tmp, matriz)
+            os.replace(tmp, self._ruta(f"{clave}.npy"))
+
+        with self._bloqueo():
+            manifiesto = self._leer_manifiesto()
+            manifiesto["documentos"][nombre] = sha
+            self._guardar_manifiesto(manifiesto)
+        return sha
+
+    def eliminar(self, nombre):
+        with self._bloqueo():
+            manifiesto = self._leer_manifiesto()
+            sha = manifiesto["documentos"].pop(nombre, None)
+            if sha is None:
+                return
+            self._guardar_manifiesto(manifiesto)
+            # Solo se borran los vectores si ningún otro archivo los comparte
+            if sha not in manifiesto["documentos"].values():
+                for ext in ("npy", "json"):
+                    try:
+                        os.remove(self._ruta(f"{self._clave(sha)}.{ext}"))
+                    except FileNotFoundError:
+                        pass
+
+    def _cargar(self, sha):
+        if not os.path.exists(self._ruta(f"{self._clave(sha)}.npy")):
+            return None
+        with open(self._ruta(f"{self._clave(sha)}.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        matriz = np.load(self._ruta(f"{self._clave(sha)}.npy"), mmap_mode="r")
+        return chunks, matriz
+
+    def _corpus(self):
+        # Los segmentos del corpus se abren una vez por versión del manifiesto
+        manifiesto = self._leer_manifiesto()
+        if self._corpus_cache is not None and self._corpus_cache["version"] == manifiesto["version"]:
+            return self._corpus_cache
+
+        # Archivos con el mismo contenido comparten vectores: se puntúan una
+        # vez y los pasajes citan todos sus nombres
+        nombres = {}
+        for nombre, sha in sorted(manifiesto["documentos"].items()):
+            nombres.setdefault(sha, []).append(nombre)
+
+        segmentos, fuentes, textos = [], [], []
+        for sha, archivos in nombres.items():
+            datos = self._cargar(sha)
+            if datos is None or not datos[0]:
+                continue
+            chunks, matriz = datos
+            segmentos.append(matriz)
+            fuentes.extend((", ".join(archivos), i) for i in range(len(chunks)))
+            textos.extend(chunks)
+
+        matriz = MatrizSegmentada(segmentos)
+        self._corpus_cache = {
+            "version": manifiesto["version"],
+            "matriz": matriz,
+            "fuentes": fuentes,
+            "textos": textos,
+            "ivf": IndiceIVF(matriz) if len(textos) >= self.umbral_aproximado else None,
+        }
+        return self._corpus_cache
+
+    def buscar(self, vector, k=5):
+        """Devuelve los ``k`` pasajes más similares de todo el corpus."""
+        corpus = self._corpus()
+        if not corpus["textos"]:
+            return []
+        if corpus["ivf"] is not None:
+            elegidos, puntajes = corpus["ivf"].buscar(vector, k)
+        else:
+            elegidos, puntajes = corpus["matriz"].buscar(vector, k)
+
+        pasajes = []
+        for i, puntaje in zip(elegidos.tolist(), puntajes.tolist()):
+            archivo, posicion = corpus["fuentes"][i]
+            pasajes.append({
+                "archivo": archivo,
+                "posicion": posicion,
+                "texto": corpus["textos"][i],
+                "puntaje": puntaje,
+            })
+        return pasajes
+
+    def embeber_consulta(self, texto):
+        return normalizar(self.proveedor.embeber([texto]))[0]
+
+
+def crear_indice(config):
+    return IndiceIA(
+        config["IA_INDICE_DIR"],
+        crear_proveedor(config),
+        max_tokens=config["IA_CHUNK_TOKENS"],
+        solapamiento=config["IA_CHUNK_SOLAPAMIENTO"],
+        umbral_aproximado=config["IA_UMBRAL_APROXIMADO"]
+    )
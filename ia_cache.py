@@ -0,0 +1,106 @@
+# ia_cache.py
+
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+class CacheRespuestas:
+    """Cache semántico de respuestas de la IA compartido entre workers.
+
+    Una respuesta se reutiliza si la pregunta nueva recuperó exactamente los
+    mismos chunks, con la misma versión del corpus, y su embedding está a una
+    similitud coseno de al menos ``umbral`` de una pregunta ya respondida.
+    Las entradas expiran a los ``ttl`` segundos y, superado ``maximo``, se
+    descartan las menos usadas recientemente.
+    """
+
+    def __init__(self, ruta_db, umbral=0.95, ttl=7 * 24 * 3600, maximo=5000):
+        self.ruta_db = ruta_db
+        self.umbral = umbral
+        self.ttl = ttl
+        self.maximo = maximo
+        directorio = os.path.dirname(self.ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conectar() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS respuestas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    version INTEGER NOT NULL,
+                    chunks TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    pregunta TEXT NOT NULL,
+                    respuesta TEXT NOT NULL,
+                    creada REAL NOT NULL,
+                    usada REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS ix_respuestas_clave ON respuestas (version, chunks)")
+            con.execute("CREATE INDEX IF NOT EXISTS ix_respuestas_usada ON respuestas (usada)")
+            con.execute("CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+            con.execute("INSERT OR IGNORE INTO contadores VALUES ('aciertos', 0), ('fallos', 0)")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            yield con
+        finally:
+            con.close()
+
+    @staticmethod
+    def clave_chunks(fuentes):
+        return ",".join(f"{f['archivo']}#{f['posicion']}" for f in fuentes)
+
+    def buscar(self, vector, version, chunks):
+        vector = np.asarray(vector, dtype=np.float32)
+        ahora = time.time()
+        with self._conectar() as con:
+            filas = con.execute(
+                "SELECT id, embedding, respuesta FROM respuestas "
+                "WHERE version = ? AND chunks = ? AND creada > ?",
+                (version, chunks, ahora - self.ttl)
+            ).fetchall()
+            filas = [f for f in filas if len(f[1]) == vector.nbytes]
+
+            elegida = None
+            if filas:
+                matriz = np.frombuffer(b"".join(f[1] for f in filas), dtype=np.float32).reshape(len(filas), -1)
+                similitudes = matriz @ vector
+                mejor = int(np.argmax(similitudes))
+                if similitudes[mejor] >= self.umbral:
+                    elegida = filas[mejor]
+
+            if elegida is None:
+                con.execute("UPDATE contadores SET valor = valor + 1 WHERE nombre = 'fallos'")
+                return None
+            con.execute("UPDATE respuestas SET usada = ? WHERE id = ?", (ahora, elegida[0]))
+            con.execute("UPDATE contadores SET valor = valor + 1 WHERE nombre = 'aciertos'")
+            return elegida[2]
+
+    def guardar(self, vector, version, chunks, pregunta, respuesta):
+        vector = np.asarray(vector, dtype=np.float32)
+        ahora = time.time()
+        with self._conectar() as con:
+            con.execute(
+                "INSERT INTO respuestas (version, chunks, embedding, pregunta, respuesta, creada, usada) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (version, chunks, vector.tobytes(), pregunta, respuesta, ahora, ahora)
+            )
+            # Expiradas y de versiones anteriores del corpus ya no pueden acertar
+            con.execute("DELETE FROM respuestas WHERE creada <= ? OR version < ?", (ahora - self.ttl, version))
+            con.execute(
+                "DELETE FROM respuestas WHERE id IN ("
+                "SELECT id FROM respuestas ORDER BY usada DESC LIMIT -1 OFFSET ?)",
+                (self.maximo,)
+            )
+
+    def estadisticas(self):
+        with self._conectar() as con:
+            contadores = dict(con.execute("SELECT nombre, valor FROM contadores").fetchall())
+            contadores["entradas"] = con.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        return contadores
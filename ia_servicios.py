@@ -0,0 +1,84 @@
+# ia_servicios.py
+
+import importlib
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+class ServiciosIA:
+    """Índice, cola de ingesta, cache de respuestas y LLM de la IA, creados al primer uso.
+
+    Importar ia.py trae NumPy, PyPDF2, python-docx y tiktoken; la mayoría de
+    las peticiones no tocan /ia, así que cada worker los carga recién cuando
+    una ruta de IA pide alguno de estos servicios.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._servicios = {}
+
+    def _obtener(self, nombre, crear):
+        servicio = self._servicios.get(nombre)
+        if servicio is None:
+            with self._lock:
+                servicio = self._servicios.get(nombre)
+                if servicio is None:
+                    servicio = self._servicios[nombre] = crear()
+        return servicio
+
+    @property
+    def indice(self):
+        def crear():
+            from ia import crear_indice
+            return crear_indice(self.config)
+        return self._obtener("indice", crear)
+
+    @property
+    def cola(self):
+        def crear():
+            from ia_tareas import ColaIngesta
+            return ColaIngesta(
+                self.config["IA_TAREAS_DB"],
+                self.config,
+                procesos=self.config["IA_TAREAS_PROCESOS"],
+                en_proceso=self.config["IA_TAREAS_EN_PROCESO"]
+            )
+        return self._obtener("cola", crear)
+
+    @property
+    def cache(self):
+        def crear():
+            from ia_cache import CacheRespuestas
+            return CacheRespuestas(
+                self.config["IA_CACHE_DB"],
+                umbral=self.config["IA_CACHE_UMBRAL"],
+                ttl=self.config["IA_CACHE_TTL"],
+                maximo=self.config["IA_CACHE_MAXIMO"]
+            )
+        return self._obtener("cache", crear)
+
+    @property
+    def llm(self):
+        def crear():
+            from llm import crear_llm
+            return crear_llm(self.config)
+        return self._obtener("llm", crear)
+
+
+def precargar():
+    """Importa el stack de IA y carga el tokenizer en el proceso actual.
+
+    Con ``preload_app`` de gunicorn se llama en el master antes de crear los
+    workers: las páginas quedan compartidas (copy-on-write) en vez de
+    cargarse una vez por worker.
+    """
+    # Solo interesa el efecto de importarlos: que queden en sys.modules
+    modulos = {nombre: importlib.import_module(nombre) for nombre in ("ia", "ia_cache", "ia_tareas", "llm")}
+    try:
+        modulos["ia"]._tokenizer()
+    except Exception:
+        # Sin red la primera vez tiktoken no puede bajar su vocabulario; el
+        # worker lo intentará de nuevo al usarlo
+        log.warning("No se pudo precargar el tokenizer", exc_info=True)
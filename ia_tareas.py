@@ -0,0 +1,242 @@
+# ia_tareas.py
+
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from ia import crear_indice
+
+# Configuración que necesita un proceso del pool para reconstruir el índice
+CLAVES_CONFIG = (
+    "IA_INDICE_DIR",
+    "IA_EMBEDDINGS",
+    "IA_EMBEDDINGS_LOTE",
+    "IA_EMBEDDINGS_CONCURRENCIA",
+    "IA_CHUNK_TOKENS",
+    "IA_CHUNK_SOLAPAMIENTO",
+    "IA_UMBRAL_APROXIMADO",
+    "OPENAI_API_KEY",
+    "OPENAI_BASE_URL",
+    "OPENAI_PLAZO",
+    "OPENAI_REINTENTOS",
+    "OPENAI_CONCURRENCIA",
+    "OPENAI_CIRCUITO_FALLOS",
+    "OPENAI_CIRCUITO_SEGUNDOS",
+)
+
+# Una tarea en curso renueva su latido cada LATIDO segundos; si pasan
+# HUERFANA sin latido, el proceso que la tenía murió y vuelve a 'pendiente'
+LATIDO = 30
+HUERFANA = 3 * LATIDO
+
+# ===================== TABLA DE TAREAS =====================
+
+@contextmanager
+def _conectar(ruta_db):
+    con = sqlite3.connect(ruta_db, timeout=30, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+        yield con
+    finally:
+        con.close()
+
+def crear_tabla(ruta_db):
+    directorio = os.path.dirname(ruta_db)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with _conectar(ruta_db) as con:
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS tareas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nombre TEXT NOT NULL,
+                ruta TEXT NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                error TEXT,
+                creada REAL NOT NULL,
+                inicio_extraccion REAL,
+                inicio_embeddings REAL,
+                fin REAL,
+                latido REAL
+            )
+        """)
+        columnas = {f["name"] for f in con.execute("PRAGMA table_info(tareas)")}
+        if "latido" not in columnas:
+            con.execute("ALTER TABLE tareas ADD COLUMN latido REAL")
+        con.execute("CREATE INDEX IF NOT EXISTS ix_tareas_estado ON tareas (estado, id)")
+        con.execute("CREATE INDEX IF NOT EXISTS ix_tareas_nombre ON tareas (nombre, id)")
+
+def _actualizar(ruta_db, tarea_id, **campos):
+    columnas = ", ".join(f"{c} = ?" for c in campos)
+    with _conectar(ruta_db) as con:
+        con.execute(f"UPDATE tareas SET {columnas} WHERE id = ?", (*campos.values(), tarea_id))
+
+# ===================== PROCESO DEL POOL =====================
+
+def _latir(ruta_db, tarea_id, detener):
+    while not detener.wait(LATIDO):
+        try:
+            _actualizar(ruta_db, tarea_id, latido=time.time())
+        except sqlite3.Error:
+            # Un latido perdido no importa mientras llegue el siguiente
+            pass
+
+def procesar_tarea(ruta_db, tarea_id, nombre, ruta, config):
+    """Extrae, divide y embebe un documento. Corre fuera del worker web."""
+    detener = threading.Event()
+    threading.Thread(target=_latir, args=(ruta_db, tarea_id, detener), daemon=True).start()
+    try:
+        _procesar(ruta_db, tarea_id, nombre, ruta, config)
+    finally:
+        detener.set()
+
+def _procesar(ruta_db, tarea_id, nombre, ruta, config):
+    indice = crear_indice(config)
+
+    def al_cambiar_etapa(etapa):
+        campo = "inicio_extraccion" if etapa == "extrayendo" else "inicio_embeddings"
+        ahora = time.time()
+        _actualizar(ruta_db, tarea_id, estado=etapa, latido=ahora, **{campo: ahora})
+
+    try:
+        indice.indexar(nombre, ruta, al_cambiar_etapa=al_cambiar_etapa)
+        # El archivo pudo eliminarse mientras se indexaba
+        if not os.path.exists(ruta):
+            indice.eliminar(nombre)
+        _actualizar(ruta_db, tarea_id, estado="lista", fin=time.time())
+    except Exception:
+        _actualizar(ruta_db, tarea_id, estado="fallida", error=traceback.format_exc(limit=3), fin=time.time())
+
+# ===================== COLA =====================
+
+class ColaIngesta:
+    """Cola de ingesta de documentos IA respaldada por SQLite.
+
+    Los workers web solo insertan filas y reparten tareas; la extracción y los
+    embeddings corren en un ``ProcessPoolExecutor``. Reclamar una tarea es una
+    transacción ``BEGIN IMMEDIATE``, así que varios procesos pueden compartir
+    la misma tabla sin procesar dos veces un documento.
+    """
+
+    def __init__(self, ruta_db, config, procesos=2, en_proceso=True):
+        self.ruta_db = ruta_db
+        self.config = {k: config[k] for k in CLAVES_CONFIG}
+        self.procesos = procesos
+        self.en_proceso = en_proceso
+        self._pool = None
+        crear_tabla(ruta_db)
+        if en_proceso and self.recuperar_huerfanas():
+            self.despachar()
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def encolar(self, nombre, ruta):
+        with _conectar(self.ruta_db) as con:
+            tarea_id = con.execute(
+                "INSERT INTO tareas (nombre, ruta, creada) VALUES (?, ?, ?)",
+                (nombre, ruta, time.time())
+            ).lastrowid
+        if self.en_proceso:
+            self.despachar()
+        return tarea_id
+
+    def en_cola(self):
+        # Un documento cuya tarea quedó huérfana vuelve a la cola en vez de
+        # figurar como en proceso para siempre
+        if self.recuperar_huerfanas() and self.en_proceso:
+            self.despachar()
+        with _conectar(self.ruta_db) as con:
+            filas = con.execute(
+                "SELECT DISTINCT nombre FROM tareas WHERE estado IN ('pendiente', 'extrayendo', 'embebiendo')"
+            ).fetchall()
+        return {f["nombre"] for f in filas}
+
+    def _reclamar(self):
+        with _conectar(self.ruta_db) as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                ahora = time.time()
+                self._liberar_huerfanas(con, ahora)
+                fila = con.execute(
+                    "SELECT id, nombre, ruta FROM tareas WHERE estado = 'pendiente' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if fila is not None:
+                    con.execute(
+                        "UPDATE tareas SET estado = 'extrayendo', inicio_extraccion = ?, latido = ? WHERE id = ?",
+                        (ahora, ahora, fila["id"])
+                    )
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            return fila
+
+    def despachar(self):
+        """Envía al pool todas las tareas pendientes; devuelve los futuros."""
+        futuros = []
+        while True:
+            fila = self._reclamar()
+            if fila is None:
+                return futuros
+            futuros.append(self._obtener_pool().submit(
+                procesar_tarea, self.ruta_db, fila["id"], fila["nombre"], fila["ruta"], self.config
+            ))
+
+    @staticmethod
+    def _liberar_huerfanas(con, ahora):
+        # Tareas anteriores a la columna latido: cuenta el inicio de la extracción
+        return con.execute(
+            "UPDATE tareas SET estado = 'pendiente' "
+            "WHERE estado IN ('extrayendo', 'embebiendo') AND COALESCE(latido, inicio_extraccion) < ?",
+            (ahora - HUERFANA,)
+        ).rowcount
+
+    def recuperar_huerfanas(self):
+        """Devuelve a 'pendiente' las tareas cuyo proceso murió a mitad de camino."""
+        with _conectar(self.ruta_db) as con:
+            return self._liberar_huerfanas(con, time.time())
+
+    def estados(self):
+        """Última tarea de cada documento, con sus tiempos por etapa en segundos."""
+        with _conectar(self.ruta_db) as con:
+            filas = con.execute("""
+                SELECT * FROM tareas
+                WHERE id IN (SELECT MAX(id) FROM tareas GROUP BY nombre)
+                ORDER BY nombre
+            """).fetchall()
+
+        def duracion(desde, hasta):
+            if desde is None:
+                return None
+            return round((hasta or time.time()) - desde, 3)
+
+        estados = {}
+        for f in filas:
+            estados[f["nombre"]] = {
+                "estado": f["estado"],
+                "error": f["error"],
+                "espera": duracion(f["creada"], f["inicio_extraccion"]),
+                "extraccion": duracion(f["inicio_extraccion"], f["inicio_embeddings"] or f["fin"]),
+                "embeddings": duracion(f["inicio_embeddings"], f["fin"]),
+                "total": duracion(f["creada"], f["fin"]),
+            }
+        return estados
+
+    def trabajar(self, intervalo=2.0):
+        """Bucle de un worker dedicado (``flask ia-worker``)."""
+        self.recuperar_huerfanas()
+        while True:
+            for futuro in self.despachar():
+                futuro.result()
+            time.sleep(intervalo)
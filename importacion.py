@@ -0,0 +1,335 @@
+# importacion.py
+#
+# Importación masiva de clientes, contrapartes y causas desde CSV.
+# El archivo se lee en streaming; cada fila se valida y las válidas se
+# insertan por lotes (un INSERT de muchas filas y una transacción por lote).
+# Las filas con errores no detienen la importación: se informan al final con
+# su número de línea.
+
+import csv
+import itertools
+from datetime import date, datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from cache import cache
+from database import db
+from models import Cliente, Contraparte, Causa, normalizar_nombre
+from rut import normalizar_rut, rut_valido
+import agenda
+import resumen
+
+FORMATOS_FECHA = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+
+class ErrorImportacion(Exception):
+    """El archivo completo no se puede importar (tipo desconocido, columnas faltantes...)."""
+
+
+class ErrorFila(ValueError):
+    """Una fila no pasa la validación; se informa y se sigue con la siguiente."""
+
+# ===================== CAMPOS =====================
+
+def _texto(fila, campo, largo, obligatorio=False):
+    valor = (fila.get(campo) or "").strip()
+    if not valor:
+        if obligatorio:
+            raise ErrorFila(f"falta {campo}")
+        return None
+    if len(valor) > largo:
+        raise ErrorFila(f"{campo} supera los {largo} caracteres")
+    return valor
+
+def _fecha(fila, campo, obligatorio=False):
+    valor = _texto(fila, campo, 10, obligatorio)
+    if valor is None:
+        return None
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ErrorFila(f"{campo} '{valor}' no es una fecha (AAAA-MM-DD o DD-MM-AAAA)")
+
+def _entero(fila, campo):
+    valor = _texto(fila, campo, 10)
+    if valor is None:
+        return None
+    if not valor.isdigit():
+        raise ErrorFila(f"{campo} '{valor}' no es un número entero")
+    return int(valor)
+
+def _booleano(fila, campo, defecto):
+    valor = (fila.get(campo) or "").strip().lower()
+    if not valor:
+        return defecto
+    if valor in ("si", "sí", "s", "true", "1", "x"):
+        return True
+    if valor in ("no", "n", "false", "0"):
+        return False
+    raise ErrorFila(f"{campo} '{valor}' debe ser sí o no")
+
+def _rut(fila, campo, obligatorio=False):
+    """RUT validado (número, dv) desde una columna "12.345.678-5" o desde campo_num/campo_dv."""
+    texto = (fila.get(campo) or "").strip()
+    if not texto and fila.get(f"{campo}_num"):
+        texto = f"{fila[f'{campo}_num'].strip()}-{(fila.get(f'{campo}_dv') or '').strip()}"
+    if not texto:
+        if obligatorio:
+            raise ErrorFila(f"falta {campo}")
+        return None, None
+    numero, dv = normalizar_rut(texto)
+    if not numero or not dv:
+        raise ErrorFila(f"{campo} '{texto}' no tiene el formato 12345678-9")
+    if not rut_valido(numero, dv):
+        raise ErrorFila(f"{campo} '{texto}' tiene un dígito verificador incorrecto")
+    return numero, dv
+
+# ===================== IMPORTADORES =====================
+
+class Importador:
+    """Convierte filas del CSV en registros de ``modelo``.
+
+    ``convertir`` valida una fila sin tocar la base; ``validar_lote`` hace las
+    verificaciones contra la base (duplicados, claves foráneas) con una
+    consulta por lote, y devuelve los errores como {número de fila: mensaje}.
+    """
+
+    modelo = None
+    # Grupos del cache que se invalidan al terminar
+    grupos = ()
+    # Columnas que deben venir en el encabezado; una tupla acepta cualquiera de ellas
+    requeridas = ()
+
+    def convertir(self, fila):
+        raise NotImplementedError
+
+    def validar_lote(self, pendientes):
+        return {}
+
+    def insertadas(self, registros, ids):
+        """Se llama en la misma transacción con las filas recién insertadas y sus ids."""
+
+
+class ImportadorClientes(Importador):
+    modelo = Cliente
+    grupos = ("clientes",)
+    requeridas = ("nombre", ("rut", "rut_num"))
+
+    def __init__(self):
+        self.vistos = set()
+
+    def convertir(self, fila):
+        numero, dv = _rut(fila, "rut", obligatorio=True)
+        if numero in self.vistos:
+            raise ErrorFila(f"RUT {numero}-{dv} repetido en el archivo")
+        nombre = _texto(fila, "nombre", 100, obligatorio=True)
+        registro = {
+            "nombre": nombre,
+            # insert() no pasa por el validador del modelo
+            "nombre_busqueda": normalizar_nombre(nombre),
+            "rut_num": numero,
+            "rut_dv": dv,
+            "email": _texto(fila, "email", 100),
+            "telefono": _texto(fila, "telefono", 20),
+            "direccion": _texto(fila, "direccion", 200),
+            "profesion": _texto(fila, "profesion", 100),
+            "fecha_nacimiento": _fecha(fila, "fecha_nacimiento"),
+            "fecha_registro": date.today(),
+        }
+        self.vistos.add(numero)
+        return registro
+
+    def validar_lote(self, pendientes):
+        ruts = {r["rut_num"]: n for n, r in pendientes}
+        existentes = db.session.query(Cliente.rut_num).filter(Cliente.rut_num.in_(ruts))
+        return {ruts[rut]: f"ya existe un cliente con RUT {rut}" for (rut,) in existentes}
+
+
+class ImportadorContrapartes(Importador):
+    modelo = Contraparte
+    grupos = ("contrapartes",)
+    requeridas = ("nombre",)
+
+    def __init__(self):
+        self.vistos = set()
+
+    def convertir(self, fila):
+        numero, dv = _rut(fila, "rut")
+        rut = f"{numero}-{dv}" if numero else None
+        if rut in self.vistos:
+            raise ErrorFila(f"RUT {rut} repetido en el archivo")
+        registro = {
+            "nombre": _texto(fila, "nombre", 100, obligatorio=True),
+            "rut": rut,
+            "email": _texto(fila, "email", 100),
+            "telefono": _texto(fila, "telefono", 20),
+            "direccion": _texto(fila, "direccion", 200),
+        }
+        if rut:
+            self.vistos.add(rut)
+        return registro
+
+    def validar_lote(self, pendientes):
+        ruts = {r["rut"]: n for n, r in pendientes if r["rut"]}
+        existentes = db.session.query(Contraparte.rut).filter(Contraparte.rut.in_(ruts))
+        return {ruts[rut]: f"ya existe una contraparte con RUT {rut}" for (rut,) in existentes}
+
+
+class ImportadorCausas(Importador):
+    """El cliente se indica por ``cliente_rut`` (o ``cliente_id``); la contraparte, opcional, por ``contraparte_rut``."""
+
+    modelo = Causa
+    grupos = ("causas", "gestiones")
+    requeridas = ("tipo_causa", "procedimiento", "fecha_ingreso", ("cliente_rut", "cliente_id"))
+
+    def convertir(self, fila):
+        cliente_rut, _ = _rut(fila, "cliente_rut")
+        cliente_id = _entero(fila, "cliente_id")
+        if not cliente_rut and not cliente_id:
+            raise ErrorFila("falta cliente_rut o cliente_id")
+        contraparte_num, contraparte_dv = _rut(fila, "contraparte_rut")
+        return {
+            "tipo_causa": _texto(fila, "tipo_causa", 100, obligatorio=True),
+            "procedimiento": _texto(fila, "procedimiento", 100, obligatorio=True),
+            "judicial": _booleano(fila, "judicial", True),
+            "corte_apelaciones": _texto(fila, "corte_apelaciones", 100),
+            "tribunal": _texto(fila, "tribunal", 150),
+            "letra": _texto(fila, "letra", 1),
+            "rol_numero": _texto(fila, "rol_numero", 10),
+            "rol_anio": _entero(fila, "rol_anio"),
+            "fecha_ingreso": _fecha(fila, "fecha_ingreso", obligatorio=True),
+            "ultima_gestion": _texto(fila, "ultima_gestion", 250),
+            "fecha_ultima_gestion": _fecha(fila, "fecha_ultima_gestion"),
+            "ingreso_juridico": _texto(fila, "ingreso_juridico", 100000),
+            "cliente_id": cliente_id,
+            "contraparte_id": None,
+            # Se resuelven en validar_lote y se quitan antes de insertar
+            "_cliente_rut": cliente_rut,
+            "_contraparte_rut": f"{contraparte_num}-{contraparte_dv}" if contraparte_num else None,
+        }
+
+    def validar_lote(self, pendientes):
+        por_rut = {r["_cliente_rut"] for _, r in pendientes if r["_cliente_rut"]}
+        por_id = {r["cliente_id"] for _, r in pendientes if not r["_cliente_rut"]}
+        contrapartes = {r["_contraparte_rut"] for _, r in pendientes if r["_contraparte_rut"]}
+
+        ids_cliente = dict(db.session.query(Cliente.rut_num, Cliente.id).filter(Cliente.rut_num.in_(por_rut)))
+        ids_validos = {i for (i,) in db.session.query(Cliente.id).filter(Cliente.id.in_(por_id))}
+        ids_contraparte = dict(
+            db.session.query(Contraparte.rut, Contraparte.id).filter(Contraparte.rut.in_(contrapartes))
+        )
+
+        errores = {}
+        for numero, r in pendientes:
+            rut = r.pop("_cliente_rut")
+            contraparte = r.pop("_contraparte_rut")
+            if rut:
+                r["cliente_id"] = ids_cliente.get(rut)
+                if r["cliente_id"] is None:
+                    errores[numero] = f"no existe un cliente con RUT {rut}"
+            elif r["cliente_id"] not in ids_validos:
+                errores[numero] = f"no existe el cliente {r['cliente_id']}"
+            if contraparte:
+                r["contraparte_id"] = ids_contraparte.get(contraparte)
+                if r["contraparte_id"] is None:
+                    errores.setdefault(numero, f"no existe una contraparte con RUT {contraparte}")
+        return errores
+
+    def insertadas(self, registros, ids):
+        # Como el formulario: la última gestión entra al historial y a la agenda
+        agenda.desde_causas([i for i, r in zip(ids, registros) if r["fecha_ultima_gestion"]])
+
+
+IMPORTADORES = {
+    "clientes": ImportadorClientes,
+    "contrapartes": ImportadorContrapartes,
+    "causas": ImportadorCausas,
+}
+
+# ===================== IMPORTACIÓN =====================
+
+def _lector(lineas):
+    lineas = iter(lineas)
+    encabezado = next(lineas, None)
+    if not encabezado or not encabezado.strip():
+        raise ErrorImportacion("El archivo está vacío.")
+    # Excel en español guarda los CSV separados por punto y coma
+    separador = ";" if encabezado.count(";") > encabezado.count(",") else ","
+    lector = csv.reader(itertools.chain([encabezado], lineas), delimiter=separador)
+    columnas = [c.strip().lstrip("\ufeff").lower() for c in next(lector)]
+    return columnas, lector
+
+def _ejecutar(importador, registros):
+    modelo = importador.modelo
+    ids = db.session.execute(
+        insert(modelo).returning(modelo.id, sort_by_parameter_order=True), registros
+    ).scalars().all()
+    resumen.contabilizar(modelo, registros)
+    importador.insertadas(registros, ids)
+
+def _insertar(importador, pendientes, reporte):
+    errores = importador.validar_lote(pendientes)
+    for numero, mensaje in errores.items():
+        reporte["errores"].append((numero, mensaje))
+    validos = [(n, r) for n, r in pendientes if n not in errores]
+    if not validos:
+        return
+    try:
+        _ejecutar(importador, [r for _, r in validos])
+        db.session.commit()
+        reporte["insertadas"] += len(validos)
+    except IntegrityError:
+        # Algo cambió entre la validación y el INSERT (otra importación en
+        # paralelo): se reintenta fila por fila para señalar las culpables
+        db.session.rollback()
+        for numero, registro in validos:
+            try:
+                with db.session.begin_nested():
+                    _ejecutar(importador, [registro])
+                reporte["insertadas"] += 1
+            except IntegrityError as e:
+                reporte["errores"].append((numero, f"rechazada por la base: {e.orig}"))
+        db.session.commit()
+
+def importar(tipo, lineas, lote=1000):
+    """Importa el CSV ``lineas`` (iterable de líneas de texto) como ``tipo``.
+
+    Devuelve el reporte ``{"filas", "insertadas", "errores"}``, donde
+    ``errores`` es una lista de (número de línea, mensaje) ordenada por línea.
+    """
+    if tipo not in IMPORTADORES:
+        raise ErrorImportacion(f"Tipo de importación desconocido: {tipo}")
+    importador = IMPORTADORES[tipo]()
+    columnas, lector = _lector(lineas)
+    faltantes = [
+        " o ".join(r) if isinstance(r, tuple) else r
+        for r in importador.requeridas
+        if not set(r if isinstance(r, tuple) else (r,)) & set(columnas)
+    ]
+    if faltantes:
+        raise ErrorImportacion(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+
+    reporte = {"filas": 0, "insertadas": 0, "errores": []}
+    pendientes = []
+    for valores in lector:
+        # Número de línea del archivo (un campo entre comillas puede ocupar varias)
+        numero = lector.line_num
+        if not any(v.strip() for v in valores):
+            continue
+        reporte["filas"] += 1
+        try:
+            pendientes.append((numero, importador.convertir(dict(zip(columnas, valores)))))
+        except ErrorFila as e:
+            reporte["errores"].append((numero, str(e)))
+        if len(pendientes) >= lote:
+            _insertar(importador, pendientes, reporte)
+            pendientes = []
+    if pendientes:
+        _insertar(importador, pendientes, reporte)
+
+    if reporte["insertadas"]:
+        cache.invalidar(*importador.grupos)
+    reporte["errores"].sort()
+    return reporte
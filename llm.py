@@ -0,0 +1,56 @@
+# llm.py
+
+import time
+
+from cliente_openai import obtener_cliente
+
+# ===================== PROVEEDORES =====================
+
+class ProveedorLLM:
+    """Genera respuestas de chat completas (``responder``) o token a token (``transmitir``)."""
+
+    def responder(self, mensajes):
+        return "".join(self.transmitir(mensajes))
+
+    def transmitir(self, mensajes):
+        raise NotImplementedError
+
+
+class LLMOpenAI(ProveedorLLM):
+    def __init__(self, cliente, modelo="gpt-3.5-turbo"):
+        self.cliente = cliente
+        self.modelo = modelo
+
+    def responder(self, mensajes):
+        return self.cliente.chat(mensajes, self.modelo)
+
+    def transmitir(self, mensajes):
+        return self.cliente.chat_stream(mensajes, self.modelo)
+
+
+class LLMLocal(ProveedorLLM):
+    """LLM falso y determinista que emite un token cada ``intervalo`` segundos.
+
+    Permite probar el streaming y medir latencias sin red ni API key.
+    """
+
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+
+    def transmitir(self, mensajes):
+        pregunta = mensajes[-1]["content"].rsplit("Responde:", 1)[-1].strip()
+        texto = f"Respuesta de prueba a «{pregunta}» según el fragmento [1]."
+        for i, palabra in enumerate(texto.split(" ")):
+            if self.intervalo:
+                time.sleep(self.intervalo)
+            yield palabra if i == 0 else " " + palabra
+
+
+def crear_llm(config):
+    """Construye el LLM indicado en IA_LLM (``openai`` o ``local``)."""
+    tipo = config.get("IA_LLM", "openai")
+    if tipo == "local":
+        return LLMLocal(intervalo=float(config.get("IA_LLM_INTERVALO") or 0.05))
+    if tipo == "openai":
+        return LLMOpenAI(obtener_cliente(config))
+    raise ValueError(f"Proveedor de LLM desconocido: {tipo}")
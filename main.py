@@ -1,7 +1,16 @@
 from flask import Flask, render_template, redirect, url_for
 import os
 import traceback
+from datetime import date, timedelta
 from dotenv import load_dotenv
+from sqlalchemy import func, or_
+from database import db
+from cache import cache
+from almacen import almacen
+import descargas
+from metricas import metricas
+from models import Cliente, Honorario, ResumenMensual, Gestion
+import agenda
 
 # Para almacenar detalles de la última excepción en el manejador 500
 ultimo_error = ""
@@ -19,32 +28,90 @@ def register_routes_generales(app):
     def logout():
         return redirect(url_for("login"))
 
+    MESES = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
+
+    def calcular_indicadores(hoy):
+        inicio_mes = hoy.replace(day=1)
+        # Primer día del mes, 7 meses atrás: el gráfico muestra 8 meses
+        anio, mes = divmod(inicio_mes.year * 12 + inicio_mes.month - 1 - 7, 12)
+        inicio_grafico = date(anio, mes + 1, 1)
+
+        clientes_nuevos = db.session.query(func.count(Cliente.id)).filter(Cliente.fecha_registro >= inicio_mes).scalar()
+        audiencias_proximas = db.session.query(func.count(Gestion.id)).filter(
+            Gestion.fecha >= hoy,
+            Gestion.fecha < hoy + timedelta(days=30),
+            Gestion.tipo == "audiencia",
+            Gestion.realizada.is_(False)
+        ).scalar()
+        honorarios_pendientes = db.session.query(func.count(Honorario.id)).filter(
+            or_(Honorario.estado.is_(None), Honorario.estado != "pagado")
+        ).scalar()
+
+        # Causas nuevas por mes desde el resumen mensual, sin agrupar causas
+        por_mes = {
+            (a, m): n
+            for a, m, n in db.session.query(
+                ResumenMensual.anio, ResumenMensual.mes, func.sum(ResumenMensual.causas_nuevas)
+            )
+            .filter(ResumenMensual.anio >= inicio_grafico.year)
+            .group_by(ResumenMensual.anio, ResumenMensual.mes)
+        }
+        causas_mes = por_mes.get((hoy.year, hoy.month), 0)
+        meses, grafico_causas = [], []
+        for i in range(8):
+            a, m = divmod(inicio_grafico.year * 12 + inicio_grafico.month - 1 + i, 12)
+            meses.append(MESES[m])
+            grafico_causas.append(por_mes.get((a, m + 1), 0))
+
+        return {
+            "causas_mes": causas_mes,
+            "clientes_nuevos": clientes_nuevos,
+            "audiencias_proximas": audiencias_proximas,
+            "honorarios_pendientes": honorarios_pendientes,
+            "meses": meses,
+            "grafico_causas": grafico_causas,
+            "recordatorios": agenda.recordatorios(hoy),
+        }
+
     @app.route("/dashboard")
     def dashboard():
-        causas_mes = 32
-        clientes_nuevos = 12
-        audiencias_proximas = 8
-        honorarios_pendientes = 15
-        meses = ["Jan", "Feb", "Mar", "Apr", "Mai", "Jun", "Jul", "Aug"]
-        grafico_causas = [3, 4, 6, 5, 9, 17, 11, 13]
-        recordatorios = [
-            {"texto": "Crear nuevo formato", "tag": "Hoy"},
-            {"texto": "Actualizar agenda", "tag": "Hoy"},
-            {"texto": "Revisar gestiones de causa", "tag": "2 días"},
-            {"texto": "Programar reunión con cliente", "tag": None},
-            {"texto": "Preparar informe semanal", "tag": "1 sema"}
-        ]
-        return render_template("dashboard.html", **locals())
-from flask import render_template, request, redirect, url_for, flash
+        hoy = date.today()
+        indicadores = cache.obtener(
+            f"dashboard:{hoy.isoformat()}",
+            ("causas", "clientes", "honorarios", "pagos", "resumen", "gestiones"),
+            lambda: calcular_indicadores(hoy)
+        )
+        return render_template("dashboard.html", **indicadores)
+from flask import render_template, request, redirect, url_for, flash, jsonify
 from models import Cliente
 from database import db
+from cache import cache
+from clientes import filtrar_clientes, buscar_clientes
+from paginacion import paginar_keyset
 from datetime import datetime
 
 def register_routes_clientes(app):
     @app.route("/clientes")
     def clientes():
-        lista = Cliente.query.all()
-        return render_template("clientes.html", clientes=lista)
+        texto = request.args.get("q", "").strip()
+        query = Cliente.query
+        if texto:
+            query = filtrar_clientes(query, texto)
+        lista = paginar_keyset(
+            query,
+            [Cliente.nombre_busqueda, Cliente.id],
+            cursor=request.args.get("cursor"),
+            limite=app.config["CLIENTES_POR_PAGINA"],
+            descendente=False
+        )
+        parametros = {"q": texto} if texto else {}
+        return render_template("clientes.html", clientes=lista, texto=texto, parametros=parametros)
+
+    @app.route("/api/clientes")
+    def api_clientes():
+        """Buscador de los formularios: solo id, nombre y RUT."""
+        limite = max(1, min(request.args.get("limite", 10, type=int), 50))
+        return jsonify(buscar_clientes(request.args.get("q", "").strip(), limite))
 
     @app.route("/registrar_cliente", methods=["POST"])
     def registrar_cliente():
@@ -61,15 +128,23 @@ def register_routes_clientes(app):
         )
         db.session.add(nuevo)
         db.session.commit()
+        cache.invalidar("clientes")
         flash("Cliente registrado correctamente.")
         return redirect(url_for("clientes"))
-from flask import render_template, request, redirect, url_for, flash
-from models import Causa, Cliente, Contraparte, Documento
+from flask import render_template, request, redirect, url_for, flash, jsonify
+from sqlalchemy.orm import joinedload, selectinload
+from models import Causa, Documento
 from database import db
+from cache import cache
+from almacen import almacen
+from descargas import enviar_archivo
 from datetime import datetime
-from werkzeug.utils import secure_filename
-import os
-import uuid
+from paginacion import paginar_keyset
+from clientes import etiqueta_cliente
+from opciones import opciones, buscar_causas
+import agenda
+import busqueda
+import resumen
 
 def register_routes_causas(app):
     @app.route("/causas", methods=["GET", "POST"])
@@ -94,149 +169,258 @@ def register_routes_causas(app):
                 contraparte_id=int(data["contraparte_id"]) if data.get("contraparte_id") else None
             )
 
+            # Causa, documentos, referencias del almacén e índice de búsqueda
+            # se confirman juntos en un solo commit
             db.session.add(nueva_causa)
-            db.session.commit()
+            db.session.flush()
+            resumen.contabilizar(Causa, [nueva_causa])
 
             archivos = request.files.getlist("documentos")
             for archivo in archivos:
                 if archivo and archivo.filename != "":
-                    nombre_original = archivo.filename
-                    nombre_unico = f"{uuid.uuid4().hex}_{secure_filename(nombre_original)}"
-                    ruta = os.path.join("static", "documentos", nombre_unico)
-                    archivo.save(ruta)
-
+                    sha, tamano = almacen.guardar(archivo.stream)
+                    almacen.registrar(sha, tamano)
                     nuevo_doc = Documento(
                         causa_id=nueva_causa.id,
-                        nombre_archivo=nombre_original,
-                        ruta_archivo=ruta,
+                        nombre_archivo=archivo.filename,
+                        ruta=almacen.ruta(sha),
+                        sha256=sha,
                         tipo="prueba habilitante"
                     )
                     db.session.add(nuevo_doc)
+                    db.session.flush()
+                    busqueda.indexar(
+                        busqueda.DOCUMENTO, nuevo_doc.id, nuevo_doc.nombre_archivo, nuevo_doc.ruta,
+                        nueva_causa.id, sha=sha
+                    )
+
+            # La gestión del formulario entra al historial y a la agenda
+            agenda.desde_causas([nueva_causa.id])
 
             db.session.commit()
+            cache.invalidar("causas", "gestiones")
             flash("✅ Causa registrada correctamente.")
             return redirect(url_for("causas"))
 
-        causas = Causa.query.all()
-        clientes = Cliente.query.all()
-        contrapartes = Contraparte.query.all()
-        return render_template("causas.html", causas=causas, clientes=clientes, contrapartes=contrapartes)
-from flask import render_template, request, redirect, url_for, flash
+        filtros = {
+            "tribunal": request.args.get("tribunal", "").strip(),
+            "rol": request.args.get("rol", "").strip(),
+            "tipo_causa": request.args.get("tipo_causa", "").strip(),
+            "cliente_id": request.args.get("cliente_id", "").strip(),
+        }
+
+        # Cliente y documentos se cargan junto a la página: 2 consultas en total,
+        # no 2 por cada causa
+        query = Causa.query.options(joinedload(Causa.cliente), selectinload(Causa.documentos))
+        if filtros["tribunal"]:
+            query = query.filter(Causa.tribunal == filtros["tribunal"])
+        if filtros["rol"]:
+            query = query.filter(Causa.rol_numero == filtros["rol"])
+        if filtros["tipo_causa"]:
+            query = query.filter(Causa.tipo_causa == filtros["tipo_causa"])
+        if filtros["cliente_id"].isdigit():
+            query = query.filter(Causa.cliente_id == int(filtros["cliente_id"]))
+
+        causas = paginar_keyset(
+            query,
+            [Causa.fecha_ingreso, Causa.id],
+            cursor=request.args.get("cursor"),
+            limite=app.config["CAUSAS_POR_PAGINA"]
+        )
+        contrapartes = opciones("contrapartes")
+        parametros = {k: v for k, v in filtros.items() if v}
+        return render_template(
+            "causas.html", causas=causas, contrapartes=contrapartes,
+            cliente_etiqueta=etiqueta_cliente(filtros["cliente_id"]),
+            filtros=filtros, parametros=parametros
+        )
+
+    @app.route("/api/causas")
+    def api_causas():
+        """Buscador de causas de los formularios: solo id y etiqueta."""
+        limite = max(1, min(request.args.get("limite", 10, type=int), 50))
+        return jsonify(buscar_causas(request.args.get("q", ""), limite))
+
+    @app.route("/documentos/<int:id>")
+    def descargar_documento(id):
+        documento = Documento.query.get_or_404(id)
+        return enviar_archivo(documento.ruta, documento.nombre_archivo, sha=documento.sha256)
+
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 import os
-import openai
-import numpy as np
-import PyPDF2
-import docx
-import tiktoken
+import json
+from werkzeug.utils import secure_filename
 from database import db
+from ia_servicios import ServiciosIA, precargar
 
 def register_routes_ia(app):
-    def extraer_texto(path):
-        if path.endswith(".pdf"):
-            with open(path, "rb") as f:
-                lector = PyPDF2.PdfReader(f)
-                return " ".join([p.extract_text() or "" for p in lector.pages])
-        elif path.endswith(".docx"):
-            doc = docx.Document(path)
-            return "\n".join([p.text for p in doc.paragraphs])
-        elif path.endswith(".txt"):
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
-        else:
-            return ""
-
-    def dividir_en_chunks(texto, max_tokens=500):
-        tokenizer = tiktoken.get_encoding("cl100k_base")
-        palabras = texto.split(".")
-        chunks = []
-        actual = ""
-        for p in palabras:
-            if len(tokenizer.encode(actual + p)) < max_tokens:
-                actual += p + "."
-            else:
-                chunks.append(actual.strip())
-                actual = p + "."
-        if actual:
-            chunks.append(actual.strip())
-        return chunks
-
-    def obtener_embedding(texto):
-        return openai.Embedding.create(
-            input=texto,
-            model="text-embedding-ada-002"
-        )["data"][0]["embedding"]
-
-    def similitud_coseno(a, b):
-        a = np.array(a)
-        b = np.array(b)
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+    # El stack de IA se carga con la primera ruta de IA, no al arrancar el worker
+    servicios = ServiciosIA(app.config)
+    if app.config["IA_PRECARGAR"]:
+        precargar()
+
+    @app.cli.command("ia-worker")
+    def ia_worker():
+        """Procesa la cola de ingesta IA en un proceso dedicado."""
+        from ia_tareas import ColaIngesta
+        ColaIngesta(
+            app.config["IA_TAREAS_DB"],
+            app.config,
+            procesos=app.config["IA_TAREAS_PROCESOS"]
+        ).trabajar()
 
     @app.route("/ia")
     def ia():
         archivos = [f for f in os.listdir("static/ia") if f != ".keep"]
-        return render_template("ia.html", archivos=archivos)
+        return render_template("ia.html", archivos=archivos, estados=servicios.cola.estados())
+
+    @app.route("/ia/estado")
+    def ia_estado():
+        return jsonify(servicios.cola.estados())
+
+    @app.route("/ia/cache")
+    def ia_cache():
+        return jsonify(servicios.cache.estadisticas())
 
     @app.route("/subir_ia", methods=["POST"])
     def subir_ia():
         archivo = request.files["archivo"]
         if archivo:
-            ruta = os.path.join("static/ia", archivo.filename)
-            archivo.save(ruta)
-            flash("✅ Archivo IA subido exitosamente.")
+            nombre = secure_filename(archivo.filename)
+            ruta = os.path.join("static/ia", nombre)
+            sha, tamano = almacen.guardar(archivo.stream)
+            # Reemplazar un archivo con el mismo nombre suelta su contenido anterior
+            if os.path.exists(ruta):
+                almacen.liberar(almacen.sha_de(ruta))
+            almacen.registrar(sha, tamano)
+            almacen.enlazar(sha, ruta)
+            db.session.commit()
+            servicios.cola.encolar(nombre, ruta)
+            flash("✅ Archivo IA subido exitosamente. Se está procesando para poder consultarlo.")
         return redirect(url_for("ia"))
 
     @app.route("/eliminar_ia/<nombre>")
     def eliminar_ia(nombre):
         ruta = os.path.join("static/ia", nombre)
         if os.path.exists(ruta):
+            almacen.liberar(almacen.sha_de(ruta))
             os.remove(ruta)
+            db.session.commit()
             flash("🗑️ Archivo IA eliminado correctamente.")
+        servicios.indice.eliminar(nombre)
         return redirect(url_for("ia"))
 
+    def archivos_consultables():
+        archivos = [f for f in os.listdir("static/ia") if f.endswith((".pdf", ".docx", ".txt"))]
+        # Archivos subidos antes de existir el índice: se encolan una vez
+        en_cola = servicios.cola.en_cola()
+        for nombre in servicios.indice.pendientes(archivos):
+            if nombre not in en_cola:
+                servicios.cola.encolar(nombre, os.path.join("static/ia", nombre))
+        return archivos
+
+    def recuperar(pregunta):
+        version = servicios.indice.version()
+        vector = servicios.indice.embeber_consulta(pregunta)
+        fuentes = servicios.indice.buscar(vector, k=app.config["IA_TOP_K"])
+        return version, vector, fuentes
+
+    def mensajes(pregunta, fuentes):
+        contexto = "\n\n".join(
+            f"[{i}] {f['archivo']} (fragmento {f['posicion'] + 1}):\n{f['texto']}"
+            for i, f in enumerate(fuentes, 1)
+        )
+        return [
+            {"role": "system", "content": "Eres un asistente legal que responde en lenguaje claro. "
+                                          "Cita los fragmentos que uses con su número entre corchetes, por ejemplo [1]."},
+            {"role": "user", "content": f"Basado en estos fragmentos:\n\n{contexto}\n\nResponde: {pregunta}"}
+        ]
+
     @app.route("/preguntar_ia", methods=["POST"])
     def preguntar_ia():
         pregunta = request.form["pregunta"]
 
-        archivos = sorted(
-            [f for f in os.listdir("static/ia") if f.endswith((".pdf", ".docx", ".txt"))],
-            key=lambda f: os.path.getmtime(os.path.join("static/ia", f)),
-            reverse=True
-        )
-
-        if not archivos:
+        if not archivos_consultables():
             flash("⚠️ No hay archivos para consultar.")
             return redirect(url_for("ia"))
 
         try:
-            texto = extraer_texto(os.path.join("static/ia", archivos[0]))
-            chunks = dividir_en_chunks(texto)
-            chunks = chunks[:30]
-
-            embeddings = [obtener_embedding(c) for c in chunks]
-            pregunta_embedding = obtener_embedding(pregunta)
-
-            top_chunk = chunks[np.argmax([similitud_coseno(e, pregunta_embedding) for e in embeddings])]
-
-            respuesta = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Eres un asistente legal que responde en lenguaje claro."},
-                    {"role": "user", "content": f"Basado en este texto: {top_chunk}\n\nResponde: {pregunta}"}
-                ]
-            )["choices"][0]["message"]["content"]
-        except Exception as e:
+            version, vector, fuentes = recuperar(pregunta)
+            if not fuentes:
+                flash("⚠️ Los archivos aún se están procesando o no contienen texto para consultar.")
+                return redirect(url_for("ia"))
+
+            clave = servicios.cache.clave_chunks(fuentes)
+            respuesta = servicios.cache.buscar(vector, version, clave)
+            if respuesta is None:
+                respuesta = servicios.llm.responder(mensajes(pregunta, fuentes))
+                servicios.cache.guardar(vector, version, clave, pregunta, respuesta)
+        except Exception:
             flash("❌ Error al procesar la pregunta. Intenta nuevamente más tarde.")
-            print("ERROR en /preguntar_ia:", e)
+            app.logger.exception("Error en /preguntar_ia")
             return redirect(url_for("ia"))
 
         archivos = [f for f in os.listdir("static/ia") if f != ".keep"]
-        return render_template("ia.html", archivos=archivos, respuesta=respuesta)
+        return render_template(
+            "ia.html", archivos=archivos, estados=servicios.cola.estados(), respuesta=respuesta, fuentes=fuentes
+        )
+
+    @app.route("/preguntar_ia/stream", methods=["POST"])
+    def preguntar_ia_stream():
+        pregunta = request.form["pregunta"]
+
+        def evento(nombre, datos):
+            return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+        def generar():
+            if not archivos_consultables():
+                yield evento("error", "No hay archivos para consultar.")
+                return
+            try:
+                version, vector, fuentes = recuperar(pregunta)
+                if not fuentes:
+                    yield evento("error", "Los archivos aún se están procesando o no contienen texto para consultar.")
+                    return
+
+                # Las fuentes salen antes que el primer token del LLM
+                yield evento("fuentes", [
+                    {"archivo": f["archivo"], "posicion": f["posicion"], "puntaje": round(f["puntaje"], 4)}
+                    for f in fuentes
+                ])
+
+                clave = servicios.cache.clave_chunks(fuentes)
+                respuesta = servicios.cache.buscar(vector, version, clave)
+                if respuesta is not None:
+                    yield evento("token", respuesta)
+                    yield evento("fin", {"cache": True})
+                    return
+
+                partes = []
+                for token in servicios.llm.transmitir(mensajes(pregunta, fuentes)):
+                    partes.append(token)
+                    yield evento("token", token)
+                servicios.cache.guardar(vector, version, clave, pregunta, "".join(partes))
+                yield evento("fin", {"cache": False})
+            except Exception:
+                app.logger.exception("Error en /preguntar_ia/stream")
+                yield evento("error", "Error al procesar la pregunta. Intenta nuevamente más tarde.")
+
+        return Response(
+            stream_with_context(generar()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 from flask import render_template, request, redirect, url_for, flash
 from werkzeug.utils import secure_filename
-from models import FormatoLegal, Causa
+from models import FormatoLegal
 from database import db
+from almacen import almacen
+from descargas import enviar_archivo
+from opciones import opciones_html
 from datetime import datetime
+import busqueda
 import os
+import uuid
 
 def register_routes_formatos(app):
     def allowed_file(filename):
@@ -249,31 +433,47 @@ def register_routes_formatos(app):
         filtro_causa = request.args.get("causa_id", "").strip()
 
         query = FormatoLegal.query
+        fragmentos = {}
 
-        if filtro_nombre:
-            query = query.filter(FormatoLegal.nombre_original.ilike(f"%{filtro_nombre}%"))
         if filtro_usuario:
             query = query.filter(FormatoLegal.usuario.ilike(f"%{filtro_usuario}%"))
         if filtro_causa:
             query = query.filter(FormatoLegal.causa_id == int(filtro_causa))
 
-        formatos = query.order_by(FormatoLegal.fecha_subida.desc()).all()
-        causas = Causa.query.order_by(Causa.id.desc()).all()
-
+        if filtro_nombre:
+            # Nombre y contenido del archivo, por relevancia
+            resultados = busqueda.buscar(
+                filtro_nombre, causa_id=int(filtro_causa) if filtro_causa else None,
+                tipo=busqueda.FORMATO, limite=100
+            )
+            fragmentos = {r["ref_id"]: r["fragmento"] for r in resultados}
+            por_id = {f.id: f for f in query.filter(FormatoLegal.id.in_(fragmentos)).all()}
+            formatos = [por_id[i] for i in fragmentos if i in por_id]
+        else:
+            formatos = query.order_by(FormatoLegal.fecha_subida.desc()).all()
         return render_template(
             "formatos.html",
             formatos=formatos,
-            causas=causas,
+            fragmentos=fragmentos,
+            causas_filtro=opciones_html("causas", filtro_causa),
+            causas_opciones=opciones_html("causas"),
             filtro_nombre=filtro_nombre,
             filtro_usuario=filtro_usuario,
             filtro_causa=filtro_causa
         )
 
+    @app.route("/formatos/<int:id>/archivo")
+    def descargar_formato(id):
+        formato = FormatoLegal.query.get_or_404(id)
+        if formato.sha256:
+            return enviar_archivo(almacen.ruta(formato.sha256), formato.nombre_original, sha=formato.sha256)
+        return enviar_archivo(os.path.join("static", "formatos", formato.filename), formato.nombre_original)
+
     @app.route("/subir_formato", methods=["POST"])
     def subir_formato():
         archivo = request.files.get("archivo")
         usuario = request.form.get("usuario")
-        causa_id = request.form.get("causa_id") or None
+        causa_id = int(request.form["causa_id"]) if request.form.get("causa_id") else None
         observaciones = request.form.get("observaciones")
 
         if not archivo or not usuario:
@@ -281,19 +481,24 @@ def register_routes_formatos(app):
             return redirect(url_for("formatos"))
 
         if archivo and allowed_file(archivo.filename):
-            filename = secure_filename(archivo.filename)
-            path = os.path.join("static", "formatos", filename)
-            archivo.save(path)
-
+            # Un mismo contenido subido varias veces se guarda una sola vez;
+            # filename queda como nombre lógico único del formato
+            sha, tamano = almacen.guardar(archivo.stream)
+            almacen.registrar(sha, tamano)
             nuevo = FormatoLegal(
                 nombre_original=archivo.filename,
-                filename=filename,
+                filename=f"{uuid.uuid4().hex}_{secure_filename(archivo.filename)}",
+                sha256=sha,
                 usuario=usuario,
                 causa_id=causa_id,
                 observaciones=observaciones,
                 fecha_subida=datetime.utcnow()
             )
             db.session.add(nuevo)
+            db.session.flush()
+            busqueda.indexar(
+                busqueda.FORMATO, nuevo.id, nuevo.nombre_original, almacen.ruta(sha), nuevo.causa_id, sha=sha
+            )
             db.session.commit()
             flash("✅ Formato subido correctamente.")
         else:
@@ -305,41 +510,151 @@ def register_routes_formatos(app):
     def eliminar_formato(id):
         formato = FormatoLegal.query.get(id)
         if formato:
-            ruta = os.path.join("static", "formatos", formato.filename)
-            if os.path.exists(ruta):
-                os.remove(ruta)
+            if formato.sha256:
+                almacen.liberar(formato.sha256)
+            else:
+                # Formato subido antes del almacén
+                ruta = os.path.join("static", "formatos", formato.filename)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            busqueda.eliminar(busqueda.FORMATO, formato.id)
             db.session.delete(formato)
             db.session.commit()
             flash("🗑️ Formato eliminado correctamente.")
         return redirect(url_for("formatos"))
-from flask import render_template, request, redirect, url_for, make_response, flash
-from models import Cliente, Causa, Honorario, PagoCuota
+from flask import render_template, request, url_for
+from opciones import opciones_html
+import busqueda
+
+def register_routes_busqueda(app):
+    @app.cli.command("reindexar-busqueda")
+    def reindexar_busqueda():
+        """Reconstruye el índice de texto completo de formatos y documentos."""
+        total = busqueda.reindexar()
+        print(f"✅ {total} archivos indexados.")
+
+    @app.route("/buscar")
+    def buscar():
+        consulta = request.args.get("q", "").strip()
+        filtro_causa = request.args.get("causa_id", "").strip()
+        filtro_tipo = request.args.get("tipo", "").strip()
+
+        resultados = []
+        if consulta:
+            resultados = busqueda.buscar(
+                consulta,
+                causa_id=int(filtro_causa) if filtro_causa.isdigit() else None,
+                tipo=filtro_tipo if filtro_tipo in (busqueda.FORMATO, busqueda.DOCUMENTO) else None,
+                limite=50
+            )
+
+            # Cada resultado se descarga por su propia ruta, sin consultar el archivo
+            for r in resultados:
+                if r["tipo"] == busqueda.FORMATO:
+                    r["archivo"] = url_for("descargar_formato", id=r["ref_id"])
+                else:
+                    r["archivo"] = url_for("descargar_documento", id=r["ref_id"])
+
+        return render_template(
+            "busqueda.html",
+            resultados=resultados,
+            causas_opciones=opciones_html("causas", filtro_causa),
+            consulta=consulta,
+            filtro_causa=filtro_causa,
+            filtro_tipo=filtro_tipo
+        )
+from flask import render_template, request, redirect, url_for, flash, Response, stream_with_context
+from sqlalchemy import func, case
+from sqlalchemy.orm import joinedload
+from models import Cliente, Causa, Honorario, PagoCuota, Gasto
 from database import db
+from cache import cache
+from paginacion import paginar_keyset
+from clientes import etiqueta_cliente
+from opciones import opciones_html
+import cobranza
+import resumen
 from datetime import datetime, date
 import csv
 import io
 
 def register_routes_facturacion(app):
+    @app.cli.command("cobranza-vencimientos")
+    def cobranza_vencimientos():
+        """Marca las cuotas vencidas y recalcula estados y antigüedad de saldos."""
+        vencidas = cobranza.marcar_vencidas()
+        cache.invalidar("honorarios")
+        cache.invalidar("pagos")
+        print(f"✅ {vencidas} cuotas vencidas.")
+
     @app.route("/facturacion", methods=["GET", "POST"])
     def facturacion():
-        clientes = Cliente.query.all()
-        selected_cliente = request.args.get('cliente_id')
-        selected_estado = request.args.get('estado')
+        selected_cliente = request.args.get('cliente_id', '')
+        selected_estado = request.args.get('estado', '')
 
         honorarios_query = Honorario.query
         pagos_query = PagoCuota.query
 
         if selected_cliente:
-            honorarios_query = honorarios_query.filter_by(cliente_id=selected_cliente)
-            pagos_query = pagos_query.join(Honorario).filter(Honorario.cliente_id == selected_cliente)
+            honorarios_query = honorarios_query.filter(Honorario.cliente_id == selected_cliente)
+            pagos_query = pagos_query.filter(PagoCuota.cliente_id == selected_cliente)
 
         if selected_estado:
-            pagos_query = pagos_query.filter_by(estado=selected_estado)
-
-        honorarios = honorarios_query.order_by(Honorario.fecha_emision.desc()).all()
-        pagos = pagos_query.order_by(PagoCuota.fecha_pago.desc()).all()
+            pagos_query = pagos_query.filter(PagoCuota.estado == selected_estado)
+
+        # Totales calculados por la base de datos con los mismos filtros
+        total_facturado = honorarios_query.with_entities(
+            func.coalesce(func.sum(Honorario.monto_total), 0)
+        ).scalar()
+        total_pagado, cuotas_vencidas = pagos_query.with_entities(
+            func.coalesce(func.sum(PagoCuota.monto_pagado), 0),
+            func.coalesce(func.sum(case((PagoCuota.estado == 'vencida', 1), else_=0)), 0)
+        ).one()
+        total_gastos = db.session.query(func.coalesce(func.sum(Gasto.monto), 0)).scalar()
+        balance = total_pagado - total_gastos
+        antiguedad = cobranza.resumen_antiguedad(selected_cliente)
+
+        por_pagina = app.config["FACTURACION_POR_PAGINA"]
+        honorarios = paginar_keyset(
+            honorarios_query.options(joinedload(Honorario.cliente), joinedload(Honorario.causa)),
+            [Honorario.fecha_emision, Honorario.id],
+            cursor=request.args.get('cursor_h'),
+            limite=por_pagina
+        )
+        pagos = paginar_keyset(
+            pagos_query.options(joinedload(PagoCuota.cliente), joinedload(PagoCuota.honorario)),
+            [PagoCuota.id],
+            cursor=request.args.get('cursor_p'),
+            limite=por_pagina
+        )
+        gastos = paginar_keyset(
+            Gasto.query,
+            [Gasto.fecha, Gasto.id],
+            cursor=request.args.get('cursor_g'),
+            limite=por_pagina
+        )
 
-        return render_template("facturacion.html", **locals())
+        parametros = {
+            k: v for k, v in request.args.items()
+            if k in ('cliente_id', 'estado', 'cursor_h', 'cursor_p', 'cursor_g') and v
+        }
+        return render_template(
+            "facturacion.html",
+            cliente_etiqueta=etiqueta_cliente(selected_cliente),
+            selected_cliente=selected_cliente,
+            selected_estado=selected_estado,
+            total_facturado=total_facturado,
+            total_pagado=total_pagado,
+            cuotas_vencidas=cuotas_vencidas,
+            antiguedad=antiguedad,
+            total_gastos=total_gastos,
+            balance=balance,
+            honorarios=honorarios,
+            pagos=pagos,
+            gastos=gastos,
+            parametros=parametros,
+            date_today=date.today()
+        )
 
     @app.route('/registrar_honorario', methods=['GET', 'POST'])
     def registrar_honorario():
@@ -350,18 +665,23 @@ def register_routes_facturacion(app):
                 causa_id=data.get('causa_id') or None,
                 descripcion=data['descripcion'],
                 monto_total=float(data['monto_total']),
-                fecha_emision=data.get('fecha_emision') or date.today(),
+                fecha_emision=date.fromisoformat(data['fecha_emision']) if data.get('fecha_emision') else date.today(),
                 en_cuotas=data.get('en_cuotas') == 'on',
                 numero_cuotas=int(data.get('numero_cuotas') or 1),
                 estado='pendiente'
             )
             db.session.add(nuevo_honorario)
+            cobranza.crear_cuotas(nuevo_honorario)
+            resumen.contabilizar(Honorario, [nuevo_honorario])
+            cobranza.recalcular_antiguedad(cliente_id=nuevo_honorario.cliente_id)
             db.session.commit()
+            cache.invalidar("honorarios")
+            cache.invalidar("pagos")
             return redirect(url_for('facturacion'))
 
-        clientes = Cliente.query.all()
-        causas = Causa.query.all()
-        return render_template('registrar_honorario.html', clientes=clientes, causas=causas, date_today=date.today())
+        return render_template(
+            'registrar_honorario.html', causas_opciones=opciones_html("causas"), date_today=date.today()
+        )
 
     @app.route('/registrar_pago/<int:honorario_id>', methods=['GET', 'POST'])
     def registrar_pago(honorario_id):
@@ -369,47 +689,325 @@ def register_routes_facturacion(app):
 
         if request.method == 'POST':
             data = request.form
-            nuevo_pago = PagoCuota(
-                honorario_id=honorario.id,
-                cliente_id=honorario.cliente_id,
-                numero_cuota=int(data['numero_cuota']),
-                monto_pagado=float(data['monto_pagado']),
-                fecha_pago=data.get('fecha_pago') or datetime.utcnow().date(),
-                vencimiento=data.get('vencimiento') or datetime.utcnow().date(),
-                estado='pagado'
+            cobranza.registrar_pago(
+                honorario,
+                int(data['numero_cuota']),
+                float(data['monto_pagado']),
+                date.fromisoformat(data['fecha_pago']) if data.get('fecha_pago') else date.today(),
+                vencimiento=date.fromisoformat(data['vencimiento']) if data.get('vencimiento') else None
             )
-            db.session.add(nuevo_pago)
             db.session.commit()
+            cache.invalidar("honorarios")
+            cache.invalidar("pagos")
             return redirect(url_for('facturacion'))
 
-        return render_template('registrar_pago.html', honorario=honorario)
+        cuotas = PagoCuota.query.filter(
+            PagoCuota.honorario_id == honorario.id, PagoCuota.estado != 'pagado'
+        ).order_by(PagoCuota.cuota_numero).all()
+        return render_template('registrar_pago.html', honorario=honorario, cuotas=cuotas, date_today=date.today())
 
     @app.route('/exportar_facturacion')
     def exportar_facturacion():
-        honorarios = Honorario.query.all()
-        si = io.StringIO()
-        cw = csv.writer(si)
-        cw.writerow(['Cliente', 'Causa', 'Descripción', 'Monto', 'Fecha', 'Cuotas', 'Estado'])
-
-        for h in honorarios:
-            cw.writerow([
-                h.cliente_id,
-                h.causa.rol_numero if h.causa else 'Sin causa',
-                h.descripcion,
-                h.monto_total,
-                h.fecha_emision,
-                h.numero_cuotas,
-                h.estado
-            ])
-
-        output = make_response(si.getvalue())
-        output.headers["Content-Disposition"] = "attachment; filename=facturacion.csv"
-        output.headers["Content-type"] = "text/csv"
-        return output
+        selected_cliente = request.args.get('cliente_id', '')
+        selected_estado = request.args.get('estado', '')
+        try:
+            desde = datetime.strptime(request.args['desde'], "%Y-%m-%d").date() if request.args.get('desde') else None
+            hasta = datetime.strptime(request.args['hasta'], "%Y-%m-%d").date() if request.args.get('hasta') else None
+        except ValueError:
+            flash("❌ Rango de fechas inválido.")
+            return redirect(url_for('facturacion'))
+        incluir_pagos = request.args.get('pagos') == '1'
+        incluir_gastos = request.args.get('gastos') == '1'
+
+        def rango(columna, query):
+            if desde:
+                query = query.filter(columna >= desde)
+            if hasta:
+                query = query.filter(columna <= hasta)
+            return query
+
+        # Consultas de columnas (sin objetos ORM) con cliente y causa unidos;
+        # yield_per las lee por bloques con un cursor del lado del servidor
+        honorarios = db.session.query(
+            Cliente.nombre, Causa.rol_numero, Honorario.descripcion, Honorario.monto_total,
+            Honorario.fecha_emision, Honorario.numero_cuotas, Honorario.estado
+        ).join(Cliente, Honorario.cliente_id == Cliente.id).outerjoin(Causa, Honorario.causa_id == Causa.id)
+        if selected_cliente:
+            honorarios = honorarios.filter(Honorario.cliente_id == selected_cliente)
+        honorarios = rango(Honorario.fecha_emision, honorarios).order_by(Honorario.fecha_emision, Honorario.id)
+
+        pagos = db.session.query(
+            Cliente.nombre, Honorario.descripcion, PagoCuota.cuota_numero, PagoCuota.monto_pagado,
+            PagoCuota.fecha_pago, PagoCuota.vencimiento, PagoCuota.estado
+        ).join(Cliente, PagoCuota.cliente_id == Cliente.id).join(Honorario, PagoCuota.honorario_id == Honorario.id)
+        if selected_cliente:
+            pagos = pagos.filter(PagoCuota.cliente_id == selected_cliente)
+        if selected_estado:
+            pagos = pagos.filter(PagoCuota.estado == selected_estado)
+        pagos = rango(PagoCuota.fecha_pago, pagos).order_by(PagoCuota.fecha_pago, PagoCuota.id)
+
+        gastos = db.session.query(Gasto.descripcion, Gasto.monto, Gasto.categoria, Gasto.fecha)
+        gastos = rango(Gasto.fecha, gastos).order_by(Gasto.fecha, Gasto.id)
+
+        secciones = [
+            (None, ['Cliente', 'Causa', 'Descripción', 'Monto', 'Fecha', 'Cuotas', 'Estado'],
+             honorarios, lambda f: [f[0], f[1] or 'Sin causa', *f[2:]]),
+        ]
+        if incluir_pagos:
+            secciones.append(('Pagos', ['Cliente', 'Honorario', 'Cuota', 'Monto pagado', 'Fecha de pago',
+                                        'Vencimiento', 'Estado'], pagos, list))
+        if incluir_gastos:
+            secciones.append(('Gastos', ['Descripción', 'Monto', 'Categoría', 'Fecha'], gastos, list))
+
+        def generar():
+            si = io.StringIO()
+            cw = csv.writer(si)
+
+            def vaciar():
+                datos = si.getvalue()
+                si.seek(0)
+                si.truncate(0)
+                return datos
+
+            for titulo, encabezado, query, fila_csv in secciones:
+                if titulo:
+                    cw.writerow([])
+                    cw.writerow([titulo])
+                cw.writerow(encabezado)
+                for n, fila in enumerate(query.execution_options(yield_per=1000), 1):
+                    cw.writerow(fila_csv(fila))
+                    if n % 1000 == 0:
+                        yield vaciar()
+                yield vaciar()
+
+        return Response(
+            stream_with_context(generar()),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=facturacion.csv"}
+        )
+from flask import render_template, request, redirect, url_for, flash, Response
+from models import Causa, Gestion
+from database import db
+from cache import cache
+from opciones import opciones_html
+from clientes import etiqueta_cliente
+from datetime import date, datetime, timezone
+import hashlib
+import agenda
+
+def register_routes_agenda(app):
+    @app.route("/agenda", methods=["GET", "POST"])
+    def ver_agenda():
+        if request.method == "POST":
+            data = request.form
+            causa = Causa.query.get_or_404(int(data["causa_id"]))
+            gestion = Gestion(
+                causa_id=causa.id,
+                cliente_id=causa.cliente_id,
+                tipo=data.get("tipo") if data.get("tipo") in agenda.TIPOS else "gestion",
+                titulo=data["titulo"].strip(),
+                fecha=date.fromisoformat(data["fecha"]),
+                hora=datetime.strptime(data["hora"], "%H:%M").time() if data.get("hora") else None,
+                lugar=data.get("lugar") or None,
+                responsable=data.get("responsable", "").strip() or None,
+                realizada=data.get("realizada") == "on",
+                observaciones=data.get("observaciones") or None
+            )
+            gestion.causa = causa
+            db.session.add(gestion)
+            agenda.actualizar_causa(gestion)
+            db.session.commit()
+            cache.invalidar("gestiones", "causas")
+            flash("✅ Gestión agendada.")
+            return redirect(url_for("ver_agenda", **{k: v for k, v in request.args.items() if v}))
+
+        hoy = date.today()
+        filtros = {
+            "responsable": request.args.get("responsable", "").strip(),
+            "cliente_id": request.args.get("cliente_id", "").strip(),
+            "causa_id": request.args.get("causa_id", "").strip(),
+        }
+        dias = min(max(request.args.get("dias", 30, type=int), 1), 365)
+        if filtros["causa_id"].isdigit():
+            # Historial completo de una causa, de la más reciente a la más antigua
+            gestiones = agenda.en_rango(
+                date.min, date.max, causa_id=int(filtros["causa_id"])
+            ).order_by(None).order_by(Gestion.fecha.desc(), Gestion.id.desc()).all()
+        else:
+            gestiones = agenda.proximas(
+                hoy, dias,
+                responsable=filtros["responsable"] or None,
+                cliente_id=int(filtros["cliente_id"]) if filtros["cliente_id"].isdigit() else None
+            ).all()
+        parametros = {k: v for k, v in filtros.items() if v}
+        return render_template(
+            "agenda.html",
+            gestiones=gestiones,
+            filtros=filtros,
+            dias=dias,
+            tipos=agenda.TIPOS,
+            hoy=hoy,
+            cliente_etiqueta=etiqueta_cliente(filtros["cliente_id"]),
+            causas_opciones=opciones_html("causas", filtros["causa_id"]),
+            ics=url_for("agenda_ics", _external=True, **{k: v for k, v in parametros.items() if k != "causa_id"}),
+            parametros=parametros
+        )
+
+    @app.route("/gestiones/<int:id>/realizada", methods=["POST"])
+    def marcar_gestion(id):
+        gestion = Gestion.query.get_or_404(id)
+        gestion.realizada = True
+        agenda.actualizar_causa(gestion)
+        db.session.commit()
+        cache.invalidar("gestiones", "causas")
+        flash("✅ Gestión marcada como realizada.")
+        return redirect(request.referrer or url_for("ver_agenda"))
+
+    @app.route("/gestiones/<int:id>/eliminar", methods=["POST"])
+    def eliminar_gestion(id):
+        gestion = Gestion.query.get_or_404(id)
+        agenda.eliminar(gestion)
+        db.session.commit()
+        cache.invalidar("gestiones", "causas")
+        flash("🗑️ Gestión eliminada.")
+        return redirect(request.referrer or url_for("ver_agenda"))
+
+    @app.route("/agenda.ics")
+    def agenda_ics():
+        # Los calendarios de los teléfonos lo piden cada pocos minutos: si las
+        # gestiones no cambiaron se responde 304 solo con el sello del cache,
+        # y si cambiaron el ICS se genera una vez para todos los workers
+        hoy = date.today()
+        responsable = request.args.get("responsable", "").strip() or None
+        cliente_id = request.args.get("cliente_id", type=int)
+        clave = f"agenda_ics:{hoy.isoformat()}:{responsable}:{cliente_id}"
+        grupos = ("gestiones", "causas")
+        sello = cache.sello(*grupos)
+        etag = hashlib.sha256(f"{clave}|{sello}".encode()).hexdigest()[:32]
+
+        if request.if_none_match.contains(etag):
+            respuesta = Response(status=304)
+        else:
+            def generar():
+                return {
+                    "ics": agenda.calendario(hoy, responsable, cliente_id),
+                    "generado": int(datetime.now(timezone.utc).timestamp()),
+                }
+            datos = cache.obtener(clave, grupos, generar, sello=sello)
+            respuesta = Response(datos["ics"], mimetype="text/calendar")
+            respuesta.last_modified = datetime.fromtimestamp(datos["generado"], timezone.utc)
+            respuesta.headers["Content-Disposition"] = "inline; filename=agenda.ics"
+        respuesta.set_etag(etag)
+        respuesta.cache_control.private = True
+        respuesta.cache_control.max_age = 300
+        return respuesta.make_conditional(request)
+from flask import request, jsonify
+import click
+from database import db
+from cache import cache
+from datetime import date
+import resumen
+
+def register_routes_reportes(app):
+    @app.cli.command("resumen-mensual")
+    @click.option("--verificar", is_flag=True, help="Solo comparar el resumen con las tablas, sin reescribirlo.")
+    def resumen_mensual(verificar):
+        """Recalcula el resumen mensual desde cero, o lo compara con las tablas de origen."""
+        if verificar:
+            diferencias = resumen.verificar()
+            for anio, mes, cliente_id, columna, guardado, esperado in diferencias[:20]:
+                print(f"❌ {anio}-{mes:02d} cliente {cliente_id} {columna}: {guardado} en vez de {esperado}")
+            if diferencias:
+                raise click.ClickException(f"{len(diferencias)} diferencias en el resumen mensual.")
+            print("✅ El resumen mensual coincide con las tablas.")
+            return
+        filas = resumen.reconstruir()
+        db.session.commit()
+        cache.invalidar("resumen")
+        print(f"✅ Resumen mensual reconstruido: {filas} filas.")
+
+    @app.route("/reportes/resumen")
+    def reporte_resumen():
+        hoy = date.today()
+        hasta = request.args.get("hasta", hoy.year, type=int)
+        desde = request.args.get("desde", hasta - 4, type=int)
+        cliente_id = request.args.get("cliente_id", type=int)
+        limite = min(max(request.args.get("limite", 20, type=int), 1), 200)
+        if desde > hasta or hasta - desde >= 50:
+            return jsonify({"error": "Rango de años inválido (hasta 50 años)."}), 400
+
+        def calcular():
+            datos = resumen.tendencias(desde, hasta, cliente_id)
+            if not cliente_id:
+                datos["clientes"] = resumen.rentabilidad_clientes(desde, hasta, limite)
+            return datos
+        datos = cache.obtener(
+            f"reporte_resumen:{desde}:{hasta}:{cliente_id}:{limite}",
+            ("causas", "honorarios", "pagos", "gastos", "resumen"),
+            calcular
+        )
+        return jsonify(datos)
+from flask import render_template, request, redirect, url_for, flash
+from importacion import importar, IMPORTADORES, ErrorImportacion
+import click
+import csv
+import io
+
+def register_routes_importacion(app):
+    @app.cli.command("importar")
+    @click.argument("tipo", type=click.Choice(sorted(IMPORTADORES)))
+    @click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--lote", default=1000, show_default=True, help="Filas por INSERT y por transacción.")
+    @click.option("--codificacion", default="utf-8-sig", show_default=True)
+    @click.option("--errores", type=click.Path(dir_okay=False), help="CSV donde dejar las filas rechazadas.")
+    def importar_csv_cli(tipo, archivo, lote, codificacion, errores):
+        """Importa clientes, contrapartes o causas desde un CSV."""
+        with open(archivo, encoding=codificacion, newline="") as f:
+            try:
+                reporte = importar(tipo, f, lote=lote)
+            except ErrorImportacion as e:
+                raise click.ClickException(str(e))
+        print(f"✅ {reporte['insertadas']} de {reporte['filas']} filas importadas.")
+        if errores and reporte["errores"]:
+            with open(errores, "w", encoding="utf-8", newline="") as f:
+                escritor = csv.writer(f)
+                escritor.writerow(["linea", "error"])
+                escritor.writerows(reporte["errores"])
+        for numero, mensaje in reporte["errores"][:20]:
+            print(f"❌ línea {numero}: {mensaje}")
+        if len(reporte["errores"]) > 20:
+            print(f"... y {len(reporte['errores']) - 20} errores más.")
+
+    @app.route("/importar", methods=["GET", "POST"])
+    def importar_csv():
+        reporte = None
+        if request.method == "POST":
+            tipo = request.form.get("tipo")
+            archivo = request.files.get("archivo")
+            if not archivo or not archivo.filename:
+                flash("❌ Seleccione un archivo CSV.")
+                return redirect(url_for("importar_csv"))
+
+            # Se lee en streaming desde el archivo temporal de la subida
+            lineas = io.TextIOWrapper(archivo.stream, encoding=request.form.get("codificacion") or "utf-8-sig", newline="")
+            try:
+                reporte = importar(tipo, lineas)
+            except ErrorImportacion as e:
+                flash(f"❌ {e}")
+                return redirect(url_for("importar_csv"))
+            except UnicodeDecodeError:
+                flash("❌ El archivo no está en la codificación indicada; pruebe con Latin-1 (Excel).")
+                return redirect(url_for("importar_csv"))
+            flash(f"✅ {reporte['insertadas']} de {reporte['filas']} filas importadas.")
+
+        return render_template("importar.html", tipos=sorted(IMPORTADORES), reporte=reporte)
+
 from flask import render_template, request, redirect, url_for
 from models import Gasto
 from database import db
+from cache import cache
 from datetime import date
+import resumen
 
 def register_routes_servicio(app):
     @app.route("/servicio")
@@ -423,30 +1021,47 @@ def register_routes_servicio(app):
             nuevo_gasto = Gasto(
                 descripcion=data['descripcion'],
                 monto=float(data['monto']),
-                fecha=data.get('fecha') or date.today(),
+                fecha=date.fromisoformat(data['fecha']) if data.get('fecha') else date.today(),
                 categoria=data.get('categoria')
             )
             db.session.add(nuevo_gasto)
+            resumen.contabilizar(Gasto, [nuevo_gasto])
             db.session.commit()
+            cache.invalidar("gastos")
             return redirect(url_for('facturacion'))
 
         return render_template('registrar_gasto.html', date_today=date.today())
-from flask import render_template, request, redirect, url_for
+from flask import render_template, request, redirect, url_for, jsonify, Response
+import click
 from sqlalchemy import text
 from models import Causa
 from database import db
+from migraciones import actualizar_esquema
 
 def register_routes_utilidades(app):
-    @app.route("/ajustar_clientes")
-    def ajustar_clientes():
-        try:
-            db.session.execute(text("ALTER TABLE clientes ADD COLUMN rut_num VARCHAR(8);"))
-            db.session.execute(text("ALTER TABLE clientes ADD COLUMN rut_dv VARCHAR(1);"))
-            db.session.execute(text("ALTER TABLE clientes ADD COLUMN profesion VARCHAR(100);"))
-            db.session.commit()
-            return "✅ Tabla 'clientes' actualizada correctamente."
-        except Exception as e:
-            return f"❌ Error: {str(e)}"
+    @app.cli.command("migrar")
+    def migrar_esquema():
+        """Crea las tablas que falten y aplica las migraciones pendientes."""
+        nuevas = actualizar_esquema(db)
+        if nuevas:
+            print(f"✅ Migraciones aplicadas: {', '.join(map(str, nuevas))}")
+        else:
+            print("✅ El esquema ya estaba al día.")
+
+    @app.cli.command("almacen-limpiar")
+    @click.option("--gracia", default=3600, show_default=True, help="Segundos que se conserva un archivo sin referencias.")
+    def almacen_limpiar(gracia):
+        """Borra del almacén los archivos que ya no usa ningún documento o formato."""
+        borrados = almacen.limpiar(gracia)
+        print(f"🗑️ {borrados} archivos eliminados del almacén.")
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(metricas.exponer(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/metrics/lentas")
+    def metrics_lentas():
+        return jsonify(metricas.consultas_lentas())
 
     @app.route('/ver_columnas_causas')
     def ver_columnas_causas():
@@ -461,17 +1076,6 @@ def register_routes_utilidades(app):
         except Exception as e:
             return f'❌ Error al listar columnas: {e}'
 
-    @app.route('/fix_tipo_causa')
-    def fix_tipo_causa():
-        try:
-            db.session.execute(text(
-                "ALTER TABLE causas ADD COLUMN tipo_causa VARCHAR(100) NOT NULL DEFAULT 'Otro'"
-            ))
-            db.session.commit()
-            return '✅ Columna tipo_causa agregada correctamente.'
-        except Exception as e:
-            return f'❌ Error al ejecutar ALTER TABLE: {e}'
-
     @app.route("/initdb")
     def init_db():
         try:
@@ -489,8 +1093,12 @@ def register_routes_utilidades(app):
         global ultimo_error
         ultimo_error = traceback.format_exc()
         return render_template("500.html"), 500
-def create_app():
-    """Crea y configura la instancia de la aplicación Flask."""
+def create_app(config=None):
+    """Crea y configura la instancia de la aplicación Flask.
+
+    ``config`` permite sobrescribir valores (p. ej. la base de datos) en
+    verificaciones y benchmarks.
+    """
 
     load_dotenv()
     app = Flask(__name__)
@@ -500,8 +1108,59 @@ def create_app():
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev")
+    app.config["CLIENTES_POR_PAGINA"] = int(os.getenv("CLIENTES_POR_PAGINA", "50"))
+    app.config["CAUSAS_POR_PAGINA"] = int(os.getenv("CAUSAS_POR_PAGINA", "50"))
+    app.config["FACTURACION_POR_PAGINA"] = int(os.getenv("FACTURACION_POR_PAGINA", "25"))
+    app.config["CACHE_DB"] = os.getenv("CACHE_DB", "cache.sqlite")
+    app.config["CACHE_RETENCION"] = int(os.getenv("CACHE_RETENCION", str(2 * 24 * 3600)))
+    app.config["CACHE_MAXIMO"] = int(os.getenv("CACHE_MAXIMO", "5000"))
+    app.config["ALMACEN_DIR"] = os.getenv("ALMACEN_DIR", "almacen")
+    # Descargas servidas por el servidor web: X-Sendfile (Apache, lighttpd) o
+    # una ubicación interna de nginx apuntando a ALMACEN_DIR (X-Accel-Redirect)
+    app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE") == "1"
+    app.config["X_ACCEL_ALMACEN"] = os.getenv("X_ACCEL_ALMACEN")
+    app.config["METRICAS_DB"] = os.getenv("METRICAS_DB", "metricas.sqlite")
+    app.config["METRICAS_SQL_LENTA"] = float(os.getenv("METRICAS_SQL_LENTA", "250"))  # ms
+    app.config["METRICAS_INTERVALO"] = float(os.getenv("METRICAS_INTERVALO", "5"))
+    app.config["IA_INDICE_DIR"] = os.getenv("IA_INDICE_DIR", "ia_indice")
+    app.config["IA_EMBEDDINGS"] = os.getenv("IA_EMBEDDINGS", "openai")
+    app.config["IA_EMBEDDINGS_LOTE"] = os.getenv("IA_EMBEDDINGS_LOTE")
+    app.config["IA_EMBEDDINGS_CONCURRENCIA"] = os.getenv("IA_EMBEDDINGS_CONCURRENCIA")
+    app.config["IA_CHUNK_TOKENS"] = int(os.getenv("IA_CHUNK_TOKENS", "500"))
+    app.config["IA_CHUNK_SOLAPAMIENTO"] = int(os.getenv("IA_CHUNK_SOLAPAMIENTO", "50"))
+    app.config["IA_TOP_K"] = int(os.getenv("IA_TOP_K", "5"))
+    app.config["IA_UMBRAL_APROXIMADO"] = int(os.getenv("IA_UMBRAL_APROXIMADO", "50000"))
+    app.config["IA_TAREAS_DB"] = os.getenv(
+        "IA_TAREAS_DB", os.path.join(app.config["IA_INDICE_DIR"], "tareas.sqlite")
+    )
+    app.config["IA_TAREAS_PROCESOS"] = int(os.getenv("IA_TAREAS_PROCESOS", "2"))
+    # Con 0 los workers web solo encolan y `flask ia-worker` procesa la cola
+    app.config["IA_TAREAS_EN_PROCESO"] = os.getenv("IA_TAREAS_EN_PROCESO", "1") == "1"
+    app.config["IA_CACHE_DB"] = os.getenv(
+        "IA_CACHE_DB", os.path.join(app.config["IA_INDICE_DIR"], "cache.sqlite")
+    )
+    app.config["IA_CACHE_UMBRAL"] = float(os.getenv("IA_CACHE_UMBRAL", "0.95"))
+    app.config["IA_CACHE_TTL"] = int(os.getenv("IA_CACHE_TTL", str(7 * 24 * 3600)))
+    app.config["IA_CACHE_MAXIMO"] = int(os.getenv("IA_CACHE_MAXIMO", "5000"))
+    app.config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+    app.config["OPENAI_BASE_URL"] = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    app.config["OPENAI_PLAZO"] = float(os.getenv("OPENAI_PLAZO", "30"))
+    app.config["OPENAI_REINTENTOS"] = int(os.getenv("OPENAI_REINTENTOS", "3"))
+    app.config["OPENAI_CONCURRENCIA"] = int(os.getenv("OPENAI_CONCURRENCIA", "8"))
+    app.config["OPENAI_CIRCUITO_FALLOS"] = int(os.getenv("OPENAI_CIRCUITO_FALLOS", "5"))
+    app.config["OPENAI_CIRCUITO_SEGUNDOS"] = float(os.getenv("OPENAI_CIRCUITO_SEGUNDOS", "30"))
+    app.config["IA_LLM"] = os.getenv("IA_LLM", "openai")
+    # Cargar el stack de IA al crear la app (p. ej. en el master de gunicorn con preload_app)
+    app.config["IA_PRECARGAR"] = os.getenv("IA_PRECARGAR") == "1"
+    app.config["IA_LLM_INTERVALO"] = os.getenv("IA_LLM_INTERVALO")
+    if config:
+        app.config.update(config)
 
     db.init_app(app)
+    cache.init_app(app)
+    almacen.init_app(app)
+    descargas.init_app(app)
+    metricas.init_app(app)
 
     # Registro de rutas agrupadas por funcionalidades
     register_routes_generales(app)
@@ -509,7 +1168,11 @@ def create_app():
     register_routes_causas(app)
     register_routes_ia(app)
     register_routes_formatos(app)
+    register_routes_busqueda(app)
     register_routes_facturacion(app)
+    register_routes_agenda(app)
+    register_routes_reportes(app)
+    register_routes_importacion(app)
     register_routes_servicio(app)
     register_routes_utilidades(app)
 
@@ -0,0 +1,316 @@
+# metricas.py
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import cliente_openai
+
+log = logging.getLogger("judexia.metricas")
+
+# Límites (segundos) de los buckets del histograma de latencia por ruta
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+AYUDA = {
+    "judexia_http_request_duration_seconds": ("histogram", "Latencia de las peticiones por ruta."),
+    "judexia_http_respuestas_total": ("counter", "Respuestas por ruta y código HTTP."),
+    "judexia_sql_consultas_total": ("counter", "Consultas SQL ejecutadas por ruta."),
+    "judexia_sql_segundos_total": ("counter", "Tiempo en consultas SQL por ruta."),
+    "judexia_plantilla_segundos_total": ("counter", "Tiempo renderizando cada plantilla."),
+    "judexia_plantilla_renders_total": ("counter", "Veces que se renderizó cada plantilla."),
+    "judexia_api_externa_segundos_total": ("counter", "Tiempo en llamadas a APIs externas."),
+    "judexia_api_externa_llamadas_total": ("counter", "Llamadas a APIs externas, por resultado."),
+}
+
+class Metricas:
+    """Métricas de rendimiento por ruta, agregadas entre workers.
+
+    Cada proceso acumula en memoria contadores (los buckets del histograma
+    también son contadores) y cada ``intervalo`` segundos suma lo acumulado
+    en una base SQLite compartida, igual que cache.py. ``/metrics`` lee esa
+    base, así que muestra el total de todos los workers de gunicorn.
+
+    Las consultas que tardan más de ``METRICAS_SQL_LENTA`` ms quedan en
+    ``consultas_lentas`` agrupadas por sentencia, sin los valores de los
+    parámetros (solo sus tipos) ni literales.
+    """
+
+    def __init__(self, ruta_db=None):
+        self.ruta_db = ruta_db
+        self.lenta = 0.25
+        self.intervalo = 5.0
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(float)
+        self._lentas = {}
+        self._ultimo_volcado = time.monotonic()
+
+    def init_app(self, app):
+        self.ruta_db = app.config["METRICAS_DB"]
+        self.lenta = app.config["METRICAS_SQL_LENTA"] / 1000
+        self.intervalo = app.config["METRICAS_INTERVALO"]
+        directorio = os.path.dirname(self.ruta_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conectar() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS metricas (
+                    nombre TEXT NOT NULL,
+                    etiquetas TEXT NOT NULL,
+                    valor REAL NOT NULL,
+                    PRIMARY KEY (nombre, etiquetas)
+                )
+            """)
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS consultas_lentas (
+                    sentencia TEXT PRIMARY KEY,
+                    endpoint TEXT,
+                    parametros TEXT,
+                    veces INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    maximo REAL NOT NULL,
+                    ultima REAL NOT NULL
+                )
+            """)
+
+        app.before_request(self._inicio_peticion)
+        app.after_request(self._fin_peticion)
+        before_render_template.connect(self._inicio_plantilla, app)
+        template_rendered.connect(self._fin_plantilla, app)
+        _escuchar_sql(self)
+        if self._observar_api not in cliente_openai.observadores:
+            cliente_openai.observadores.append(self._observar_api)
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            yield con
+        finally:
+            con.close()
+
+    # ---------- registro ----------
+
+    def sumar(self, nombre, etiquetas, valor=1.0):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] += valor
+
+    def observar(self, nombre, etiquetas, segundos):
+        """Agrega una observación a un histograma (buckets acumulados, suma y cuenta)."""
+        for limite in BUCKETS:
+            if segundos <= limite:
+                self.sumar(f"{nombre}_bucket", {**etiquetas, "le": repr(limite)})
+        self.sumar(f"{nombre}_bucket", {**etiquetas, "le": "+Inf"})
+        self.sumar(f"{nombre}_sum", etiquetas, segundos)
+        self.sumar(f"{nombre}_count", etiquetas)
+
+    def _inicio_peticion(self):
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_sql = [0, 0.0]
+        g.metricas_plantillas = []
+
+    def _fin_peticion(self, respuesta):
+        inicio = g.pop("metricas_inicio", None)
+        if inicio is None:
+            return respuesta
+        endpoint = request.endpoint or "sin_ruta"
+        self.observar(
+            "judexia_http_request_duration_seconds",
+            {"endpoint": endpoint, "metodo": request.method},
+            time.perf_counter() - inicio
+        )
+        self.sumar("judexia_http_respuestas_total", {"endpoint": endpoint, "estado": str(respuesta.status_code)})
+        consultas, segundos = g.pop("metricas_sql", (0, 0.0))
+        if consultas:
+            self.sumar("judexia_sql_consultas_total", {"endpoint": endpoint}, consultas)
+            self.sumar("judexia_sql_segundos_total", {"endpoint": endpoint}, segundos)
+        if time.monotonic() - self._ultimo_volcado >= self.intervalo:
+            self.volcar()
+        return respuesta
+
+    def _inicio_plantilla(self, app, template, context, **extra):
+        if has_request_context():
+            g.setdefault("metricas_plantillas", []).append(time.perf_counter())
+
+    def _fin_plantilla(self, app, template, context, **extra):
+        inicios = g.get("metricas_plantillas") if has_request_context() else None
+        if not inicios:
+            return
+        nombre = template.name or "sin_nombre"
+        self.sumar("judexia_plantilla_segundos_total", {"plantilla": nombre}, time.perf_counter() - inicios.pop())
+        self.sumar("judexia_plantilla_renders_total", {"plantilla": nombre})
+
+    def _observar_api(self, ruta, segundos, ok):
+        # Como las consultas SQL, por la ruta que hizo la llamada; la ingesta
+        # en segundo plano no tiene petición
+        endpoint = (request.endpoint or "sin_ruta") if has_request_context() else "segundo_plano"
+        etiquetas = {"servicio": "openai", "operacion": ruta, "endpoint": endpoint}
+        self.sumar("judexia_api_externa_segundos_total", etiquetas, segundos)
+        self.sumar("judexia_api_externa_llamadas_total", {**etiquetas, "resultado": "ok" if ok else "error"})
+
+    def _consulta(self, sentencia, parametros, segundos):
+        if has_request_context() and "metricas_sql" in g:
+            g.metricas_sql[0] += 1
+            g.metricas_sql[1] += segundos
+        if segundos < self.lenta:
+            return
+        endpoint = request.endpoint if has_request_context() else None
+        sentencia = redactar(sentencia)
+        log.warning("Consulta lenta (%.0f ms) en %s: %s", segundos * 1000, endpoint or "-", sentencia)
+        with self._lock:
+            actual = self._lentas.get(sentencia)
+            if actual:
+                actual["veces"] += 1
+                actual["total"] += segundos
+                actual["maximo"] = max(actual["maximo"], segundos)
+                actual["endpoint"] = endpoint or actual["endpoint"]
+            else:
+                self._lentas[sentencia] = {
+                    "endpoint": endpoint, "parametros": tipos_parametros(parametros),
+                    "veces": 1, "total": segundos, "maximo": segundos,
+                }
+
+    # ---------- agregación entre workers ----------
+
+    def volcar(self):
+        """Suma a la base compartida lo acumulado por este proceso."""
+        with self._lock:
+            contadores, self._contadores = self._contadores, defaultdict(float)
+            lentas, self._lentas = self._lentas, {}
+            self._ultimo_volcado = time.monotonic()
+        if not contadores and not lentas:
+            return
+        ahora = time.time()
+        with self._conectar() as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.executemany(
+                "INSERT INTO metricas (nombre, etiquetas, valor) VALUES (?, ?, ?) "
+                "ON CONFLICT (nombre, etiquetas) DO UPDATE SET valor = valor + excluded.valor",
+                [(nombre, json.dumps(etiquetas), valor) for (nombre, etiquetas), valor in contadores.items()]
+            )
+            con.executemany(
+                "INSERT INTO consultas_lentas (sentencia, endpoint, parametros, veces, total, maximo, ultima) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (sentencia) DO UPDATE SET "
+                "endpoint = COALESCE(excluded.endpoint, endpoint), veces = veces + excluded.veces, "
+                "total = total + excluded.total, maximo = MAX(maximo, excluded.maximo), ultima = excluded.ultima",
+                [
+                    (s, d["endpoint"], d["parametros"], d["veces"], d["total"], d["maximo"], ahora)
+                    for s, d in lentas.items()
+                ]
+            )
+            con.execute("COMMIT")
+
+    def exponer(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        self.volcar()
+        with self._conectar() as con:
+            filas = con.execute("SELECT nombre, etiquetas, valor FROM metricas").fetchall()
+
+        familias = defaultdict(list)
+        for nombre, etiquetas, valor in filas:
+            base = re.sub(r"_(bucket|sum|count)$", "", nombre) if nombre not in AYUDA else nombre
+            familias[base].append((nombre, dict(json.loads(etiquetas)), valor))
+
+        lineas = []
+        for base in sorted(familias):
+            tipo, ayuda = AYUDA.get(base, ("untyped", ""))
+            lineas.append(f"# HELP {base} {ayuda}")
+            lineas.append(f"# TYPE {base} {tipo}")
+            for nombre, etiquetas, valor in sorted(familias[base], key=_orden_serie):
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_valor(valor)}")
+        return "\n".join(lineas) + "\n"
+
+    def consultas_lentas(self, limite=50):
+        self.volcar()
+        with self._conectar() as con:
+            con.row_factory = sqlite3.Row
+            filas = con.execute(
+                "SELECT * FROM consultas_lentas ORDER BY total DESC LIMIT ?", (limite,)
+            ).fetchall()
+        return [dict(f) for f in filas]
+
+
+# ===================== SQLALCHEMY =====================
+
+_instancias = []
+
+def _escuchar_sql(instancia):
+    # Un solo par de listeners por proceso para todos los engines; cada app
+    # inicializada recibe las consultas
+    if instancia in _instancias:
+        return
+    if not _instancias:
+        event.listen(Engine, "before_cursor_execute", _antes_sql)
+        event.listen(Engine, "after_cursor_execute", _despues_sql)
+        event.listen(Engine, "handle_error", _error_sql)
+    _instancias.append(instancia)
+
+def _antes_sql(conn, cursor, sentencia, parametros, contexto, executemany):
+    conn.info.setdefault("metricas_inicio", []).append((contexto, time.perf_counter()))
+
+def _despues_sql(conn, cursor, sentencia, parametros, contexto, executemany):
+    inicios = conn.info.get("metricas_inicio")
+    if not inicios:
+        return
+    segundos = time.perf_counter() - inicios.pop()[1]
+    for instancia in _instancias:
+        instancia._consulta(sentencia, parametros, segundos)
+
+def _error_sql(contexto):
+    # Una sentencia que falla no llega a after_cursor_execute: se descarta su
+    # inicio para que la siguiente no mida desde ahí
+    conn, ejecucion = contexto.connection, contexto.execution_context
+    inicios = conn.info.get("metricas_inicio") if conn is not None else None
+    if inicios and ejecucion is not None and inicios[-1][0] is ejecucion:
+        inicios.pop()
+
+# ===================== FORMATO =====================
+
+def redactar(sentencia):
+    """La sentencia sin valores: literales reemplazados por ? y listas IN colapsadas."""
+    sentencia = re.sub(r"'(?:[^']|'')*'", "?", sentencia)
+    sentencia = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sentencia)
+    sentencia = re.sub(r"\s+", " ", sentencia).strip()
+    sentencia = re.sub(r"\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)", "(?, ...)", sentencia)
+    return sentencia[:2000]
+
+def tipos_parametros(parametros):
+    """Solo los tipos de los parámetros, nunca sus valores (RUT, nombres, montos)."""
+    if isinstance(parametros, list):
+        parametros = parametros[0] if parametros else ()
+    if isinstance(parametros, dict):
+        return ", ".join(f"{k}: {type(v).__name__}" for k, v in parametros.items())
+    return ", ".join(type(v).__name__ for v in parametros or ())
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in etiquetas.items()) + "}"
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _valor(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(valor)
+
+def _orden_serie(serie):
+    nombre, etiquetas, _ = serie
+    le = etiquetas.get("le")
+    limite = float("inf") if le == "+Inf" else float(le) if le else 0.0
+    resto = sorted((k, v) for k, v in etiquetas.items() if k != "le")
+    return resto, nombre, limite
+
+
+metricas = Metricas()
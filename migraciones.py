@@ -0,0 +1,240 @@
+# migraciones.py
+#
+# Migraciones de esquema versionadas. Cada migración se aplica una sola vez y
+# queda registrada en la tabla schema_version. Además son idempotentes: una
+# base creada con db.create_all() ya tiene las columnas e índices, y al migrar
+# solo se registran las versiones.
+# Uso: python migraciones.py   o   flask --app main migrar
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import Archivo, AntiguedadSaldo, Gestion, ResumenMensual, normalizar_nombre
+import agenda
+import resumen
+
+MIGRACIONES = []
+
+def migracion(version, descripcion):
+    def registrar(funcion):
+        MIGRACIONES.append((version, descripcion, funcion))
+        return funcion
+    return registrar
+
+# ===================== OPERACIONES =====================
+
+def agregar_columna(conn, tabla, columna, definicion):
+    columnas = {c["name"] for c in inspect(conn).get_columns(tabla)}
+    if columna not in columnas:
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"))
+
+def crear_indice(conn, nombre, tabla, *columnas):
+    # SQLite y Postgres (9.5+) aceptan IF NOT EXISTS
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({', '.join(columnas)})"))
+
+# ===================== MIGRACIONES =====================
+
+@migracion(1, "RUT separado y profesión en clientes")
+def _rut_clientes(conn):
+    agregar_columna(conn, "clientes", "rut_num", "VARCHAR(8)")
+    agregar_columna(conn, "clientes", "rut_dv", "VARCHAR(1)")
+    agregar_columna(conn, "clientes", "profesion", "VARCHAR(100)")
+
+@migracion(2, "Tipo de causa obligatorio")
+def _tipo_causa(conn):
+    agregar_columna(conn, "causas", "tipo_causa", "VARCHAR(100) NOT NULL DEFAULT 'Otro'")
+
+@migracion(3, "Fecha de registro de clientes")
+def _fecha_registro(conn):
+    agregar_columna(conn, "clientes", "fecha_registro", "DATE")
+
+@migracion(4, "Índice de paginación de causas")
+def _indice_causas(conn):
+    crear_indice(conn, "ix_causas_fecha_ingreso_id", "causas", "fecha_ingreso", "id")
+
+@migracion(5, "Índices de claves foráneas y filtros de los listados")
+def _indices_listados(conn):
+    crear_indice(conn, "ix_clientes_nombre", "clientes", "nombre")
+    crear_indice(conn, "ix_clientes_rut_num", "clientes", "rut_num")
+    crear_indice(conn, "ix_contrapartes_nombre", "contrapartes", "nombre")
+    crear_indice(conn, "ix_documentos_causa_id", "documentos", "causa_id")
+
+    crear_indice(conn, "ix_causas_cliente_id_fecha_ingreso_id", "causas", "cliente_id", "fecha_ingreso", "id")
+    crear_indice(conn, "ix_causas_tipo_causa", "causas", "tipo_causa")
+    crear_indice(conn, "ix_causas_tribunal", "causas", "tribunal")
+    crear_indice(conn, "ix_causas_rol_numero", "causas", "rol_numero")
+
+    crear_indice(conn, "ix_formatos_legales_fecha_subida", "formatos_legales", "fecha_subida")
+    crear_indice(conn, "ix_formatos_legales_causa_id_fecha_subida", "formatos_legales", "causa_id", "fecha_subida")
+
+    crear_indice(conn, "ix_honorarios_cliente_id_fecha_emision_id", "honorarios", "cliente_id", "fecha_emision", "id")
+    crear_indice(conn, "ix_honorarios_fecha_emision_id", "honorarios", "fecha_emision", "id")
+    crear_indice(conn, "ix_honorarios_causa_id", "honorarios", "causa_id")
+
+    crear_indice(conn, "ix_pagos_cuotas_honorario_id", "pagos_cuotas", "honorario_id")
+    crear_indice(conn, "ix_pagos_cuotas_cliente_id_estado_id", "pagos_cuotas", "cliente_id", "estado", "id")
+    crear_indice(conn, "ix_pagos_cuotas_estado_id", "pagos_cuotas", "estado", "id")
+    crear_indice(conn, "ix_pagos_cuotas_fecha_pago_id", "pagos_cuotas", "fecha_pago", "id")
+
+    crear_indice(conn, "ix_gastos_fecha_id", "gastos", "fecha", "id")
+
+@migracion(6, "Búsqueda de texto completo en formatos y documentos")
+def _busqueda(conn):
+    # Tabla fuera de models.py: la llena busqueda.py y su índice depende del motor
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS busqueda_documentos (
+                id SERIAL PRIMARY KEY,
+                tipo VARCHAR(20) NOT NULL,
+                ref_id INTEGER NOT NULL,
+                causa_id INTEGER,
+                titulo VARCHAR(255) NOT NULL,
+                contenido TEXT NOT NULL DEFAULT '',
+                vector TSVECTOR GENERATED ALWAYS AS (
+                    setweight(to_tsvector('spanish', titulo), 'A') ||
+                    setweight(to_tsvector('spanish', contenido), 'B')
+                ) STORED,
+                UNIQUE (tipo, ref_id)
+            )
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_busqueda_documentos_vector ON busqueda_documentos USING GIN (vector)"
+        ))
+    else:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS busqueda_documentos (
+                id INTEGER PRIMARY KEY,
+                tipo VARCHAR(20) NOT NULL,
+                ref_id INTEGER NOT NULL,
+                causa_id INTEGER,
+                titulo VARCHAR(255) NOT NULL,
+                contenido TEXT NOT NULL DEFAULT '',
+                UNIQUE (tipo, ref_id)
+            )
+        """))
+        # Índice FTS5 sobre el contenido de busqueda_documentos (sin duplicar
+        # el texto), mantenido por los triggers
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS busqueda_fts USING fts5(
+                titulo, contenido,
+                content='busqueda_documentos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS busqueda_documentos_ai AFTER INSERT ON busqueda_documentos BEGIN
+                INSERT INTO busqueda_fts (rowid, titulo, contenido) VALUES (new.id, new.titulo, new.contenido);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS busqueda_documentos_ad AFTER DELETE ON busqueda_documentos BEGIN
+                INSERT INTO busqueda_fts (busqueda_fts, rowid, titulo, contenido)
+                VALUES ('delete', old.id, old.titulo, old.contenido);
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER IF NOT EXISTS busqueda_documentos_au AFTER UPDATE ON busqueda_documentos BEGIN
+                INSERT INTO busqueda_fts (busqueda_fts, rowid, titulo, contenido)
+                VALUES ('delete', old.id, old.titulo, old.contenido);
+                INSERT INTO busqueda_fts (rowid, titulo, contenido) VALUES (new.id, new.titulo, new.contenido);
+            END
+        """))
+    crear_indice(conn, "ix_busqueda_documentos_causa_id", "busqueda_documentos", "causa_id")
+
+@migracion(7, "Nombre normalizado para buscar clientes por prefijo")
+def _nombre_busqueda(conn):
+    agregar_columna(conn, "clientes", "nombre_busqueda", "VARCHAR(100)")
+    while True:
+        filas = conn.execute(text(
+            "SELECT id, nombre FROM clientes WHERE nombre_busqueda IS NULL LIMIT 1000"
+        )).fetchall()
+        if not filas:
+            break
+        conn.execute(
+            text("UPDATE clientes SET nombre_busqueda = :n WHERE id = :id"),
+            [{"id": id_, "n": normalizar_nombre(nombre)} for id_, nombre in filas]
+        )
+    crear_indice(conn, "ix_clientes_nombre_busqueda_id", "clientes", "nombre_busqueda", "id")
+
+@migracion(8, "Almacén de archivos por contenido")
+def _almacen(conn):
+    Archivo.__table__.create(conn, checkfirst=True)
+    for tabla in ("documentos", "formatos_legales"):
+        agregar_columna(conn, tabla, "sha256", "VARCHAR(64) REFERENCES archivos (sha256)")
+        crear_indice(conn, f"ix_{tabla}_sha256", tabla, "sha256")
+
+@migracion(9, "Calendario de cuotas y antigüedad de saldos")
+def _cuotas(conn):
+    agregar_columna(conn, "pagos_cuotas", "monto", "FLOAT")
+    # Las cuotas anteriores no guardaban lo adeudado: se asume el honorario
+    # dividido en partes iguales
+    conn.execute(text("""
+        UPDATE pagos_cuotas SET monto = (
+            SELECT h.monto_total / COALESCE(NULLIF(h.numero_cuotas, 0), 1)
+            FROM honorarios h WHERE h.id = pagos_cuotas.honorario_id
+        ) WHERE monto IS NULL
+    """))
+    crear_indice(conn, "ix_pagos_cuotas_estado_vencimiento", "pagos_cuotas", "estado", "vencimiento")
+    AntiguedadSaldo.__table__.create(conn, checkfirst=True)
+
+@migracion(10, "Resumen mensual por cliente")
+def _resumen_mensual(conn):
+    ResumenMensual.__table__.create(conn, checkfirst=True)
+    resumen.reconstruir(conn)
+
+@migracion(11, "Agenda de audiencias y gestiones")
+def _gestiones(conn):
+    Gestion.__table__.create(conn, checkfirst=True)
+    # La última gestión de cada causa pasa a ser el comienzo de su historial;
+    # las futuras se contaban como audiencias en el dashboard
+    agenda.desde_causas(conexion=conn)
+
+# ===================== EJECUCIÓN =====================
+
+def migrar(engine):
+    """Aplica en orden las migraciones pendientes y devuelve sus versiones.
+
+    Cada migración corre en su propia transacción junto con su registro en
+    schema_version: si falla, no queda aplicada a medias ni registrada.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                descripcion VARCHAR(200) NOT NULL,
+                aplicada TIMESTAMP NOT NULL
+            )
+        """))
+        aplicadas = {fila[0] for fila in conn.execute(text("SELECT version FROM schema_version"))}
+
+    nuevas = []
+    for version, descripcion, funcion in sorted(MIGRACIONES, key=lambda m: m[0]):
+        if version in aplicadas:
+            continue
+        with engine.begin() as conn:
+            funcion(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, descripcion, aplicada) VALUES (:v, :d, :a)"),
+                {"v": version, "d": descripcion, "a": datetime.utcnow()}
+            )
+        nuevas.append(version)
+    return nuevas
+
+def actualizar_esquema(db):
+    """Crea las tablas que falten y aplica las migraciones pendientes."""
+    db.create_all()
+    return migrar(db.engine)
+
+
+if __name__ == "__main__":
+    from main import create_app
+    from database import db
+
+    app = create_app()
+    with app.app_context():
+        nuevas = actualizar_esquema(db)
+    if nuevas:
+        print(f"✅ Migraciones aplicadas: {', '.join(map(str, nuevas))}")
+    else:
+        print("✅ El esquema ya estaba al día.")
@@ -1,30 +1,49 @@
 from datetime import datetime, date
+import unicodedata
+
+from sqlalchemy.orm import validates
 
 # Usamos la instancia de SQLAlchemy definida en database.py para que la
 # configuración sea única en toda la aplicación.
 from database import db
 
+def normalizar_nombre(nombre):
+    """Minúsculas y sin tildes: "Ñuñez Pérez" -> "nunez perez"."""
+    descompuesto = unicodedata.normalize("NFKD", nombre or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower().strip()
+
 # ===================== MODELOS =====================
 
 class Cliente(db.Model):
     __tablename__ = 'clientes'
+    __table_args__ = (
+        # Directorio de clientes: búsqueda por prefijo del nombre y orden alfabético
+        db.Index('ix_clientes_nombre_busqueda_id', 'nombre_busqueda', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), nullable=False)
-    rut_num = db.Column(db.String(8))
+    nombre = db.Column(db.String(100), nullable=False, index=True)
+    nombre_busqueda = db.Column(db.String(100))
+    rut_num = db.Column(db.String(8), index=True)
     rut_dv = db.Column(db.String(1))
     email = db.Column(db.String(100))
     telefono = db.Column(db.String(20))
     direccion = db.Column(db.String(200))
     profesion = db.Column(db.String(100))
     fecha_nacimiento = db.Column(db.Date)
+    fecha_registro = db.Column(db.Date, default=date.today)
 
     causas = db.relationship('Causa', backref='cliente', lazy=True)
     pagos = db.relationship('PagoCuota', backref='cliente', lazy=True)
 
+    @validates('nombre')
+    def _nombre(self, clave, nombre):
+        self.nombre_busqueda = normalizar_nombre(nombre)
+        return nombre
+
 class Contraparte(db.Model):
     __tablename__ = 'contrapartes'
     id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), nullable=False)
+    nombre = db.Column(db.String(100), nullable=False, index=True)
     rut = db.Column(db.String(12), unique=True, nullable=True)
     email = db.Column(db.String(100))
     telefono = db.Column(db.String(20))
@@ -38,19 +57,26 @@ class Documento(db.Model):
     nombre_archivo = db.Column(db.String(100), nullable=False)
     tipo = db.Column(db.String(50))
     ruta = db.Column(db.String(255), nullable=False)
-    causa_id = db.Column(db.Integer, db.ForeignKey('causas.id'))
+    sha256 = db.Column(db.String(64), db.ForeignKey('archivos.sha256'), index=True)
+    causa_id = db.Column(db.Integer, db.ForeignKey('causas.id'), index=True)
 
 class Causa(db.Model):
     __tablename__ = 'causas'
+    __table_args__ = (
+        # Orden y cursor de la paginación keyset del listado de causas
+        db.Index('ix_causas_fecha_ingreso_id', 'fecha_ingreso', 'id'),
+        # Filtro por cliente del listado (cubre también la clave foránea)
+        db.Index('ix_causas_cliente_id_fecha_ingreso_id', 'cliente_id', 'fecha_ingreso', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    tipo_causa = db.Column(db.String(100), nullable=False)
+    tipo_causa = db.Column(db.String(100), nullable=False, index=True)
     procedimiento = db.Column(db.String(100), nullable=False)
     judicial = db.Column(db.Boolean, default=True)
 
     corte_apelaciones = db.Column(db.String(100), nullable=True)
-    tribunal = db.Column(db.String(150), nullable=True)
+    tribunal = db.Column(db.String(150), nullable=True, index=True)
     letra = db.Column(db.String(1), nullable=True)
-    rol_numero = db.Column(db.String(10), nullable=True)
+    rol_numero = db.Column(db.String(10), nullable=True, index=True)
     rol_anio = db.Column(db.Integer, nullable=True)
 
     fecha_ingreso = db.Column(db.Date, nullable=False)
@@ -65,22 +91,60 @@ class Causa(db.Model):
     formatos = db.relationship('FormatoLegal', backref='causa', lazy=True)
     honorarios = db.relationship('Honorario', backref='causa', lazy=True)
 
+class Gestion(db.Model):
+    """Audiencia, plazo o gestión de una causa, con su fecha: historial y agenda."""
+    __tablename__ = 'gestiones'
+    __table_args__ = (
+        # Próximos N días de toda la agenda, de un responsable o de un cliente
+        db.Index('ix_gestiones_fecha_id', 'fecha', 'id'),
+        db.Index('ix_gestiones_responsable_fecha', 'responsable', 'fecha'),
+        db.Index('ix_gestiones_cliente_id_fecha', 'cliente_id', 'fecha'),
+        # Historial de la causa
+        db.Index('ix_gestiones_causa_id_fecha', 'causa_id', 'fecha'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    causa_id = db.Column(db.Integer, db.ForeignKey('causas.id'), nullable=False)
+    # Copia del cliente de la causa, para filtrar la agenda sin join
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False, default='gestion')
+    titulo = db.Column(db.String(250), nullable=False)
+    fecha = db.Column(db.Date, nullable=False)
+    hora = db.Column(db.Time)
+    lugar = db.Column(db.String(200))
+    responsable = db.Column(db.String(100))
+    realizada = db.Column(db.Boolean, nullable=False, default=False)
+    observaciones = db.Column(db.Text)
+    modificada = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    causa = db.relationship('Causa', backref=db.backref('gestiones', lazy=True))
+
 class FormatoLegal(db.Model):
     __tablename__ = 'formatos_legales'
+    __table_args__ = (
+        # /formatos filtra por causa y ordena por fecha de subida
+        db.Index('ix_formatos_legales_causa_id_fecha_subida', 'causa_id', 'fecha_subida'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     nombre_original = db.Column(db.String(255), nullable=False)
     filename = db.Column(db.String(255), nullable=False, unique=True)
-    fecha_subida = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_subida = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     usuario = db.Column(db.String(100))
     causa_id = db.Column(db.Integer, db.ForeignKey('causas.id'))
     version = db.Column(db.Integer, default=1)
     observaciones = db.Column(db.String(255))
+    sha256 = db.Column(db.String(64), db.ForeignKey('archivos.sha256'), index=True)
 
 class Honorario(db.Model):
     __tablename__ = 'honorarios'
+    __table_args__ = (
+        # Paginación keyset de /facturacion, con y sin filtro por cliente;
+        # el primero cubre también la clave foránea cliente_id
+        db.Index('ix_honorarios_cliente_id_fecha_emision_id', 'cliente_id', 'fecha_emision', 'id'),
+        db.Index('ix_honorarios_fecha_emision_id', 'fecha_emision', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
-    causa_id = db.Column(db.Integer, db.ForeignKey('causas.id'), nullable=True)
+    causa_id = db.Column(db.Integer, db.ForeignKey('causas.id'), nullable=True, index=True)
     descripcion = db.Column(db.String(255))
     monto_total = db.Column(db.Float)
     fecha_emision = db.Column(db.Date, default=date.today)
@@ -88,13 +152,25 @@ class Honorario(db.Model):
     numero_cuotas = db.Column(db.Integer, default=1)
     estado = db.Column(db.String(50))
 
+    cliente = db.relationship('Cliente', backref='honorarios', lazy=True)
     pagos = db.relationship('PagoCuota', backref='honorario', lazy=True)
 
 class PagoCuota(db.Model):
     __tablename__ = 'pagos_cuotas'
+    __table_args__ = (
+        # Filtros cliente/estado de /facturacion, ordenados por id
+        db.Index('ix_pagos_cuotas_cliente_id_estado_id', 'cliente_id', 'estado', 'id'),
+        db.Index('ix_pagos_cuotas_estado_id', 'estado', 'id'),
+        # Rango de fechas de la exportación
+        db.Index('ix_pagos_cuotas_fecha_pago_id', 'fecha_pago', 'id'),
+        # Cuotas pendientes que vencieron (cobranza.marcar_vencidas)
+        db.Index('ix_pagos_cuotas_estado_vencimiento', 'estado', 'vencimiento'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    honorario_id = db.Column(db.Integer, db.ForeignKey('honorarios.id'), nullable=False)
+    honorario_id = db.Column(db.Integer, db.ForeignKey('honorarios.id'), nullable=False, index=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
+    # Lo que se debe pagar en la cuota, según el calendario del honorario
+    monto = db.Column(db.Float)
     monto_pagado = db.Column(db.Float)
     fecha_pago = db.Column(db.Date)
     cuota_numero = db.Column(db.Integer)
@@ -102,13 +178,50 @@ class PagoCuota(db.Model):
     estado = db.Column(db.String(50))
     vencimiento = db.Column(db.Date)
 
+class AntiguedadSaldo(db.Model):
+    """Saldo impago de un cliente por tramo de días de atraso, precalculado por cobranza.py."""
+    __tablename__ = 'antiguedad_saldos'
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), primary_key=True)
+    por_vencer = db.Column(db.Float, nullable=False, default=0)
+    dias_0_30 = db.Column(db.Float, nullable=False, default=0)
+    dias_31_60 = db.Column(db.Float, nullable=False, default=0)
+    dias_61_90 = db.Column(db.Float, nullable=False, default=0)
+    dias_mas_90 = db.Column(db.Float, nullable=False, default=0)
+    # Día de referencia de los tramos
+    calculado = db.Column(db.Date, nullable=False)
+
+class ResumenMensual(db.Model):
+    """Totales por mes y cliente, mantenidos por resumen.py junto a cada escritura.
+
+    Los gastos del estudio no son de un cliente: van con ``cliente_id`` 0.
+    """
+    __tablename__ = 'resumen_mensual'
+    anio = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.Integer, primary_key=True)
+    # Sin clave foránea por el 0 de los gastos
+    cliente_id = db.Column(db.Integer, primary_key=True, index=True)
+    facturado = db.Column(db.Float, nullable=False, default=0)
+    cobrado = db.Column(db.Float, nullable=False, default=0)
+    gastos = db.Column(db.Float, nullable=False, default=0)
+    causas_nuevas = db.Column(db.Integer, nullable=False, default=0)
+
 class Gasto(db.Model):
     __tablename__ = 'gastos'
+    __table_args__ = (
+        db.Index('ix_gastos_fecha_id', 'fecha', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     descripcion = db.Column(db.String(255), nullable=False)
     monto = db.Column(db.Float, nullable=False)
     fecha = db.Column(db.Date, default=date.today)
     categoria = db.Column(db.String(100))
 
-
-
+class Archivo(db.Model):
+    """Contenido guardado una sola vez en el almacén (almacen.py), por hash."""
+    __tablename__ = 'archivos'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    tamano = db.Column(db.BigInteger, nullable=False)
+    referencias = db.Column(db.Integer, nullable=False, default=0)
+    creado = db.Column(db.DateTime, default=datetime.utcnow)
+    # Desde cuándo no lo usa nadie; almacen.limpiar() lo borra pasado un plazo
+    liberado = db.Column(db.DateTime, index=True)
@@ -0,0 +1,124 @@
+# opciones.py
+#
+# Opciones de los <select> de causas y contrapartes. Para llenarlos basta
+# (id, etiqueta): la proyección y el HTML de los <option> se guardan en el
+# cache compartido y se invalidan con el mismo grupo que las rutas que
+# escriben esas tablas. Cada worker guarda además el último HTML leído y solo
+# vuelve al cache cuando cambia el sello del grupo.
+#
+# De las causas se precargan solo las más recientes; las demás se buscan con
+# /api/causas mientras se escribe (static/js/main.js), como los clientes.
+
+import threading
+
+from markupsafe import Markup, escape
+
+from cache import cache
+from clientes import siguiente_prefijo, filtrar_clientes
+from database import db
+from models import Causa, Cliente, Contraparte
+
+# Causas precargadas en cada <select>
+CAUSAS_RECIENTES = 50
+
+def _etiqueta_causa(tipo, rol, anio):
+    return f"{tipo} - {rol or 's/rol'}" + (f"-{anio}" if anio else "")
+
+def _consulta_causas():
+    return db.session.query(Causa.id, Causa.tipo_causa, Causa.rol_numero, Causa.rol_anio)
+
+def _causas(ids=None):
+    filas = _consulta_causas()
+    if ids is None:
+        filas = filas.order_by(Causa.id.desc()).limit(CAUSAS_RECIENTES)
+    else:
+        filas = filas.filter(Causa.id.in_(ids))
+    return [[id_, _etiqueta_causa(tipo, rol, anio)] for id_, tipo, rol, anio in filas]
+
+def _contrapartes(ids=None):
+    filas = db.session.query(Contraparte.id, Contraparte.nombre)
+    if ids is None:
+        filas = filas.order_by(Contraparte.nombre, Contraparte.id)
+    else:
+        filas = filas.filter(Contraparte.id.in_(ids))
+    return [[id_, nombre] for id_, nombre in filas]
+
+# tabla -> (grupo del cache, proyección); la proyección con ``ids`` trae
+# solo esas filas, para marcar una elegida que no está entre las precargadas
+PROYECCIONES = {
+    "causas": ("causas", _causas),
+    "contrapartes": ("contrapartes", _contrapartes),
+}
+
+def _rol(texto):
+    """(número, año) si ``texto`` parece un rol: "C-1234", "1234" o "1234-2024"; si no, (None, None)."""
+    if " " in texto or not any(c.isdigit() for c in texto):
+        return None, None
+    numero, _, anio = texto.rpartition("-")
+    if any(c.isdigit() for c in numero) and len(anio) == 4 and anio.isdigit():
+        return numero, int(anio)
+    return texto, None
+
+def buscar_causas(texto, limite=10):
+    """Causas para el buscador de los formularios: por rol ("C-1234", "1234-2024") o por cliente (nombre o RUT)."""
+    texto = texto.strip()
+    resultados = {}
+    if texto:
+        numero, anio = _rol(texto)
+        if numero:
+            consulta = _consulta_causas().filter(
+                Causa.rol_numero >= numero, Causa.rol_numero < siguiente_prefijo(numero)
+            )
+            if anio:
+                consulta = consulta.filter(Causa.rol_anio == anio)
+            for f in consulta.order_by(Causa.id.desc()).limit(limite):
+                resultados[f.id] = f
+        por_cliente = filtrar_clientes(_consulta_causas().join(Cliente, Cliente.id == Causa.cliente_id), texto)
+        for f in por_cliente.order_by(Causa.id.desc()).limit(limite):
+            resultados.setdefault(f.id, f)
+    else:
+        resultados = {f.id: f for f in _consulta_causas().order_by(Causa.id.desc()).limit(limite)}
+    filas = sorted(resultados.values(), key=lambda f: -f.id)[:limite]
+    return [{"id": f.id, "etiqueta": _etiqueta_causa(f.tipo_causa, f.rol_numero, f.rol_anio)} for f in filas]
+
+_locales = {}
+_lock = threading.Lock()
+
+def opciones(tabla):
+    """Lista de [id, etiqueta] de ``tabla``, desde el cache compartido."""
+    grupo, proyeccion = PROYECCIONES[tabla]
+    return cache.obtener(f"opciones:{tabla}", (grupo,), proyeccion)
+
+def _html(tabla):
+    grupo, _ = PROYECCIONES[tabla]
+    sello = cache.sello(grupo)
+    # Por base de cache: en un mismo proceso puede haber más de una app
+    clave = (cache.ruta_db, tabla)
+    local = _locales.get(clave)
+    if local and local[0] == sello:
+        return local[1]
+
+    def calcular():
+        return "".join(
+            f'<option value="{id_}">{escape(etiqueta)}</option>' for id_, etiqueta in opciones(tabla)
+        )
+    html = cache.obtener(f"opciones_html:{tabla}", (grupo,), calcular, sello=sello)
+    with _lock:
+        _locales[clave] = (sello, html)
+    return html
+
+def opciones_html(tabla, seleccionado=None):
+    """<option> de ``tabla`` listos para el template, con ``seleccionado`` marcado.
+
+    Si ``seleccionado`` no está entre las precargadas se agrega al comienzo.
+    """
+    html = _html(tabla)
+    if seleccionado not in (None, ""):
+        marca = f'<option value="{escape(seleccionado)}">'
+        if marca in html:
+            html = html.replace(marca, marca[:-1] + " selected>", 1)
+        elif str(seleccionado).isdigit():
+            _, proyeccion = PROYECCIONES[tabla]
+            for id_, etiqueta in proyeccion([int(seleccionado)]):
+                html = f'<option value="{id_}" selected>{escape(etiqueta)}</option>' + html
+    return Markup(html)
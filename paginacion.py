@@ -0,0 +1,87 @@
+# paginacion.py
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
+
+class Pagina:
+    def __init__(self, items, siguiente=None, anterior=None):
+        self.items = items
+        self.siguiente = siguiente
+        self.anterior = anterior
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _a_texto(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+def _desde_texto(columna, valor):
+    tipo = columna.type.python_type
+    if tipo is datetime:
+        return datetime.fromisoformat(valor)
+    if tipo is date:
+        return date.fromisoformat(valor)
+    return tipo(valor)
+
+def _codificar(direccion, fila, columnas):
+    datos = {"d": direccion, "v": [_a_texto(getattr(fila, c.key)) for c in columnas]}
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip("=")
+
+def _decodificar(cursor, columnas):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return datos["d"], [_desde_texto(c, v) for c, v in zip(columnas, datos["v"])]
+    except (ValueError, KeyError, TypeError):
+        # Un cursor manipulado o viejo equivale a volver a la primera página
+        return None, None
+
+
+def paginar_keyset(query, columnas, cursor=None, limite=50, descendente=True):
+    """Pagina ``query`` ordenada por ``columnas`` sin usar OFFSET.
+
+    ``columnas`` debe identificar cada fila de forma única (por ejemplo
+    fecha + id) y estar cubierta por un índice compuesto; así cada página
+    cuesta lo mismo sin importar cuán atrás esté. El orden es descendente
+    salvo ``descendente=False``. Los cursores ``siguiente`` y ``anterior`` de
+    la página resultante se pasan de vuelta como ``cursor``.
+    """
+    direccion, valores = _decodificar(cursor, columnas) if cursor else (None, None)
+    clave = tuple_(*columnas)
+    orden_asc = [c.asc() for c in columnas]
+    orden_desc = [c.desc() for c in columnas]
+    adelante, atras = (orden_desc, orden_asc) if descendente else (orden_asc, orden_desc)
+
+    if direccion == "ant":
+        cota = clave > tuple_(*valores) if descendente else clave < tuple_(*valores)
+        query = query.filter(cota).order_by(*atras)
+    else:
+        if direccion == "sig":
+            cota = clave < tuple_(*valores) if descendente else clave > tuple_(*valores)
+            query = query.filter(cota)
+        query = query.order_by(*adelante)
+
+    filas = query.limit(limite + 1).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    if direccion == "ant":
+        filas.reverse()
+
+    if not filas:
+        return Pagina([])
+
+    siguiente = anterior = None
+    if hay_mas or direccion == "ant":
+        siguiente = _codificar("sig", filas[-1], columnas)
+    if direccion == "sig" or (direccion == "ant" and hay_mas):
+        anterior = _codificar("ant", filas[0], columnas)
+    return Pagina(filas, siguiente, anterior)
@@ -0,0 +1,222 @@
+# resumen.py
+#
+# Resumen mensual por cliente (tabla resumen_mensual): facturado, cobrado,
+# gastos y causas nuevas. Cada ruta que escribe honorarios, pagos, gastos o
+# causas suma su parte con sumar() en la misma transacción; reconstruir()
+# lo recalcula desde cero y verificar() compara ambos:
+#   flask --app main resumen-mensual [--verificar]
+
+from collections import defaultdict
+
+from sqlalchemy import delete, extract, func, insert, literal, select, text
+
+from database import db
+from models import Causa, Cliente, Gasto, Honorario, PagoCuota, ResumenMensual
+
+COLUMNAS = ["facturado", "cobrado", "gastos", "causas_nuevas"]
+
+# Gastos del estudio, que no son de ningún cliente
+SIN_CLIENTE = 0
+
+# modelo -> (columna del resumen, fecha, cliente, monto; sin monto se cuentan filas)
+ORIGENES = [
+    (Honorario, "facturado", Honorario.fecha_emision, Honorario.cliente_id, Honorario.monto_total),
+    (PagoCuota, "cobrado", PagoCuota.fecha_pago, PagoCuota.cliente_id, PagoCuota.monto_pagado),
+    (Gasto, "gastos", Gasto.fecha, None, Gasto.monto),
+    (Causa, "causas_nuevas", Causa.fecha_ingreso, Causa.cliente_id, None),
+]
+
+_SUMAR = text(
+    "INSERT INTO resumen_mensual (anio, mes, cliente_id, facturado, cobrado, gastos, causas_nuevas) "
+    "VALUES (:anio, :mes, :cliente_id, :facturado, :cobrado, :gastos, :causas_nuevas) "
+    "ON CONFLICT (anio, mes, cliente_id) DO UPDATE SET "
+    + ", ".join(f"{c} = resumen_mensual.{c} + excluded.{c}" for c in COLUMNAS)
+)
+
+def sumar(fecha, cliente_id=None, conexion=None, **montos):
+    """Suma ``montos`` (facturado=..., causas_nuevas=1...) al mes de ``fecha``."""
+    sumar_varios([(fecha, cliente_id, montos)], conexion)
+
+def sumar_varios(movimientos, conexion=None):
+    """Como sumar() para una lista de (fecha, cliente_id, montos), en un solo executemany."""
+    acumulado = defaultdict(lambda: dict.fromkeys(COLUMNAS, 0))
+    for fecha, cliente_id, montos in movimientos:
+        if fecha is None:
+            continue
+        fila = acumulado[(fecha.year, fecha.month, cliente_id or SIN_CLIENTE)]
+        for columna, monto in montos.items():
+            fila[columna] += monto or 0
+    if acumulado:
+        (conexion or db.session).execute(_SUMAR, [
+            {"anio": a, "mes": m, "cliente_id": c, **fila} for (a, m, c), fila in acumulado.items()
+        ])
+
+def _valor(fila, columna):
+    if columna is None:
+        return None
+    if isinstance(fila, dict):
+        return fila.get(columna.key)
+    return getattr(fila, columna.key)
+
+def contabilizar(modelo, filas, conexion=None):
+    """Suma filas recién insertadas de ``modelo`` (objetos o diccionarios, como en un insert en bloque)."""
+    for origen, columna, fecha, cliente, monto in ORIGENES:
+        if origen is modelo:
+            sumar_varios([
+                (_valor(f, fecha), _valor(f, cliente), {columna: _valor(f, monto) if monto is not None else 1})
+                for f in filas
+            ], conexion)
+
+def calcular(conexion=None):
+    """Resumen completo agrupando las tablas de origen: {(anio, mes, cliente_id): {columna: valor}}."""
+    conexion = conexion or db.session
+    resultado = defaultdict(lambda: dict.fromkeys(COLUMNAS, 0))
+    for _, columna, fecha, cliente, monto in ORIGENES:
+        anio, mes = extract("year", fecha), extract("month", fecha)
+        total = func.sum(monto) if monto is not None else func.count()
+        grupos = [anio, mes] + ([cliente] if cliente is not None else [])
+        consulta = (
+            select(anio, mes, cliente if cliente is not None else literal(SIN_CLIENTE), total)
+            .where(fecha.is_not(None))
+            .group_by(*grupos)
+        )
+        for a, m, c, valor in conexion.execute(consulta):
+            resultado[(int(a), int(m), c)][columna] = valor or 0
+    return resultado
+
+def reconstruir(conexion=None, lote=5000):
+    """Reemplaza el resumen por uno calculado desde cero. Devuelve cuántas filas quedaron."""
+    conexion = conexion or db.session
+    filas = [
+        {"anio": a, "mes": m, "cliente_id": c, **valores}
+        for (a, m, c), valores in calcular(conexion).items()
+    ]
+    conexion.execute(delete(ResumenMensual))
+    for i in range(0, len(filas), lote):
+        conexion.execute(insert(ResumenMensual), filas[i:i + lote])
+    return len(filas)
+
+def verificar(conexion=None, tolerancia=0.01):
+    """Diferencias entre el resumen guardado y el calculado desde cero.
+
+    Un pago abonado en partes de meses distintos queda en un solo mes al
+    recalcular (pagos_cuotas guarda solo la última fecha de pago), así que
+    puede aparecer aquí sin que el resumen esté mal.
+    """
+    conexion = conexion or db.session
+    esperado = calcular(conexion)
+    guardado = {
+        (f.anio, f.mes, f.cliente_id): {c: getattr(f, c) for c in COLUMNAS}
+        for f in conexion.execute(select(ResumenMensual.__table__))
+    }
+    diferencias = []
+    for clave in sorted(set(esperado) | set(guardado)):
+        a = esperado.get(clave, dict.fromkeys(COLUMNAS, 0))
+        b = guardado.get(clave, dict.fromkeys(COLUMNAS, 0))
+        for columna in COLUMNAS:
+            if abs((a[columna] or 0) - (b[columna] or 0)) > tolerancia:
+                diferencias.append((*clave, columna, b[columna], a[columna]))
+    return diferencias
+
+# ===================== REPORTES =====================
+
+def _series(desde, hasta, cliente_id=None):
+    """Totales mensuales de los años [desde, hasta] desde el resumen, como arreglos de 12 * años."""
+    import numpy as np
+
+    consulta = db.session.query(
+        ResumenMensual.anio, ResumenMensual.mes,
+        *[func.sum(getattr(ResumenMensual, c)) for c in COLUMNAS]
+    ).filter(ResumenMensual.anio >= desde, ResumenMensual.anio <= hasta)
+    if cliente_id:
+        consulta = consulta.filter(ResumenMensual.cliente_id == cliente_id)
+    filas = consulta.group_by(ResumenMensual.anio, ResumenMensual.mes).all()
+
+    series = {c: np.zeros(12 * (hasta - desde + 1)) for c in COLUMNAS}
+    if filas:
+        datos = np.array(filas, dtype=float)
+        posiciones = ((datos[:, 0] - desde) * 12 + datos[:, 1] - 1).astype(int)
+        for i, columna in enumerate(COLUMNAS):
+            series[columna][posiciones] = datos[:, i + 2]
+    return series
+
+def _lista(arreglo, decimales=2):
+    # NaN (sin base de comparación) como null en el JSON
+    import numpy as np
+    return [None if np.isnan(v) else round(float(v), decimales) for v in arreglo]
+
+def tendencias(desde, hasta, cliente_id=None):
+    """Series mensuales y anuales con margen, promedio móvil, variación interanual y tasa de cobro."""
+    import numpy as np
+
+    series = _series(desde, hasta, cliente_id)
+    cobrado, facturado = series["cobrado"], series["facturado"]
+    margen = cobrado - series["gastos"]
+
+    movil = np.full(cobrado.shape, np.nan)
+    if len(cobrado) >= 12:
+        movil[11:] = np.convolve(cobrado, np.ones(12) / 12, mode="valid")
+    interanual = np.full(cobrado.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        anterior = cobrado[:-12]
+        interanual[12:] = np.where(anterior > 0, cobrado[12:] / anterior - 1, np.nan)
+        tasa_cobro = np.where(
+            np.cumsum(facturado) > 0, np.cumsum(cobrado) / np.cumsum(facturado), np.nan
+        )
+
+    anios = list(range(desde, hasta + 1))
+    return {
+        "meses": [f"{a}-{m:02d}" for a in anios for m in range(1, 13)],
+        "mensual": {
+            **{c: _lista(v) for c, v in series.items()},
+            "causas_nuevas": series["causas_nuevas"].astype(int).tolist(),
+            "margen": _lista(margen),
+            "cobrado_promedio_12m": _lista(movil),
+            "cobrado_variacion_anual": _lista(interanual, 4),
+            "tasa_cobro_acumulada": _lista(tasa_cobro, 4),
+        },
+        "anual": {
+            "anios": anios,
+            **{c: _lista(v.reshape(-1, 12).sum(axis=1)) for c, v in series.items()},
+            "causas_nuevas": series["causas_nuevas"].reshape(-1, 12).sum(axis=1).astype(int).tolist(),
+            "margen": _lista(margen.reshape(-1, 12).sum(axis=1)),
+        },
+    }
+
+def rentabilidad_clientes(desde, hasta, limite=20):
+    """Clientes con más cobros en el período: facturado, cobrado, por cobrar, tasa de cobro y participación.
+
+    Los gastos no se registran por cliente, así que no se descuentan aquí.
+    """
+    import numpy as np
+
+    cobrado = func.sum(ResumenMensual.cobrado)
+    filas = db.session.query(
+        ResumenMensual.cliente_id, Cliente.nombre,
+        func.sum(ResumenMensual.facturado), cobrado, func.sum(ResumenMensual.causas_nuevas)
+    ).join(Cliente, Cliente.id == ResumenMensual.cliente_id).filter(
+        ResumenMensual.anio >= desde, ResumenMensual.anio <= hasta
+    ).group_by(ResumenMensual.cliente_id, Cliente.nombre).order_by(cobrado.desc()).limit(limite).all()
+    total_cobrado = db.session.query(func.coalesce(func.sum(ResumenMensual.cobrado), 0)).filter(
+        ResumenMensual.anio >= desde, ResumenMensual.anio <= hasta
+    ).scalar()
+    if not filas:
+        return []
+
+    montos = np.array([f[2:] for f in filas], dtype=float)
+    facturado, cobrado_cliente = montos[:, 0], montos[:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tasa = np.where(facturado > 0, cobrado_cliente / facturado, np.nan)
+        participacion = cobrado_cliente / total_cobrado if total_cobrado else np.full(len(filas), np.nan)
+    columnas = {
+        "facturado": _lista(facturado),
+        "cobrado": _lista(cobrado_cliente),
+        "por_cobrar": _lista(facturado - cobrado_cliente),
+        "tasa_cobro": _lista(tasa, 4),
+        "participacion": _lista(participacion, 4),
+        "causas_nuevas": [int(v) for v in montos[:, 2]],
+    }
+    return [
+        {"cliente_id": f[0], "nombre": f[1], **{c: v[i] for c, v in columnas.items()}}
+        for i, f in enumerate(filas)
+    ]
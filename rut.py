@@ -0,0 +1,33 @@
+# rut.py
+
+import re
+
+def digito_verificador(numero):
+    """Dígito verificador (módulo 11) del RUT ``numero``: '0'-'9' o 'K'."""
+    suma, factor = 0, 2
+    for cifra in reversed(str(int(numero))):
+        suma += int(cifra) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    return {11: "0", 10: "K"}.get(resto, str(resto))
+
+def normalizar_rut(texto):
+    """Separa un RUT escrito como sea ("12.345.678-5", "12345678-5", "123456785") en (número, dv).
+
+    Sin guion ni K final, hasta 8 dígitos se toman como número sin dígito
+    verificador (dv None) y 9 dígitos como número + dv. Devuelve
+    (None, None) si el texto no parece un RUT.
+    """
+    limpio = re.sub(r"[.\s]", "", texto or "").upper()
+    m = (
+        re.fullmatch(r"(\d{1,8})-([\dK]?)", limpio)
+        or re.fullmatch(r"(\d{1,8})(K)", limpio)
+        or re.fullmatch(r"(\d{1,8})()", limpio)
+        or re.fullmatch(r"(\d{8})(\d)", limpio)
+    )
+    if not m:
+        return None, None
+    return m.group(1).lstrip("0") or "0", m.group(2) or None
+
+def rut_valido(numero, dv):
+    return bool(numero) and numero.isdigit() and bool(dv) and digito_verificador(numero) == dv.upper()
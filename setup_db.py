@@ -1,10 +1,15 @@
 from main import create_app
 from database import db
+from migraciones import migrar
+import busqueda
 
 app = create_app()
 
 with app.app_context():
     db.drop_all()
     db.create_all()
+    # Las tablas recién creadas ya están al día; solo se registran las versiones
+    migrar(db.engine)
+    # El índice de búsqueda no es parte de los modelos: se vacía aparte
+    busqueda.reindexar()
     print("✅ Base de datos creada correctamente.")
-
@@ -1 +1,102 @@
-// JS Placeholder
\ No newline at end of file
+// Buscadores de los formularios: consultan la API mientras se escribe, en vez
+// de cargar todas las filas en un <select>.
+//   - Clientes (templates/_buscador_cliente.html): /api/clientes, el id
+//     elegido va en el input oculto.
+//   - Causas (templates/_buscador_causa.html): el <select> trae solo las más
+//     recientes; /api/causas busca las demás y la elegida se agrega al select.
+function buscador(caja, url, etiqueta, elegir) {
+  const texto = caja.querySelector('input[type="text"]');
+  const lista = caja.querySelector('.list-group');
+  let espera = null;
+  let pendiente = null;
+
+  function cerrar() {
+    lista.classList.add('d-none');
+    lista.innerHTML = '';
+  }
+
+  function mostrar(filas) {
+    lista.innerHTML = '';
+    filas.forEach(function (fila) {
+      const item = document.createElement('button');
+      item.type = 'button';
+      item.className = 'list-group-item list-group-item-action';
+      item.textContent = etiqueta(fila);
+      // mousedown llega antes que el blur del texto, que cierra la lista
+      item.addEventListener('mousedown', function (e) {
+        e.preventDefault();
+        elegir(fila, item.textContent);
+        texto.classList.remove('is-invalid');
+        cerrar();
+      });
+      lista.appendChild(item);
+    });
+    lista.classList.toggle('d-none', filas.length === 0);
+  }
+
+  texto.addEventListener('input', function () {
+    clearTimeout(espera);
+    const q = texto.value.trim();
+    if (!q) {
+      cerrar();
+      return;
+    }
+    espera = setTimeout(function () {
+      // Solo importa la respuesta a lo último que se escribió
+      if (pendiente) pendiente.abort();
+      pendiente = new AbortController();
+      fetch(url + '?q=' + encodeURIComponent(q), { signal: pendiente.signal })
+        .then(function (r) { return r.json(); })
+        .then(mostrar)
+        .catch(function () {});
+    }, 200);
+  });
+
+  texto.addEventListener('blur', cerrar);
+  return texto;
+}
+
+document.querySelectorAll('[data-buscador-clientes]').forEach(function (caja) {
+  const oculto = caja.querySelector('input[type="hidden"]');
+  const texto = buscador(
+    caja,
+    caja.dataset.buscadorClientes,
+    function (c) { return c.rut ? c.nombre + ' (' + c.rut + ')' : c.nombre; },
+    function (c, etiqueta) {
+      oculto.value = c.id;
+      texto.value = etiqueta;
+    }
+  );
+  texto.addEventListener('input', function () { oculto.value = ''; });
+
+  const formulario = caja.closest('form');
+  if (formulario && caja.hasAttribute('data-requerido')) {
+    formulario.addEventListener('submit', function (e) {
+      if (!oculto.value) {
+        e.preventDefault();
+        texto.classList.add('is-invalid');
+        texto.focus();
+      }
+    });
+  }
+});
+
+document.querySelectorAll('[data-buscador-causas]').forEach(function (caja) {
+  const select = caja.querySelector('select');
+  const texto = buscador(
+    caja,
+    caja.dataset.buscadorCausas,
+    function (c) { return c.etiqueta; },
+    function (c, etiqueta) {
+      let opcion = Array.from(select.options).find(function (o) { return o.value === String(c.id); });
+      if (!opcion) {
+        opcion = new Option(etiqueta, c.id);
+        // Después de la opción vacía ("Todas las causas"...), si la hay
+        const vacia = select.options.length && select.options[0].value === '';
+        select.add(opcion, vacia ? 1 : 0);
+      }
+      select.value = String(c.id);
+      texto.value = '';
+    }
+  );
+});
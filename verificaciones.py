@@ -0,0 +1,228 @@
+# verificaciones.py
+#
+# Verificaciones de rendimiento que deben mantenerse al modificar las vistas.
+# Uso: python verificaciones.py   (termina con código 1 si alguna falla)
+
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event, text
+
+from main import create_app
+from database import db
+from migraciones import migrar
+import busqueda
+from models import Cliente, Causa, Documento, FormatoLegal, Honorario, PagoCuota, Gasto
+
+@contextmanager
+def contar_consultas(engine):
+    """Acumula en una lista las sentencias SQL (con sus parámetros) ejecutadas dentro del bloque."""
+    consultas = []
+
+    def registrar(conn, cursor, sentencia, parametros, contexto, executemany):
+        consultas.append((sentencia, parametros))
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        yield consultas
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+def app_en_memoria():
+    temporal = tempfile.mkdtemp(prefix="judexia-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "TESTING": True,
+        "CACHE_DB": os.path.join(temporal, "cache.sqlite"),
+        "ALMACEN_DIR": os.path.join(temporal, "almacen"),
+        "METRICAS_DB": os.path.join(temporal, "metricas.sqlite"),
+    })
+    with app.app_context():
+        db.create_all()
+        migrar(db.engine)
+    return app
+
+def poblar_causas(n):
+    clientes = [Cliente(nombre=f"Cliente {i}", rut_num=str(10000000 + i), rut_dv="K") for i in range(n // 5 + 1)]
+    db.session.add_all(clientes)
+    db.session.flush()
+    for i in range(n):
+        causa = Causa(
+            tipo_causa="Civil",
+            procedimiento="Ordinario",
+            fecha_ingreso=date(2020, 1, 1) + timedelta(days=i),
+            cliente_id=clientes[i % len(clientes)].id,
+        )
+        causa.documentos = [
+            Documento(nombre_archivo=f"doc{j}.pdf", ruta=f"static/documentos/doc{j}.pdf") for j in range(2)
+        ]
+        db.session.add(causa)
+    db.session.commit()
+
+# ===================== VERIFICACIONES =====================
+
+def verificar_consultas_causas(tamanos=(5, 200)):
+    """/causas debe ejecutar la misma cantidad de consultas con 5 o 200 causas."""
+    conteos = {}
+    for n in tamanos:
+        app = app_en_memoria()
+        with app.app_context():
+            poblar_causas(n)
+            with contar_consultas(db.engine) as consultas:
+                respuesta = app.test_client().get("/causas")
+            assert respuesta.status_code == 200, f"/causas respondió {respuesta.status_code}"
+            conteos[n] = len(consultas)
+    assert len(set(conteos.values())) == 1, f"Consultas por cantidad de causas: {conteos}"
+    return conteos
+
+# "SCAN causas" recorre la tabla completa y "SCAN causas USING INDEX ..." recorre
+# un índice completo en orden; "SEARCH ..." usa el índice para acotar las filas.
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?( USING (?:COVERING )?INDEX \w+)?$")
+FILTRA = re.compile(r"\bWHERE\b")
+PAGINA = re.compile(r"\bLIMIT\b")
+
+def scans_completos(conn, sentencia, parametros):
+    """Tablas que SQLite recorrería completas al ejecutar ``sentencia``.
+
+    Una página sin filtros que recorre la tabla o un índice en el orden
+    pedido (sin ordenar en un B-tree temporal) se detiene en el LIMIT y no
+    cuenta; con filtros, recorrer un índice entero sí cuenta.
+    """
+    detalles = [fila[-1] for fila in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sentencia}", parametros)]
+    filtra = bool(FILTRA.search(sentencia))
+    if not filtra and PAGINA.search(sentencia) and not any("TEMP B-TREE" in d for d in detalles):
+        return []
+    return [
+        m.group(1) for d in detalles
+        if (m := SCAN.match(d)) and (filtra or not m.group(2))
+    ]
+
+def poblar_listados():
+    poblar_causas(60)
+    causa = Causa.query.first()
+    db.session.add(FormatoLegal(nombre_original="poder.docx", filename="poder.docx", causa_id=causa.id))
+    honorario = Honorario(cliente_id=causa.cliente_id, causa_id=causa.id, monto_total=300000,
+                          fecha_emision=date(2024, 1, 10))
+    db.session.add(honorario)
+    db.session.flush()
+    db.session.add(PagoCuota(honorario_id=honorario.id, cliente_id=causa.cliente_id, monto_pagado=100000,
+                             fecha_pago=date(2024, 2, 10), cuota_numero=1, total_cuotas=3, estado="pagado"))
+    db.session.add(Gasto(descripcion="Receptor", monto=25000, fecha=date(2024, 2, 1)))
+    db.session.commit()
+    return causa
+
+def verificar_planes_listados():
+    """Las consultas filtradas o paginadas de los listados no deben recorrer tablas completas.
+
+    Las que no filtran ni paginan (totales generales, opciones de los
+    selectores) leen la tabla entera por definición y no se revisan.
+    """
+    app = app_en_memoria()
+    app.config["CAUSAS_POR_PAGINA"] = 20
+    with app.app_context():
+        causa = poblar_listados()
+        cliente = causa.cliente_id
+        cliente_app = app.test_client()
+
+        primera = cliente_app.get("/causas").get_data(as_text=True)
+        cursor = re.search(r"cursor=([\w-]+)", primera)
+        urls = [
+            "/causas",
+            f"/causas?cliente_id={cliente}",
+            "/causas?tribunal=1%C2%BA%20Juzgado%20Civil&tipo_causa=Civil",
+            "/causas?rol=C-123",
+            f"/causas?cursor={cursor.group(1)}" if cursor else "/causas",
+            f"/formatos?causa_id={causa.id}",
+            "/clientes",
+            "/clientes?q=cliente%201",
+            "/clientes?q=1000001",
+            "/clientes?q=10.000.001-K",
+            "/api/clientes?q=cli",
+            "/facturacion",
+            f"/facturacion?cliente_id={cliente}",
+            f"/facturacion?cliente_id={cliente}&estado=pagado",
+            "/facturacion?estado=vencida",
+            f"/exportar_facturacion?cliente_id={cliente}&pagos=1&gastos=1",
+            "/exportar_facturacion?desde=2024-01-01&hasta=2024-12-31&pagos=1&gastos=1",
+        ]
+
+        revisadas = 0
+        problemas = []
+        for url in urls:
+            with contar_consultas(db.engine) as consultas:
+                respuesta = cliente_app.get(url)
+                respuesta.get_data()
+            assert respuesta.status_code == 200, f"{url} respondió {respuesta.status_code}"
+            with db.engine.connect() as conn:
+                for sentencia, parametros in consultas:
+                    if not sentencia.lstrip().upper().startswith("SELECT"):
+                        continue
+                    if not FILTRA.search(sentencia) and not PAGINA.search(sentencia):
+                        continue
+                    revisadas += 1
+                    tablas = scans_completos(conn, sentencia, parametros)
+                    if tablas:
+                        problemas.append(f"{url}: recorre {', '.join(tablas)} -> {' '.join(sentencia.split())[:160]}")
+    assert not problemas, "\n  " + "\n  ".join(problemas)
+    return {"consultas revisadas": revisadas}
+
+def verificar_latencia_busqueda(documentos=20000, consultas=50, limite_ms=50):
+    """La búsqueda de texto completo debe responder en decenas de ms con miles de documentos."""
+    azar = random.Random(0)
+    vocabulario = [f"termino{i}" for i in range(5000)] + [
+        "arriendo", "demanda", "pagaré", "contrato", "tribunal", "sentencia", "recurso", "notificación",
+    ]
+    app = app_en_memoria()
+    with app.app_context():
+        db.session.execute(
+            text(
+                "INSERT INTO busqueda_documentos (tipo, ref_id, causa_id, titulo, contenido) "
+                "VALUES (:tipo, :ref_id, :causa_id, :titulo, :contenido)"
+            ),
+            [
+                {
+                    "tipo": busqueda.DOCUMENTO,
+                    "ref_id": i,
+                    "causa_id": i % 500,
+                    "titulo": f"documento_{i}.pdf",
+                    "contenido": " ".join(azar.choices(vocabulario, k=300)),
+                }
+                for i in range(documentos)
+            ]
+        )
+        db.session.commit()
+
+        tiempos = []
+        for i in range(consultas):
+            palabras = azar.sample(vocabulario, 2)
+            causa = azar.randrange(500) if i % 2 else None
+            inicio = time.perf_counter()
+            busqueda.buscar(" ".join(palabras), causa_id=causa)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+    assert p95 < limite_ms, f"p95 de {p95:.1f} ms con {documentos} documentos"
+    return {"p50 ms": round(tiempos[len(tiempos) // 2], 1), "p95 ms": round(p95, 1)}
+
+VERIFICACIONES = [
+    verificar_consultas_causas,
+    verificar_planes_listados,
+    verificar_latencia_busqueda,
+]
+
+if __name__ == "__main__":
+    fallidas = 0
+    for verificacion in VERIFICACIONES:
+        try:
+            resultado = verificacion()
+            print(f"✅ {verificacion.__name__}: {resultado}")
+        except AssertionError as e:
+            fallidas += 1
+            print(f"❌ {verificacion.__name__}: {e}")
+    sys.exit(1 if fallidas else 0)